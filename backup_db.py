@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Резервное копирование БД: параллельные сжатые полные дампы, инкрементальные
+дельты свечей и проверка восстановления.
+
+Полная копия (full) - pg_dump в формате каталога (-Fd) в BACKUP_JOBS потоков
+со сжатием BACKUP_COMPRESS; восстанавливается pg_restore тоже параллельно.
+Дельта (delta) - только свечи, добавленные после предыдущей копии цепочки:
+для каждой OHLC таблицы, у которой в latest_candle есть свечи новее ее
+водяного знака, COPY ... TO STDOUT в <таблица>.csv.gz. Таблицы
+cryptocurrencies и latest_candle небольшие и копируются в дельту целиком:
+при восстановлении из них создаются OHLC таблицы новых монет, а монеты,
+удаленные после прошлой копии (retention.py, merge_duplicates.py), удаляются
+вместе с их OHLC таблицами.
+
+Каждая копия - каталог backups/<время>_<full|delta> с manifest.json:
+водяные знаки таблиц, количество строк из pg_stat_user_tables на момент
+копии и время каждого этапа. Проверка (verify) восстанавливает цепочку
+(полная копия + ее дельты) во временную БД и сравнивает COUNT(*) каждой
+таблицы с количеством строк из статистики исходной БД.
+
+pg_dump/pg_restore запускаются в контейнере BACKUP_CONTAINER, если он запущен,
+иначе локально.
+
+Пример: python3 backup_db.py auto --verify
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import psycopg2
+import psycopg2.extensions
+
+from log_config import get_logger
+from metrics import write_atomic
+from parser_ohlcv_db import DB_CONFIG, get_db_connection
+
+log = get_logger('backup')
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backups'))
+BACKUP_CONTAINER = os.environ.get('BACKUP_CONTAINER', 'crypto_postgres')
+BACKUP_JOBS = int(os.environ.get('BACKUP_JOBS', '4'))
+BACKUP_COMPRESS = os.environ.get('BACKUP_COMPRESS', '6')
+# Сколько полных копий (с их дельтами) хранить и как часто делать полную в режиме auto (дни)
+BACKUP_KEEP_FULL = int(os.environ.get('BACKUP_KEEP_FULL', '7'))
+BACKUP_FULL_EVERY_DAYS = int(os.environ.get('BACKUP_FULL_EVERY_DAYS', '7'))
+# Допустимое расхождение COUNT(*) со статистикой (доля; не меньше 2 строк)
+VERIFY_TOLERANCE = float(os.environ.get('VERIFY_TOLERANCE', '0.01'))
+
+MANIFEST = 'manifest.json'
+DUMP_SUBDIR = 'dump'
+# Таблицы, которые дельта копирует целиком (ключ для слияния при восстановлении)
+DELTA_FULL_TABLES = {'cryptocurrencies': 'id', 'latest_candle': 'crypto_id'}
+CANDLE_COLUMNS = '"timestamp", open, high, low, close, volume'
+
+
+class StageTimer:
+    """Время этапов копии: печатается по ходу и сохраняется в manifest.json"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        log.info(f"⏳ {name}...")
+        try:
+            yield
+        finally:
+            seconds = round(time.perf_counter() - started, 3)
+            self.stages[name] = seconds
+            log.info(f"   ✅ {name}: {seconds:.1f} с")
+
+    def report(self):
+        total = sum(self.stages.values())
+        log.info(f"⏱️ Этапы ({total:.1f} с):")
+        for name, seconds in self.stages.items():
+            log.info(f"   - {name}: {seconds:.1f} с ({seconds / total * 100 if total else 0:.0f}%)")
+
+
+def container_running():
+    """Запущен ли контейнер PostgreSQL (pg_dump берется из него)"""
+    if not BACKUP_CONTAINER or not shutil.which('docker'):
+        return False
+    result = subprocess.run(['docker', 'ps', '--format', '{{.Names}}'], capture_output=True, text=True)
+    return BACKUP_CONTAINER in result.stdout.split()
+
+
+def pg_command(program, args, use_container):
+    """Запускает pg_dump/pg_restore в контейнере или локально"""
+    if use_container:
+        command = ['docker', 'exec', BACKUP_CONTAINER, program, '-U', DB_CONFIG['user']] + args
+        env = None
+    else:
+        command = [program, '-h', DB_CONFIG['host'], '-p', str(DB_CONFIG['port']), '-U', DB_CONFIG['user']] + args
+        env = dict(os.environ, PGPASSWORD=DB_CONFIG['password'])
+    subprocess.run(command, check=True, env=env)
+
+
+def connect(database=None):
+    """Подключение к БД (по умолчанию основной)"""
+    conn = get_db_connection() if database is None else psycopg2.connect(**dict(DB_CONFIG, database=database))
+    if conn is None:
+        raise ConnectionError("не удалось подключиться к базе данных")
+    return conn
+
+
+def load_manifest(path):
+    with open(os.path.join(path, MANIFEST), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_backups():
+    """Копии по времени создания: [(каталог, manifest)]"""
+    backups = []
+    if os.path.isdir(BACKUP_DIR):
+        for name in sorted(os.listdir(BACKUP_DIR)):
+            path = os.path.join(BACKUP_DIR, name)
+            if os.path.exists(os.path.join(path, MANIFEST)):
+                backups.append((path, load_manifest(path)))
+    return backups
+
+
+def backup_chain(name=None):
+    """Полная копия и ее дельты до копии name (по умолчанию до последней)"""
+    backups = list_backups()
+    if name:
+        position = next((i for i, (path, _) in enumerate(backups) if os.path.basename(path) == name), None)
+        if position is None:
+            raise ValueError(f"копия {name} не найдена в {BACKUP_DIR}")
+        backups = backups[:position + 1]
+
+    chain = []
+    for path, manifest in reversed(backups):
+        chain.insert(0, (path, manifest))
+        if manifest['kind'] == 'full':
+            return chain
+    return []
+
+
+def table_stats(cursor):
+    """Количество строк таблиц из статистики (pg_stat_user_tables)"""
+    cursor.execute("SELECT relname, n_live_tup FROM pg_stat_user_tables WHERE schemaname = 'public'")
+    return {name: count for name, count in cursor.fetchall()}
+
+
+def candle_watermarks(cursor):
+    """Последняя свеча каждой OHLC таблицы по снимку latest_candle (один запрос)"""
+    cursor.execute("""
+        SELECT c.ohlc_table_name, lc."timestamp"
+        FROM latest_candle lc
+        JOIN cryptocurrencies c ON c.id = lc.crypto_id
+        WHERE c.ohlc_table_name IS NOT NULL
+    """)
+    return {name: timestamp for name, timestamp in cursor.fetchall()}
+
+
+def new_backup_dir(kind):
+    # Время в начале имени: копии сортируются по имени в порядке создания
+    path = os.path.join(BACKUP_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{kind}")
+    os.makedirs(path)
+    return path
+
+
+def run_full(timer):
+    """Полная копия: pg_dump -Fd -j, возвращает каталог копии"""
+    path = new_backup_dir('full')
+    dump_path = os.path.join(path, DUMP_SUBDIR)
+    use_container = container_running()
+
+    with timer.stage("Статистика и водяные знаки"):
+        conn = connect()
+        cursor = conn.cursor()
+        # Водяные знаки берутся до дампа: свечи, записанные во время дампа, повторит следующая дельта
+        watermarks = candle_watermarks(cursor)
+        stats = table_stats(cursor)
+        conn.rollback()
+        conn.close()
+
+    dump_args = ['-Fd', '-j', str(BACKUP_JOBS), '-Z', BACKUP_COMPRESS, '-d', DB_CONFIG['database']]
+    if use_container:
+        remote_path = f"/tmp/{os.path.basename(path)}"
+        with timer.stage(f"pg_dump в контейнере ({BACKUP_JOBS} потоков)"):
+            pg_command('pg_dump', dump_args + ['-f', remote_path], True)
+        with timer.stage("Копирование дампа из контейнера"):
+            subprocess.run(['docker', 'cp', f"{BACKUP_CONTAINER}:{remote_path}", dump_path], check=True)
+            subprocess.run(['docker', 'exec', BACKUP_CONTAINER, 'rm', '-rf', remote_path], check=True)
+    else:
+        with timer.stage(f"pg_dump ({BACKUP_JOBS} потоков)"):
+            pg_command('pg_dump', dump_args + ['-f', dump_path], False)
+
+    return path, {'kind': 'full', 'watermarks': watermarks, 'stats': stats}
+
+
+def copy_table_out(cursor, query, file_path):
+    """COPY запроса в CSV.gz, возвращает количество строк"""
+    with gzip.open(file_path, 'wb', compresslevel=6) as f:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+    return cursor.rowcount
+
+
+def run_delta(timer, chain):
+    """Дельта свечей после последней копии цепочки, возвращает каталог копии"""
+    parent_path, parent = chain[-1]
+    path = new_backup_dir('delta')
+    tables = {}
+
+    conn = connect()
+    try:
+        # Один снимок на всю дельту: водяные знаки и данные согласованы
+        conn.set_session(isolation_level=psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ, readonly=True)
+        cursor = conn.cursor()
+
+        with timer.stage("Статистика и водяные знаки"):
+            watermarks = candle_watermarks(cursor)
+            stats = table_stats(cursor)
+            changed = {name: timestamp for name, timestamp in watermarks.items()
+                       if timestamp > parent['watermarks'].get(name, -1)}
+
+        with timer.stage("Таблицы монет и снимок свечей"):
+            for table_name in DELTA_FULL_TABLES:
+                tables[table_name] = copy_table_out(cursor, f"SELECT * FROM {table_name}",
+                                                    os.path.join(path, f"{table_name}.csv.gz"))
+
+        with timer.stage(f"Свечи {len(changed)} таблиц"):
+            for table_name, watermark in changed.items():
+                cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+                if not cursor.fetchone()[0]:
+                    continue
+                query = cursor.mogrify(f"""
+                    SELECT {CANDLE_COLUMNS} FROM {table_name}
+                    WHERE "timestamp" > %s AND "timestamp" <= %s
+                """, (parent['watermarks'].get(table_name, -1), watermark)).decode('utf-8')
+                tables[table_name] = copy_table_out(cursor, query, os.path.join(path, f"{table_name}.csv.gz"))
+        conn.rollback()
+    finally:
+        conn.close()
+
+    # Водяные знаки цепочки: таблицы без новых свечей сохраняют прежние, удаленные таблицы выпадают
+    return path, {
+        'kind': 'delta',
+        'parent': os.path.basename(parent_path),
+        'watermarks': dict({name: timestamp for name, timestamp in parent['watermarks'].items() if name in stats},
+                           **watermarks),
+        'stats': stats,
+        'tables': tables
+    }
+
+
+def csv_header(file_path):
+    with gzip.open(file_path, 'rt', encoding='utf-8', newline='') as f:
+        return next(csv.reader(f))
+
+
+def merge_csv(cursor, table_name, file_path, key, update=False, delete_missing=False):
+    """Сливает CSV.gz с таблицей через временную таблицу, возвращает вставленные строки.
+
+    delete_missing - CSV содержит таблицу целиком: строки, которых в нем нет
+    (удалены ретеншном или объединением дубликатов), удаляются до вставки.
+    """
+    columns = csv_header(file_path)
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    cursor.execute(f"CREATE TEMP TABLE delta_rows (LIKE {table_name}) ON COMMIT DROP")
+    with gzip.open(file_path, 'rb') as f:
+        cursor.copy_expert(f"COPY delta_rows ({column_list}) FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+
+    if delete_missing:
+        cursor.execute(f"""
+            DELETE FROM {table_name} t
+            WHERE NOT EXISTS (SELECT 1 FROM delta_rows d WHERE d."{key}" = t."{key}")
+        """)
+
+    conflict = "DO NOTHING"
+    if update:
+        assignments = ', '.join(f'"{column}" = EXCLUDED."{column}"' for column in columns if column != key)
+        conflict = f"DO UPDATE SET {assignments}"
+    cursor.execute(f"""
+        INSERT INTO {table_name} ({column_list})
+        SELECT {column_list} FROM delta_rows
+        ON CONFLICT ("{key}") {conflict}
+    """)
+    inserted = cursor.rowcount
+    cursor.execute("DROP TABLE delta_rows")
+    return inserted
+
+
+def apply_delta(database, path, manifest):
+    """Применяет дельту к восстановленной БД: монеты, снимок свечей, затем свечи"""
+    conn = connect(database)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT ohlc_table_name FROM cryptocurrencies WHERE ohlc_table_name IS NOT NULL")
+        tables_before = {row[0] for row in cursor.fetchall()}
+
+        # Монеты до свечей: триггер на cryptocurrencies создает OHLC таблицы новых монет.
+        # Монеты, удаленные после прошлой копии, удаляются до обновления остальных (их slug
+        # мог перейти к оставшейся строке - uq_crypto_page_slug)
+        for table_name, key in DELTA_FULL_TABLES.items():
+            merge_csv(cursor, table_name, os.path.join(path, f"{table_name}.csv.gz"), key,
+                      update=True, delete_missing=True)
+
+        # OHLC таблицы удаленных монет (таблица, перешедшая к другой монете, остается)
+        cursor.execute("SELECT ohlc_table_name FROM cryptocurrencies WHERE ohlc_table_name IS NOT NULL")
+        for table_name in sorted(tables_before - {row[0] for row in cursor.fetchall()}):
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+
+        cursor.execute("""
+            SELECT setval(pg_get_serial_sequence('cryptocurrencies', 'id'), COALESCE(MAX(id), 1))
+            FROM cryptocurrencies
+        """)
+        for table_name in manifest['tables']:
+            if table_name not in DELTA_FULL_TABLES:
+                merge_csv(cursor, table_name, os.path.join(path, f"{table_name}.csv.gz"), 'timestamp')
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def recreate_database(database):
+    """Создает пустую БД (удаляя прежнюю) для восстановления"""
+    conn = connect()
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'DROP DATABASE IF EXISTS "{database}"')
+        cursor.execute(f'CREATE DATABASE "{database}"')
+    finally:
+        conn.close()
+
+
+def drop_database(database):
+    conn = connect()
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    try:
+        conn.cursor().execute(f'DROP DATABASE IF EXISTS "{database}"')
+    finally:
+        conn.close()
+
+
+def restore_chain(timer, chain, database):
+    """Восстанавливает полную копию и ее дельты в пустую БД database"""
+    full_path, _ = chain[0]
+    use_container = container_running()
+
+    with timer.stage(f"Создание БД {database}"):
+        recreate_database(database)
+
+    restore_args = ['-Fd', '-j', str(BACKUP_JOBS), '--no-owner', '-d', database]
+    if use_container:
+        remote_path = f"/tmp/restore_{os.path.basename(full_path)}"
+        with timer.stage("Копирование дампа в контейнер"):
+            subprocess.run(['docker', 'cp', os.path.join(full_path, DUMP_SUBDIR),
+                            f"{BACKUP_CONTAINER}:{remote_path}"], check=True)
+        try:
+            with timer.stage(f"pg_restore в контейнере ({BACKUP_JOBS} потоков)"):
+                pg_command('pg_restore', restore_args + [remote_path], True)
+        finally:
+            subprocess.run(['docker', 'exec', BACKUP_CONTAINER, 'rm', '-rf', remote_path])
+    else:
+        with timer.stage(f"pg_restore ({BACKUP_JOBS} потоков)"):
+            pg_command('pg_restore', restore_args + [os.path.join(full_path, DUMP_SUBDIR)], False)
+
+    for path, manifest in chain[1:]:
+        with timer.stage(f"Дельта {os.path.basename(path)}"):
+            apply_delta(database, path, manifest)
+
+
+def count_rows(cursor, table_names, batch=200):
+    """Точное количество строк таблиц (UNION ALL батчами)"""
+    counts = {}
+    cursor.execute("SELECT tablename FROM pg_tables WHERE schemaname = 'public'")
+    existing = {row[0] for row in cursor.fetchall()}
+    names = [name for name in table_names if name in existing]
+    for start in range(0, len(names), batch):
+        cursor.execute(' UNION ALL '.join(
+            cursor.mogrify(f"SELECT %s, COUNT(*) FROM {name}", (name,)).decode('utf-8')
+            for name in names[start:start + batch]
+        ))
+        counts.update(dict(cursor.fetchall()))
+    return counts
+
+
+def verify_restore(database, expected):
+    """Сравнивает COUNT(*) восстановленных таблиц со статистикой исходной БД, возвращает расхождения"""
+    conn = connect(database)
+    try:
+        actual = count_rows(conn.cursor(), sorted(expected))
+        conn.rollback()
+    finally:
+        conn.close()
+
+    problems = []
+    for name, expected_count in sorted(expected.items()):
+        if name not in actual:
+            problems.append((name, expected_count, None))
+        elif abs(actual[name] - expected_count) > max(2, expected_count * VERIFY_TOLERANCE):
+            problems.append((name, expected_count, actual[name]))
+    return problems, len(actual)
+
+
+def run_verify(timer, chain):
+    """Восстанавливает цепочку во временную БД, сверяет количество строк и удаляет БД"""
+    database = f"{DB_CONFIG['database']}_verify"
+    _, last = chain[-1]
+    expected = last['stats']
+    if len(chain) > 1:
+        # Дельты переносят только свечи, монеты и снимок свечей - остальные таблицы на момент полной копии
+        expected = {name: count for name, count in expected.items()
+                    if name in last['watermarks'] or name in DELTA_FULL_TABLES}
+    try:
+        restore_chain(timer, chain, database)
+        with timer.stage("Сверка количества строк со статистикой"):
+            problems, checked = verify_restore(database, expected)
+    finally:
+        with timer.stage(f"Удаление БД {database}"):
+            drop_database(database)
+
+    if problems:
+        log.error(f"❌ Проверка восстановления: расхождений {len(problems)} из {len(expected)} таблиц")
+        for name, expected, actual in problems[:20]:
+            log.info(f"   {name}: ожидалось ~{expected}, восстановлено {'нет таблицы' if actual is None else actual}")
+        return False
+    log.info(f"✅ Проверка восстановления: {checked} таблиц совпадают со статистикой")
+    return True
+
+
+def prune_backups():
+    """Удаляет полные копии (с их дельтами) сверх BACKUP_KEEP_FULL"""
+    backups = list_backups()
+    fulls = [path for path, manifest in backups if manifest['kind'] == 'full']
+    if len(fulls) <= BACKUP_KEEP_FULL:
+        return 0
+    keep_from = os.path.basename(fulls[-BACKUP_KEEP_FULL])
+    removed = 0
+    for path, _ in backups:
+        if os.path.basename(path) < keep_from:
+            shutil.rmtree(path)
+            removed += 1
+    return removed
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def run_backup(kind, verify=False):
+    """Создает копию (full, delta или auto), возвращает True при успехе"""
+    timer = StageTimer()
+    chain = backup_chain()
+    if kind == 'auto':
+        last_full = chain[0][1] if chain else None
+        due = (not last_full or datetime.fromisoformat(last_full['created_at'])
+               < datetime.now() - timedelta(days=BACKUP_FULL_EVERY_DAYS))
+        kind = 'full' if due else 'delta'
+    if kind == 'delta' and not chain:
+        log.info("ℹ️ Полной копии еще нет - создается полная")
+        kind = 'full'
+
+    log.info(f"🔄 Резервная копия: {kind}, каталог {BACKUP_DIR}")
+    created_at = datetime.now().isoformat()
+    path, manifest = run_full(timer) if kind == 'full' else run_delta(timer, chain)
+    manifest['created_at'] = created_at
+    manifest['size_bytes'] = directory_size(path)
+    manifest['stages'] = timer.stages
+    write_atomic(os.path.join(path, MANIFEST), json.dumps(manifest, ensure_ascii=False, indent=2))
+    log.info(f"✅ Копия {os.path.basename(path)}: {manifest['size_bytes'] / 1024 / 1024:.1f} MB")
+
+    ok = True
+    if verify:
+        ok = run_verify(timer, backup_chain(os.path.basename(path)))
+
+    with timer.stage("Очистка старых копий"):
+        removed = prune_backups()
+    if removed:
+        log.info(f"🧹 Удалено старых копий: {removed}")
+
+    timer.report()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервное копирование БД: полные дампы, дельты свечей, проверка")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for kind, description in (('full', "Полная копия (pg_dump -Fd -j)"), ('delta', "Дельта свечей"),
+                              ('auto', f"Полная раз в {BACKUP_FULL_EVERY_DAYS} дн., иначе дельта")):
+        sub = subparsers.add_parser(kind, help=description)
+        sub.add_argument('--verify', action='store_true', help="Проверить восстановление во временную БД")
+    restore = subparsers.add_parser('restore', help="Восстановить цепочку до копии в новую БД")
+    restore.add_argument('name', nargs='?', help="Каталог копии (по умолчанию последняя)")
+    restore.add_argument('--target', default=f"{DB_CONFIG['database']}_restore",
+                         help="БД для восстановления (будет пересоздана)")
+    verify = subparsers.add_parser('verify', help="Проверить восстановление копии во временную БД")
+    verify.add_argument('name', nargs='?', help="Каталог копии (по умолчанию последняя)")
+    subparsers.add_parser('list', help="Список копий")
+    args = parser.parse_args()
+
+    if args.command in ('full', 'delta', 'auto'):
+        if not run_backup(args.command, args.verify):
+            sys.exit(1)
+        return
+
+    if args.command == 'list':
+        for path, manifest in list_backups():
+            log.info(f"{os.path.basename(path):<28} {manifest['kind']:<6} "
+                     f"{manifest['size_bytes'] / 1024 / 1024:>9.1f} MB "
+                     f"{sum(manifest['stages'].values()):>8.1f} с  "
+                     f"{len(manifest.get('tables', manifest['stats']))} таблиц")
+        return
+
+    chain = backup_chain(args.name)
+    if not chain:
+        log.error("❌ Нет полной копии для восстановления")
+        sys.exit(1)
+    log.info(f"📦 Цепочка: {' -> '.join(os.path.basename(path) for path, _ in chain)}")
+
+    timer = StageTimer()
+    if args.command == 'verify':
+        ok = run_verify(timer, chain)
+    else:
+        restore_chain(timer, chain, args.target)
+        log.info(f"✅ Восстановлено в БД {args.target}")
+        ok = True
+    timer.report()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
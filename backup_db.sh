@@ -1,46 +1,26 @@
 #!/bin/bash
 
 # Скрипт резервного копирования БД
+# Полная копия раз в BACKUP_FULL_EVERY_DAYS дней (pg_dump -Fd -j со сжатием), в остальные дни -
+# дельта новых свечей. Подробности и восстановление: python3 backup_db.py --help
 
-# Настройки
-BACKUP_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)/backups"
-TIMESTAMP=$(date +%Y%m%d_%H%M%S)
-BACKUP_FILE="$BACKUP_DIR/crypto_db_backup_$TIMESTAMP.sql"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
 # Настройки БД
-DB_HOST="${DB_HOST:-localhost}"
-DB_PORT="${DB_PORT:-5432}"
-DB_NAME="${DB_NAME:-crypto_db}"
-DB_USER="${DB_USER:-crypto_user}"
-DB_PASSWORD="${DB_PASSWORD:-crypto_password}"
-
-# Создание директории
-mkdir -p "$BACKUP_DIR"
+export DB_HOST="${DB_HOST:-localhost}"
+export DB_PORT="${DB_PORT:-5432}"
+export DB_NAME="${DB_NAME:-crypto_db}"
+export DB_USER="${DB_USER:-crypto_user}"
+export DB_PASSWORD="${DB_PASSWORD:-crypto_password}"
+export BACKUP_DIR="${BACKUP_DIR:-$SCRIPT_DIR/backups}"
 
 echo "🔄 Создание резервной копии БД..."
-echo "   Файл: $BACKUP_FILE"
-
-# Создание дампа через Docker
-if docker ps | grep -q crypto_postgres; then
-    docker exec crypto_postgres pg_dump -U "$DB_USER" "$DB_NAME" > "$BACKUP_FILE"
-else
-    # Или напрямую, если PostgreSQL локальный
-    PGPASSWORD="$DB_PASSWORD" pg_dump -h "$DB_HOST" -p "$DB_PORT" -U "$DB_USER" "$DB_NAME" > "$BACKUP_FILE"
-fi
-
-if [ $? -eq 0 ]; then
-    SIZE=$(du -h "$BACKUP_FILE" | cut -f1)
-    echo "✅ Резервная копия создана успешно"
-    echo "   Размер: $SIZE"
-
-    # Удаление старых бэкапов (оставляем последние 7)
-    echo "🧹 Очистка старых бэкапов..."
-    cd "$BACKUP_DIR"
-    ls -t crypto_db_backup_*.sql | tail -n +8 | xargs -r rm -f
 
+# --verify: дополнительно восстановить копию во временную БД и сверить количество строк
+if python3 "$SCRIPT_DIR/backup_db.py" auto "$@"; then
     echo "📊 Текущие бэкапы:"
-    ls -lh crypto_db_backup_*.sql | head -7
+    python3 "$SCRIPT_DIR/backup_db.py" list
 else
     echo "❌ Ошибка создания резервной копии"
     exit 1
-fi
\ No newline at end of file
+fi
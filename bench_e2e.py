@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк парсера: локальная заглушка CoinGecko + локальный PostgreSQL.
+
+Запускает coingecko_stub.py, прогоняет parser_ohlcv_db.py целиком (отдельным
+процессом) и сохраняет в JSON: время работы, запросов к API на монету,
+количество 429, скорость записи свечей и пиковую память процесса парсера.
+С --baseline сравнивает результат с прошлым JSON и завершается с кодом 1,
+если скорость упала больше допустимого.
+
+Пример: python3 bench_e2e.py --coins 50 --latency-ms 50 --rate-limit 300 --output bench.json
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from coingecko_stub import API_PREFIX, PAGE_PATH, start_stub
+from log_config import get_logger
+from parser_ohlcv_db import get_db_connection
+from run_ledger import code_version
+
+log = get_logger('bench')
+
+PARSER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_ohlcv_db.py')
+
+
+def cleanup_bench_coins():
+    """Удаляет монеты заглушки из БД, чтобы каждый прогон записывал свечи заново"""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT id, ohlc_table_name FROM cryptocurrencies WHERE name LIKE %s", ('Bench Coin %',))
+        coins = cursor.fetchall()
+        for crypto_id, table_name in coins:
+            if table_name:
+                cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+            cursor.execute("DELETE FROM cryptocurrencies WHERE id = %s", (crypto_id,))
+        conn.commit()
+        return len(coins)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def run_parser_once(base_url, args, run_number):
+    """Один прогон парсера против заглушки, возвращает (секунды, вывод, пиковая память KB)"""
+    env = dict(os.environ)
+    env.update({
+        'COINGECKO_PAGE_URL': base_url + PAGE_PATH,
+        'COINGECKO_API_BASE': base_url + API_PREFIX,
+        'API_DELAY': str(args.api_delay),
+        'RATE_LIMIT_WAIT': str(args.rate_limit_wait),
+        'RUN_DEADLINE_SECONDS': str(24 * 60 * 60),
+        'RUN_JOURNAL_PATH': os.path.join(tempfile.gettempdir(), f'bench_journal_{os.getpid()}_{run_number}.jsonl'),
+        'HTTP_CASSETTE_MODE': 'off',
+        'PYTHONUNBUFFERED': '1'
+    })
+
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, PARSER_SCRIPT, '--sinks', args.sinks],
+                            env=env, capture_output=True, text=True)
+    seconds = time.perf_counter() - started
+
+    # ru_maxrss детей - максимум по всем завершенным дочерним процессам (в KB на Linux)
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if result.returncode != 0:
+        log.error(f"❌ Вывод парсера:\n{result.stdout[-2000:]}\n{result.stderr[-2000:]}")
+        raise RuntimeError(f"парсер завершился с кодом {result.returncode}")
+
+    return seconds, result.stdout, peak_rss
+
+
+def run_benchmark(args):
+    """Прогоняет парсер args.runs раз и собирает метрики"""
+    server, state, base_url = start_stub(args.coins, args.seed, args.latency_ms, args.rate_limit, args.error_rate)
+    log.info(f"🧪 Заглушка CoinGecko: {base_url}")
+
+    runs = []
+    try:
+        for run_number in range(1, args.runs + 1):
+            if not args.keep_data:
+                removed = cleanup_bench_coins()
+                if removed:
+                    log.info(f"🧹 Удалено монет прошлого прогона: {removed}")
+
+            counters_before = state.snapshot()
+            seconds, output, peak_rss = run_parser_once(base_url, args, run_number)
+            counters = {key: value - counters_before[key] for key, value in state.snapshot().items()}
+
+            candles_match = re.search(r'Новых OHLC записей: (\d+)', output)
+            candles = int(candles_match.group(1)) if candles_match else 0
+            ohlc_coins_match = re.search(r'Получено OHLCV для (\d+) монет', output)
+            ohlc_coins = int(ohlc_coins_match.group(1)) if ohlc_coins_match else 0
+
+            api_calls = counters['search'] + counters['ohlc'] + counters['market_chart'] + counters['rate_limited']
+            run = {
+                'run': run_number,
+                'wall_seconds': round(seconds, 3),
+                'coins_with_ohlc': ohlc_coins,
+                'api_calls': api_calls,
+                'api_calls_per_coin': round(api_calls / ohlc_coins, 2) if ohlc_coins else None,
+                'rate_limited': counters['rate_limited'],
+                'candles_ingested': candles,
+                'candles_per_second': round(candles / seconds, 1) if seconds else 0,
+                'peak_rss_kb': peak_rss
+            }
+            runs.append(run)
+            log.info(f"⏱️ Прогон {run_number}: {run['wall_seconds']} с, свечей {candles} "
+                     f"({run['candles_per_second']}/с), 429: {run['rate_limited']}, "
+                     f"запросов на монету: {run['api_calls_per_coin']}")
+    finally:
+        server.shutdown()
+
+    return {
+        'benchmark': 'e2e',
+        'revision': code_version(),
+        'started_at': datetime.now().isoformat(),
+        'config': {
+            'coins': args.coins,
+            'seed': args.seed,
+            'latency_ms': args.latency_ms,
+            'rate_limit': args.rate_limit,
+            'error_rate': args.error_rate,
+            'api_delay': args.api_delay,
+            'rate_limit_wait': args.rate_limit_wait,
+            'sinks': args.sinks
+        },
+        'runs': runs,
+        'summary': {
+            key: statistics.median(run[key] for run in runs)
+            for key in ['wall_seconds', 'candles_per_second', 'rate_limited', 'peak_rss_kb']
+        }
+    }
+
+
+def compare_with_baseline(report, baseline_path, tolerance):
+    """Сравнивает медианы с прошлым результатом, возвращает True если регрессии нет"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    current = report['summary']['candles_per_second']
+    previous = baseline['summary']['candles_per_second']
+    if not previous:
+        return True
+
+    change = current / previous - 1
+    log.info(f"📈 Свечей/с: {current} против {previous} в {baseline.get('revision')} ({change:+.1%})")
+
+    if change < -tolerance:
+        log.error(f"❌ Регрессия скорости больше {tolerance:.0%}")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк парсера с заглушкой CoinGecko")
+    parser.add_argument('--coins', type=int, default=50, help="Монет на странице листинга")
+    parser.add_argument('--seed', type=int, default=1, help="Seed генерации монет")
+    parser.add_argument('--latency-ms', type=int, default=0, help="Задержка ответа заглушки")
+    parser.add_argument('--rate-limit', type=int, default=0, help="Лимит запросов к API в минуту (0 - без лимита)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля случайных 429")
+    parser.add_argument('--api-delay', type=float, default=0.0, help="API_DELAY парсера (пауза между монетами)")
+    parser.add_argument('--rate-limit-wait', type=float, default=1.0, help="RATE_LIMIT_WAIT парсера после 429")
+    parser.add_argument('--sinks', default='db', help="Приемники данных парсера")
+    parser.add_argument('--runs', type=int, default=1, help="Количество прогонов (в итоге - медиана)")
+    parser.add_argument('--keep-data', action='store_true', help="Не удалять монеты заглушки перед прогоном")
+    parser.add_argument('--output', help="Сохранить результат в JSON файл")
+    parser.add_argument('--baseline', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Допустимое падение скорости (доля)")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        log.info(f"💾 Результат сохранен: {args.output}")
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.baseline and not compare_with_baseline(report, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
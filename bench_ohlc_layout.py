@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Замер формата OHLC таблиц: байт на свечу, размер индексов и скорость вставки
+для старого (id + timestamp/datetime/date/time + DECIMAL) и компактного формата.
+
+Таблицы создаются во временной схеме и удаляются после замера.
+С флагом --live дополнительно показывает фактические размеры OHLC таблиц в БД.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+
+from log_config import get_logger
+from parser_ohlcv_db import get_db_connection
+
+log = get_logger('bench')
+
+BENCH_SCHEMA = 'ohlc_layout_bench'
+CANDLE_INTERVAL_MS = 4 * 60 * 60 * 1000
+
+LEGACY_DDL = """
+    CREATE TABLE {schema}.legacy (
+        id SERIAL PRIMARY KEY,
+        "timestamp" BIGINT NOT NULL UNIQUE,
+        datetime TIMESTAMP NOT NULL,
+        date DATE NOT NULL,
+        time TIME NOT NULL,
+        open DECIMAL(20, 8) NOT NULL,
+        high DECIMAL(20, 8) NOT NULL,
+        low DECIMAL(20, 8) NOT NULL,
+        close DECIMAL(20, 8) NOT NULL,
+        volume DECIMAL(20, 8) DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX ON {schema}.legacy("timestamp");
+    CREATE INDEX ON {schema}.legacy(datetime);
+    CREATE INDEX ON {schema}.legacy(date);
+"""
+
+COMPACT_DDL = """
+    CREATE TABLE {schema}.compact (
+        "timestamp" BIGINT PRIMARY KEY,
+        open DOUBLE PRECISION NOT NULL,
+        high DOUBLE PRECISION NOT NULL,
+        low DOUBLE PRECISION NOT NULL,
+        close DOUBLE PRECISION NOT NULL,
+        volume DOUBLE PRECISION
+    );
+"""
+
+
+def generate_candles(count):
+    """Генерирует синтетические 4-часовые свечи с ценами новых монет"""
+    candles = []
+    price = random.uniform(0.000001, 2.0)
+    start = int(time.time() * 1000) - count * CANDLE_INTERVAL_MS
+
+    for i in range(count):
+        open_price = price
+        close_price = max(price * random.uniform(0.9, 1.1), 1e-12)
+        candles.append((
+            start + i * CANDLE_INTERVAL_MS,
+            open_price,
+            max(open_price, close_price) * random.uniform(1.0, 1.05),
+            min(open_price, close_price) * random.uniform(0.95, 1.0),
+            close_price
+        ))
+        price = close_price
+
+    return candles
+
+
+def legacy_row(candle):
+    """Строка в старом формате: время хранится четыре раза"""
+    dt = datetime.fromtimestamp(candle[0] / 1000)
+    return (candle[0], dt, dt.date(), dt.time()) + candle[1:]
+
+
+def measure_insert(conn, cursor, query, rows, batch_size):
+    """Вставляет строки батчами как парсер (executemany + commit), возвращает секунды"""
+    started = time.perf_counter()
+    for i in range(0, len(rows), batch_size):
+        cursor.executemany(query, rows[i:i + batch_size])
+        conn.commit()
+    return time.perf_counter() - started
+
+
+def measure_size(cursor, table):
+    """Возвращает размеры таблицы и индексов после VACUUM"""
+    cursor.execute(f"""
+        SELECT pg_relation_size('{table}'), pg_indexes_size('{table}'), COUNT(*)
+        FROM {table}
+    """)
+    heap, indexes, rows = cursor.fetchone()
+    return {
+        'rows': rows,
+        'heap_bytes': heap,
+        'index_bytes': indexes,
+        'bytes_per_candle': round((heap + indexes) / rows, 1) if rows else 0
+    }
+
+
+def run_benchmark(candles_count, batch_size):
+    """Замеряет оба формата на одинаковых данных"""
+    conn = get_db_connection()
+    if not conn:
+        log.error("❌ Не удалось подключиться к базе данных")
+        return None
+
+    cursor = conn.cursor()
+    candles = generate_candles(candles_count)
+    report = {}
+
+    try:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        cursor.execute(LEGACY_DDL.format(schema=BENCH_SCHEMA))
+        cursor.execute(COMPACT_DDL.format(schema=BENCH_SCHEMA))
+        conn.commit()
+
+        layouts = [
+            ('legacy', f"""
+                INSERT INTO {BENCH_SCHEMA}.legacy
+                ("timestamp", datetime, date, time, open, high, low, close)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT ("timestamp") DO NOTHING
+            """, [legacy_row(candle) for candle in candles]),
+            ('compact', f"""
+                INSERT INTO {BENCH_SCHEMA}.compact
+                ("timestamp", open, high, low, close)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT ("timestamp") DO NOTHING
+            """, candles),
+        ]
+
+        for name, query, rows in layouts:
+            seconds = measure_insert(conn, cursor, query, rows, batch_size)
+
+            conn.autocommit = True
+            cursor.execute(f"VACUUM ANALYZE {BENCH_SCHEMA}.{name}")
+            conn.autocommit = False
+
+            report[name] = measure_size(cursor, f"{BENCH_SCHEMA}.{name}")
+            report[name]['insert_seconds'] = round(seconds, 3)
+            report[name]['candles_per_second'] = round(len(rows) / seconds, 1) if seconds else 0
+
+        return report
+
+    finally:
+        conn.rollback()
+        cursor.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+
+def live_report():
+    """Фактический размер OHLC таблиц в БД по форматам"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT
+                CASE WHEN EXISTS (
+                    SELECT 1 FROM information_schema.columns col
+                    WHERE col.table_schema = 'public'
+                    AND col.table_name = c.ohlc_table_name
+                    AND col.column_name = 'datetime'
+                ) THEN 'legacy' ELSE 'compact' END AS layout,
+                COUNT(*),
+                SUM(pg_relation_size(to_regclass(c.ohlc_table_name))),
+                SUM(pg_indexes_size(to_regclass(c.ohlc_table_name))),
+                SUM(s.n_live_tup)
+            FROM cryptocurrencies c
+            JOIN pg_stat_user_tables s ON s.relname = c.ohlc_table_name
+            GROUP BY layout
+        """)
+        return {
+            layout: {
+                'tables': tables,
+                'heap_bytes': heap,
+                'index_bytes': indexes,
+                'rows': rows,
+                'bytes_per_candle': round((heap + indexes) / rows, 1) if rows else 0
+            }
+            for layout, tables, heap, indexes, rows in cursor.fetchall()
+        }
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def print_report(report):
+    """Печатает сравнение форматов"""
+    log.info(f"{'Формат':<10} {'Свечей':>8} {'Таблица':>10} {'Индексы':>10} {'Байт/свеча':>11} {'Свечей/с':>10}")
+    log.info("-" * 64)
+    for name, stats in report.items():
+        log.info(f"{name:<10} {stats['rows']:>8} {stats['heap_bytes']:>10} {stats['index_bytes']:>10} "
+                 f"{stats['bytes_per_candle']:>11} {stats.get('candles_per_second', '-'):>10}")
+
+    if 'legacy' in report and 'compact' in report and report['legacy']['bytes_per_candle']:
+        ratio = report['compact']['bytes_per_candle'] / report['legacy']['bytes_per_candle']
+        log.info(f"📉 Компактный формат: {ratio:.0%} от размера старого на свечу")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер форматов OHLC таблиц")
+    parser.add_argument('--candles', type=int, default=180 * 50, help="Количество синтетических свечей")
+    parser.add_argument('--batch-size', type=int, default=180, help="Свечей в одной транзакции (как у парсера)")
+    parser.add_argument('--live', action='store_true', help="Показать также размеры реальных OHLC таблиц")
+    parser.add_argument('--json', help="Сохранить результат в JSON файл")
+    args = parser.parse_args()
+
+    log.info(f"⏱️ Замер форматов OHLC: {args.candles} свечей, батч {args.batch_size}")
+    result = {'synthetic': run_benchmark(args.candles, args.batch_size)}
+    if result['synthetic']:
+        print_report(result['synthetic'])
+
+    if args.live:
+        result['live'] = live_report()
+        if result['live']:
+            log.info("📊 OHLC таблицы в БД:")
+            print_report(result['live'])
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        log.info(f"💾 Результат сохранен: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Запись свечей в сжатые колоночные файлы (Parquet, либо CSV.gz если pyarrow не установлен)
+"""
+import csv
+import gzip
+import os
+from decimal import Decimal
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+def candle_file_extension():
+    """Возвращает расширение файлов с учетом доступного формата"""
+    return '.parquet' if pq else '.csv.gz'
+
+
+def plain_value(value):
+    """Приводит DECIMAL из БД к float для колоночных форматов"""
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+# Типы колонок свечей для Parquet: батч целиком из NULL не должен менять схему файла
+CANDLE_COLUMN_TYPES = {
+    'timestamp': 'int64', 'open': 'float64', 'high': 'float64',
+    'low': 'float64', 'close': 'float64', 'volume': 'float64'
+}
+
+
+class CandleFileWriter:
+    """Потоковая запись свечей батчами: в памяти только текущий батч.
+
+    Пишет во временный файл, итоговое имя появляется в close().
+    """
+
+    def __init__(self, path_base, columns):
+        self.path = path_base + candle_file_extension()
+        self.tmp_path = self.path + '.tmp'
+        self.columns = list(columns)
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        if pq:
+            self.writer = None
+            self.schema = None
+            if all(name in CANDLE_COLUMN_TYPES for name in self.columns):
+                self.schema = pa.schema([(name, CANDLE_COLUMN_TYPES[name]) for name in self.columns])
+        else:
+            self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8', newline='')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.columns)
+
+    def write_rows(self, rows):
+        if not rows:
+            return
+        if pq:
+            table = pa.Table.from_pydict({
+                name: [plain_value(row[i]) for row in rows]
+                for i, name in enumerate(self.columns)
+            }, schema=self.schema)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.tmp_path, table.schema, compression='zstd')
+            self.writer.write_table(table)
+        else:
+            for row in rows:
+                self.writer.writerow([plain_value(value) for value in row])
+        self.rows_written += len(rows)
+
+    def close(self):
+        """Завершает файл и возвращает путь (None, если строк не было)"""
+        if pq:
+            if self.writer is not None:
+                self.writer.close()
+        else:
+            self.file.close()
+
+        if not self.rows_written:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+            return None
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        """Удаляет незавершенный файл"""
+        try:
+            if pq:
+                if self.writer is not None:
+                    self.writer.close()
+            else:
+                self.file.close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
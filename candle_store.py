@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Локальное хранилище свечей без PostgreSQL: бинарный файл фиксированной ширины на монету.
+
+Файл <SYMBOL>_<slug или ID CoinGecko>.candles (без них - <SYMBOL>_<added>) - заголовок 64 байта и записи по 48 байт:
+timestamp (int64, мс), open, high, low, close, volume (float64, NaN - нет данных).
+Свечи только дописываются в конец по возрастанию времени, поэтому запись O(1)
+и не зависит от размера файла.
+
+Параллельное чтение: писатель сначала дописывает записи, затем обновляет
+счетчик записей в заголовке. Читатель видит только count записей и не
+замечает недописанный хвост; после падения писатель обрезает хвост по счетчику.
+Чтение через mmap: с numpy - массив-представление без копирования, без numpy -
+memoryview и struct.
+
+Пример: python3 candle_store.py --from-history logs/history --dir logs/candles
+"""
+import argparse
+import fcntl
+import glob
+import json
+import math
+import mmap
+import os
+import re
+import struct
+from datetime import datetime
+
+from coin_identity import candle_key
+from log_config import get_logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = get_logger('candles')
+
+CANDLE_STORE_DIR = os.environ.get('CANDLE_STORE_DIR', '')
+
+MAGIC = b'PCS1'
+HEADER_SIZE = 64
+# magic, версия, размер записи, количество записей, ключ монеты (до 48 байт)
+HEADER_FORMAT = '<4sHHQ48s'
+COUNT_OFFSET = 8
+RECORD_FORMAT = '<qddddd'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+FILE_EXTENSION = '.candles'
+
+CANDLE_DTYPE = np.dtype([
+    ('timestamp', '<i8'), ('open', '<f8'), ('high', '<f8'),
+    ('low', '<f8'), ('close', '<f8'), ('volume', '<f8')
+]) if np else None
+
+
+def candle_path(directory, key):
+    """Файл монеты по ключу SYMBOL|<slug> (coin_identity.candle_key)"""
+    return os.path.join(directory, re.sub(r'[^A-Za-z0-9_.-]', '_', key.replace('|', '_')) + FILE_EXTENSION)
+
+
+def pack_candle(candle):
+    """Свеча (словарь парсера) в запись файла"""
+    volume = candle.get('volume')
+    return struct.pack(RECORD_FORMAT, int(candle['timestamp']), candle['open'], candle['high'],
+                       candle['low'], candle['close'], math.nan if volume is None else volume)
+
+
+class CandleWriter:
+    """Единственный писатель файла монеты (эксклюзивная блокировка flock)"""
+
+    def __init__(self, path, key):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+        if os.fstat(self.fd).st_size < HEADER_SIZE:
+            os.pwrite(self.fd, struct.pack(HEADER_FORMAT, MAGIC, 1, RECORD_SIZE, 0,
+                                           key.encode('utf-8')[:48]), 0)
+            self.count = 0
+        else:
+            magic, _, record_size, self.count, _ = struct.unpack(HEADER_FORMAT, os.pread(self.fd, HEADER_SIZE, 0))
+            if magic != MAGIC or record_size != RECORD_SIZE:
+                os.close(self.fd)
+                raise ValueError(f"{path}: неизвестный формат файла свечей")
+            # Хвост, дописанный до падения, но не учтенный в счетчике
+            os.ftruncate(self.fd, HEADER_SIZE + self.count * RECORD_SIZE)
+
+        self.last_timestamp = None
+        if self.count:
+            self.last_timestamp = struct.unpack_from(
+                '<q', os.pread(self.fd, 8, HEADER_SIZE + (self.count - 1) * RECORD_SIZE))[0]
+
+    def append(self, candles):
+        """Дописывает свечи новее последней записанной, возвращает количество"""
+        rows = []
+        last = self.last_timestamp
+        for candle in sorted(candles, key=lambda candle: candle['timestamp']):
+            if last is None or candle['timestamp'] > last:
+                rows.append(pack_candle(candle))
+                last = candle['timestamp']
+        if not rows:
+            return 0
+
+        os.pwrite(self.fd, b''.join(rows), HEADER_SIZE + self.count * RECORD_SIZE)
+        os.fsync(self.fd)
+        # Счетчик обновляется после данных: читатель не увидит записи раньше, чем они дописаны
+        self.count += len(rows)
+        os.pwrite(self.fd, struct.pack('<Q', self.count), COUNT_OFFSET)
+        self.last_timestamp = last
+        return len(rows)
+
+    def close(self):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+
+
+class CandleReader:
+    """Чтение файла монеты через mmap (без блокировок, параллельно с писателем)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, record_size, count, key = struct.unpack_from(HEADER_FORMAT, self.mm, 0)
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            raise ValueError(f"{path}: неизвестный формат файла свечей")
+        self.key = key.rstrip(b'\0').decode('utf-8')
+        # Записи, дописанные после открытия, в отображение не попадают
+        self.count = min(count, (len(self.mm) - HEADER_SIZE) // RECORD_SIZE)
+
+    def array(self):
+        """numpy массив-представление записей (без копирования)"""
+        if np is None:
+            raise RuntimeError("для array() нужен numpy")
+        return np.frombuffer(self.mm, dtype=CANDLE_DTYPE, count=self.count, offset=HEADER_SIZE)
+
+    def rows(self, since_ms=None):
+        """Записи (timestamp, open, high, low, close, volume) без numpy"""
+        view = memoryview(self.mm)[HEADER_SIZE:HEADER_SIZE + self.count * RECORD_SIZE]
+        start = self.find(since_ms) if since_ms else 0
+        return struct.iter_unpack(RECORD_FORMAT, view[start * RECORD_SIZE:])
+
+    def find(self, timestamp):
+        """Номер первой записи не раньше timestamp (бинарный поиск по файлу)"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from('<q', self.mm, HEADER_SIZE + middle * RECORD_SIZE)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def close(self):
+        self.mm.close()
+
+
+def store_candles(directory, key, candles):
+    """Дописывает свечи монеты в ее файл, возвращает количество новых"""
+    writer = CandleWriter(candle_path(directory, key), key)
+    try:
+        return writer.append(candles)
+    finally:
+        writer.close()
+
+
+def convert_history(directory, history_dir):
+    """Переносит свечи из сжатой истории (history_store.py)"""
+    from history_store import expand_candle, iter_records
+
+    added = 0
+    for record in iter_records(history_dir):
+        if record['type'] == 'candles':
+            # Ключ записи - уже ключ парсера (candle_key); в старых сегментах SYMBOL|added,
+            # там дата заменяется ID CoinGecko записи
+            key = record['key']
+            symbol, added_key = key.split('|', 1)
+            if re.fullmatch(r'\d{4}-\d{2}-\d{2}', added_key):
+                key = candle_key({'symbol': symbol, 'coin_id': record.get('coin_id'), 'added': added_key})
+            added += store_candles(directory, key, [expand_candle(row) for row in record['candles']])
+    return added
+
+
+def convert_json_files(directory, paths):
+    """Переносит свечи из JSON файлов last_50_cryptos*.json (в порядке времени)"""
+    added = 0
+    for path in sorted(paths):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for crypto in data.get('cryptos', []):
+            if crypto.get('ohlcv'):
+                added += store_candles(directory, candle_key(crypto), crypto['ohlcv'])
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бинарное хранилище свечей с доступом через mmap")
+    parser.add_argument('--dir', default=CANDLE_STORE_DIR or './logs/candles', help="Каталог файлов свечей")
+    parser.add_argument('--from-history', metavar='DIR', help="Перенести свечи из истории logs/history")
+    parser.add_argument('--from-json', nargs='+', metavar='FILE', help="Перенести свечи из JSON файлов")
+    parser.add_argument('--show', metavar='SYMBOL', help="Показать последние свечи монеты")
+    parser.add_argument('--last', type=int, default=12, help="Сколько свечей показать")
+    args = parser.parse_args()
+
+    if args.from_history:
+        log.info(f"📦 Из истории добавлено свечей: {convert_history(args.dir, args.from_history)}")
+    if args.from_json:
+        log.info(f"📦 Из JSON файлов добавлено свечей: {convert_json_files(args.dir, args.from_json)}")
+
+    paths = sorted(glob.glob(os.path.join(args.dir, '*' + FILE_EXTENSION)))
+    if args.show:
+        prefix = re.sub(r'[^A-Za-z0-9_.-]', '_', args.show.upper()) + '_'
+        for path in paths:
+            if os.path.basename(path).upper().startswith(prefix):
+                reader = CandleReader(path)
+                print(f"\n🪙 {reader.key}: свечей {reader.count}")
+                for row in list(reader.rows())[-args.last:]:
+                    print(f"   {datetime.fromtimestamp(row[0] / 1000).strftime('%Y-%m-%d %H:%M')}  "
+                          f"O: {row[1]:.8g}  H: {row[2]:.8g}  L: {row[3]:.8g}  C: {row[4]:.8g}")
+                reader.close()
+        return
+
+    total_size = sum(os.path.getsize(path) for path in paths)
+    total_candles = sum(max(os.path.getsize(path) - HEADER_SIZE, 0) // RECORD_SIZE for path in paths)
+    log.info(f"📚 Хранилище {args.dir}: монет {len(paths)}, свечей {total_candles}, "
+             f"{total_size / 1024 / 1024:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Устойчивая идентификация монет листинга.
+
+Дата добавления (added_date) вычисляется из относительного текста страницы
+("около 1 дня", "3 дн") и между запусками сдвигается на день-два, поэтому
+ключ (symbol, added_date) не годится для поиска уже известной монеты.
+Монета листинга сопоставляется со строкой cryptocurrencies по порядку:
+1. slug страницы монеты (/coins/<slug>) - page_slug;
+2. ID CoinGecko при совпадении символа;
+3. символ и дата добавления в пределах ADDED_DATE_TOLERANCE_DAYS, если
+   slug строки не известен или совпадает.
+Найденная строка задает монете каноническую дату добавления и ID CoinGecko.
+"""
+import os
+import re
+from datetime import datetime, timedelta
+
+ADDED_DATE_TOLERANCE_DAYS = int(os.environ.get('ADDED_DATE_TOLERANCE_DAYS', '2'))
+
+IDENTITY_COLUMNS = "id, symbol, added_date, page_slug, coin_gecko_id, ohlc_table_name"
+
+
+def page_slug(cell_html):
+    """slug монеты из ссылки на ее страницу (/ru/coins/<slug>)"""
+    match = re.search(r'href="[^"]*/coins/([^"/?#]+)', cell_html)
+    return match.group(1) if match else None
+
+
+def parse_date(value):
+    """Дата из 'YYYY-MM-DD' или date"""
+    if value is None or hasattr(value, 'year'):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def candle_key(crypto):
+    """Ключ свечей монеты: SYMBOL|<slug страницы или ID CoinGecko>, без них - SYMBOL|added.
+
+    Водяные знаки и файлы свечей не должны меняться вместе со сдвигом даты добавления.
+    """
+    stable_id = crypto.get('page_slug') or crypto.get('coin_id')
+    return f"{crypto['symbol']}|{stable_id or crypto['added']}"
+
+
+def match_identity(crypto, rows, tolerance=ADDED_DATE_TOLERANCE_DAYS):
+    """Строка cryptocurrencies (словарь), соответствующая монете, или None"""
+    slug = crypto.get('page_slug')
+    coin_id = crypto.get('coin_id')
+
+    if slug:
+        by_slug = [row for row in rows if row['page_slug'] == slug]
+        if by_slug:
+            return min(by_slug, key=lambda row: row['id'])
+
+    same_symbol = [row for row in rows if row['symbol'] == crypto['symbol']]
+
+    if coin_id:
+        by_id = [row for row in same_symbol if row['coin_gecko_id'] == coin_id]
+        if by_id:
+            return min(by_id, key=lambda row: row['id'])
+
+    added = parse_date(crypto.get('added'))
+    if added is None:
+        return None
+
+    nearby = [
+        row for row in same_symbol
+        if row['added_date'] and abs((row['added_date'] - added).days) <= tolerance
+        and (not slug or not row['page_slug'])
+    ]
+    if nearby:
+        return min(nearby, key=lambda row: (abs((row['added_date'] - added).days), row['id']))
+    return None
+
+
+def row_dict(cursor, row):
+    """Строка курсора в словарь (для обычного курсора и RealDictCursor)"""
+    if isinstance(row, dict):
+        return row
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def find_existing_coin(cursor, crypto, tolerance=ADDED_DATE_TOLERANCE_DAYS):
+    """Уже известная монета для одной монеты листинга (при записи)"""
+    added = parse_date(crypto.get('added'))
+    cursor.execute(f"""
+        SELECT {IDENTITY_COLUMNS} FROM cryptocurrencies
+        WHERE page_slug = %s
+        OR (symbol = %s AND coin_gecko_id = %s)
+        OR (symbol = %s AND added_date BETWEEN %s AND %s)
+    """, (
+        crypto.get('page_slug'),
+        crypto['symbol'], crypto.get('coin_id'),
+        crypto['symbol'], added - timedelta(days=tolerance), added + timedelta(days=tolerance)
+    ))
+    rows = [row_dict(cursor, row) for row in cursor.fetchall()]
+    return match_identity(crypto, rows, tolerance)
+
+
+def apply_identity(crypto, row):
+    """Переносит в монету каноническую дату добавления и известный ID CoinGecko"""
+    if row['added_date']:
+        crypto['added'] = row['added_date'].strftime('%Y-%m-%d')
+    if not crypto.get('coin_id') and row['coin_gecko_id']:
+        crypto['coin_id'] = row['coin_gecko_id']
+
+
+def resolve_identities(cursor, cryptos, tolerance=ADDED_DATE_TOLERANCE_DAYS):
+    """Сопоставляет монеты листинга с БД одним запросом.
+
+    Возвращает id строк cryptocurrencies по порядку монет (None - монета новая).
+    """
+    slugs = [crypto['page_slug'] for crypto in cryptos if crypto.get('page_slug')]
+    symbols = list({crypto['symbol'] for crypto in cryptos})
+    if not symbols:
+        return [None] * len(cryptos)
+
+    cursor.execute(f"""
+        SELECT {IDENTITY_COLUMNS} FROM cryptocurrencies
+        WHERE page_slug = ANY(%s) OR symbol = ANY(%s)
+    """, (slugs, symbols))
+    rows = [row_dict(cursor, row) for row in cursor.fetchall()]
+
+    crypto_ids = []
+    for crypto in cryptos:
+        row = match_identity(crypto, rows, tolerance)
+        if row:
+            apply_identity(crypto, row)
+        crypto_ids.append(row['id'] if row else None)
+    return crypto_ids
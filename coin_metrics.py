@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Метрики монет после загрузки свечей: доходность за 4ч/24ч/7д, просадка от
+максимума с момента листинга и волатильность за 7 дней, с разбивкой по сети (chain).
+
+Свечи из OHLC таблиц целиком не читаются. В coin_metrics для каждой монеты
+хранится скользящее состояние: максимум с листинга и свечи последних 7 дней
+(timestamp и close). За проход читаются только свечи новее учтенной - у монет,
+у которых снимок latest_candle ушел вперед, одним UNION ALL запросом на
+METRICS_BATCH таблиц. Метрики всех таких монет считаются одним векторным
+проходом по матрице монеты x свечи (numpy), без numpy - циклом по монетам.
+
+Доходность за период - к последней свече не позже (последняя - период), поэтому
+пропуски свечей не сдвигают окно. Волатильность - стандартное отклонение
+логарифмических доходностей 4-часовых свечей за 7 дней.
+
+Нулевые цены (API отдает 0, старые DECIMAL(20,8) таблицы округляют цены меньше
+1e-8 до нуля) в знаменатель не попадают: доходность с нулевой базой и просадка
+при нулевом максимуме - NULL, пары свечей с нулем в волатильность не входят.
+"""
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CANDLE_INTERVAL_MS = 4 * 60 * 60 * 1000
+# Периоды доходности (мс); окно хранимых свечей - самый длинный период
+RETURN_PERIODS = {'return_4h': CANDLE_INTERVAL_MS, 'return_24h': 6 * CANDLE_INTERVAL_MS,
+                  'return_7d': 42 * CANDLE_INTERVAL_MS}
+WINDOW_MS = max(RETURN_PERIODS.values())
+METRICS_BATCH = 200
+# Один проход метрик одновременно (несколько воркеров)
+METRICS_LOCK_ID = 7349002
+
+
+def load_changed_coins(cursor):
+    """Монеты, у которых есть свечи новее учтенных в coin_metrics, с их состоянием"""
+    cursor.execute("""
+        SELECT c.id, c.ohlc_table_name, m."timestamp", m.listing_high,
+               m.recent_timestamps, m.recent_closes
+        FROM latest_candle lc
+        JOIN cryptocurrencies c ON c.id = lc.crypto_id
+        LEFT JOIN coin_metrics m ON m.crypto_id = lc.crypto_id
+        WHERE c.ohlc_table_name IS NOT NULL
+        AND to_regclass(c.ohlc_table_name) IS NOT NULL
+        AND (m.crypto_id IS NULL OR lc."timestamp" > m."timestamp")
+    """)
+    return [
+        {'crypto_id': row[0], 'table': row[1], 'timestamp': row[2], 'listing_high': row[3],
+         'timestamps': list(row[4] or []), 'closes': list(row[5] or [])}
+        for row in cursor.fetchall()
+    ]
+
+
+def load_new_candles(cursor, coins):
+    """Дописывает в состояние монет свечи новее учтенных (UNION ALL батчами)"""
+    by_id = {coin['crypto_id']: coin for coin in coins}
+    rows_read = 0
+    for start in range(0, len(coins), METRICS_BATCH):
+        batch = coins[start:start + METRICS_BATCH]
+        cursor.execute(' UNION ALL '.join(
+            cursor.mogrify(f'SELECT %s, "timestamp", high::float8, close::float8 FROM {coin["table"]} '
+                           f'WHERE "timestamp" > %s',
+                           (coin['crypto_id'], coin['timestamp'] if coin['timestamp'] is not None else -1)
+                           ).decode('utf-8')
+            for coin in batch
+        ) + ' ORDER BY 1, 2')
+        for crypto_id, timestamp, high, close in cursor.fetchall():
+            coin = by_id[crypto_id]
+            coin['timestamps'].append(timestamp)
+            coin['closes'].append(close)
+            if coin['listing_high'] is None or high > coin['listing_high']:
+                coin['listing_high'] = high
+            rows_read += 1
+
+    # Состояние - свечи последних WINDOW_MS и последняя свеча до них (база доходности за 7д при пропусках)
+    for coin in coins:
+        if coin['timestamps']:
+            cutoff = coin['timestamps'][-1] - WINDOW_MS
+            keep = max([i for i, timestamp in enumerate(coin['timestamps']) if timestamp <= cutoff], default=0)
+            coin['timestamps'] = coin['timestamps'][keep:]
+            coin['closes'] = coin['closes'][keep:]
+    return rows_read
+
+
+def compute_python(coins):
+    """Метрики монет циклом (без numpy): список словарей по порядку coins"""
+    results = []
+    for coin in coins:
+        timestamps, closes = coin['timestamps'], coin['closes']
+        close = closes[-1]
+        listing_high = coin['listing_high']
+        result = {'close': close, 'drawdown': close / listing_high - 1 if listing_high and listing_high > 0 else None}
+        for name, period in RETURN_PERIODS.items():
+            base = [value for timestamp, value in zip(timestamps, closes) if timestamp <= timestamps[-1] - period]
+            result[name] = close / base[-1] - 1 if base and base[-1] > 0 else None
+
+        log_returns = [math.log(b / a) for a, b in zip(closes, closes[1:]) if a > 0 and b > 0]
+        if len(log_returns) >= 2:
+            mean = sum(log_returns) / len(log_returns)
+            result['volatility_7d'] = math.sqrt(sum((value - mean) ** 2 for value in log_returns)
+                                                / (len(log_returns) - 1))
+        else:
+            result['volatility_7d'] = None
+        results.append(result)
+    return results
+
+
+def compute_numpy(coins):
+    """Метрики всех монет одним проходом по матрице (строки выровнены по последней свече)"""
+    width = max(len(coin['timestamps']) for coin in coins)
+    timestamps = np.full((len(coins), width), np.nan)
+    closes = np.full((len(coins), width), np.nan)
+    for row, coin in enumerate(coins):
+        timestamps[row, width - len(coin['timestamps']):] = coin['timestamps']
+        closes[row, width - len(coin['closes']):] = coin['closes']
+
+    rows = np.arange(len(coins))
+    last_timestamp = timestamps[:, -1]
+    close = closes[:, -1]
+    padding = np.isnan(timestamps).sum(axis=1)
+    # Нулевые цены заменяются на NaN: метрики с ними в знаменателе - NULL, а не inf
+    positive = np.where(closes > 0, closes, np.nan)
+    listing_high = np.array([coin['listing_high'] for coin in coins], dtype=float)
+    columns = {'close': close, 'drawdown': close / np.where(listing_high > 0, listing_high, np.nan) - 1}
+
+    for name, period in RETURN_PERIODS.items():
+        # Последняя свеча не позже (последняя - период): NaN слева в сравнении дают False
+        count = (timestamps <= (last_timestamp - period)[:, None]).sum(axis=1)
+        base = positive[rows, np.clip(padding + count - 1, 0, width - 1)]
+        columns[name] = np.where(count > 0, close / base - 1, np.nan)
+
+    log_returns = np.diff(np.log(positive), axis=1)
+    valid = ~np.isnan(log_returns)
+    count = valid.sum(axis=1)
+    mean = np.where(valid, log_returns, 0).sum(axis=1) / np.maximum(count, 1)
+    squares = np.where(valid, (log_returns - mean[:, None]) ** 2, 0).sum(axis=1)
+    columns['volatility_7d'] = np.where(count >= 2, np.sqrt(squares / np.maximum(count - 1, 1)), np.nan)
+
+    return [
+        {name: None if np.isnan(values[row]) else float(values[row]) for name, values in columns.items()}
+        for row in rows
+    ]
+
+
+def compute_metrics(coins):
+    """Метрики монет (numpy, если установлен)"""
+    coins = [coin for coin in coins if coin['timestamps']]
+    if not coins:
+        return [], []
+    return coins, compute_numpy(coins) if np is not None else compute_python(coins)
+
+
+def save_metrics(cursor, coins, results):
+    """Записывает метрики и состояние монет в coin_metrics"""
+    cursor.executemany("""
+        INSERT INTO coin_metrics
+        (crypto_id, "timestamp", close, return_4h, return_24h, return_7d, listing_high, drawdown,
+         volatility_7d, recent_timestamps, recent_closes, updated_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (crypto_id) DO UPDATE SET
+            "timestamp" = EXCLUDED."timestamp",
+            close = EXCLUDED.close,
+            return_4h = EXCLUDED.return_4h,
+            return_24h = EXCLUDED.return_24h,
+            return_7d = EXCLUDED.return_7d,
+            listing_high = EXCLUDED.listing_high,
+            drawdown = EXCLUDED.drawdown,
+            volatility_7d = EXCLUDED.volatility_7d,
+            recent_timestamps = EXCLUDED.recent_timestamps,
+            recent_closes = EXCLUDED.recent_closes,
+            updated_at = CURRENT_TIMESTAMP
+    """, [
+        (coin['crypto_id'], coin['timestamps'][-1], result['close'], result['return_4h'], result['return_24h'],
+         result['return_7d'], coin['listing_high'], result['drawdown'], result['volatility_7d'],
+         coin['timestamps'], coin['closes'])
+        for coin, result in zip(coins, results)
+    ])
+
+
+def update_coin_metrics(cursor):
+    """Обновляет coin_metrics по новым свечам, возвращает (монет, прочитано свечей) или None, если проход уже идет"""
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (METRICS_LOCK_ID,))
+    if not cursor.fetchone()[0]:
+        return None
+
+    coins = load_changed_coins(cursor)
+    if not coins:
+        return 0, 0
+    candles_read = load_new_candles(cursor, coins)
+    coins, results = compute_metrics(coins)
+    if coins:
+        save_metrics(cursor, coins, results)
+    return len(coins), candles_read
+
+
+def chain_summary(cursor):
+    """Метрики по сетям из представления coin_metrics_by_chain"""
+    cursor.execute("""
+        SELECT chain, coins, avg_return_24h, median_return_24h, avg_return_7d, avg_drawdown, avg_volatility_7d
+        FROM coin_metrics_by_chain
+        ORDER BY coins DESC, chain
+    """)
+    return cursor.fetchall()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Локальная замена CoinGecko для бенчмарков: страница новых монет, /search, /ohlc и /market_chart.
+
+Монеты генерируются детерминированно (по seed): HTML листинга в той же разметке,
+что парсит parse_html_limited, поиск по символу и названию и 4-часовые свечи
+по возрасту монеты (в /market_chart - почасовые цены и 24-часовые объемы тех же
+свечей). Настраиваются задержка ответа, лимит запросов в минуту
+(сверх лимита - 429) и доля случайных 429. Счетчики запросов доступны по /stats.
+
+Запуск отдельно: python3 coingecko_stub.py --port 8765 --coins 50
+"""
+import argparse
+import json
+import random
+import string
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from log_config import get_logger
+
+log = get_logger('stub')
+
+CANDLE_INTERVAL_MS = 4 * 60 * 60 * 1000
+PAGE_PATH = '/ru/new-cryptocurrencies'
+API_PREFIX = '/api/v3'
+
+
+def coin_symbol(index, seed):
+    """Уникальный буквенный символ монеты"""
+    letters = ''
+    number = index + seed * 1000
+    for _ in range(4):
+        number, rest = divmod(number, 26)
+        letters = string.ascii_uppercase[rest] + letters
+    return 'B' + letters
+
+
+def generate_coins(count, seed):
+    """Монеты листинга: возраст от 0 до 29 дней"""
+    rng = random.Random(seed)
+    coins = []
+    for index in range(count):
+        symbol = coin_symbol(index, seed)
+        coins.append({
+            'id': f"bench-{symbol.lower()}",
+            'name': f"Bench Coin {symbol}",
+            'symbol': symbol,
+            'age_days': index % 30,
+            'price': rng.uniform(0.0001, 2.0)
+        })
+    return coins
+
+
+def listing_html(coins):
+    """HTML страницы новых монет в разметке CoinGecko"""
+    rows = []
+    for rank, coin in enumerate(coins, 1):
+        added = "недавно" if coin['age_days'] == 0 else f"около {coin['age_days']} дн. назад"
+        cells = [
+            str(rank),
+            '',
+            f'<a href="/ru/coins/{coin["id"]}"><img alt="{coin["name"]}">'
+            f'<div>{coin["name"]}</div><div>{coin["symbol"]}</div></a>',
+            f'${coin["price"]:.6f}',
+            '5.2%',
+            'Solana',
+            '',
+            '$1,000,000',
+            '',
+            '$2,000,000',
+            added
+        ]
+        rows.append('<tr class="hover:tw-bg-gray-50">' + ''.join(f'<td>{cell}</td>' for cell in cells) + '</tr>')
+    return f"<html><body><table><tbody>{''.join(rows)}</tbody></table></body></html>"
+
+
+def coin_candles(coin, days):
+    """4-часовые свечи за min(days, возраст) дней"""
+    rng = random.Random(coin['id'])
+    count = min(days, max(coin['age_days'], 1)) * 6
+    now_ms = int(time.time() * 1000) // CANDLE_INTERVAL_MS * CANDLE_INTERVAL_MS
+    price = coin['price']
+    candles = []
+    for i in range(count):
+        open_price = price
+        price = max(price * rng.uniform(0.9, 1.1), 1e-9)
+        candles.append([
+            now_ms - (count - i) * CANDLE_INTERVAL_MS,
+            open_price,
+            max(open_price, price) * 1.02,
+            min(open_price, price) * 0.98,
+            price
+        ])
+    return candles
+
+
+def coin_market_chart(coin, days):
+    """Почасовые цены и 24-часовые объемы, из которых складываются свечи coin_candles"""
+    rng = random.Random(coin['id'] + ':volume')
+    hour_ms = CANDLE_INTERVAL_MS // 4
+    prices = []
+    total_volumes = []
+    for timestamp, open_price, high, low, close in coin_candles(coin, days):
+        # Точки закрытия часов интервала: high и low внутри, close в момент закрытия свечи
+        for offset, price in zip((3, 2, 1, 0), (open_price, high, low, close)):
+            prices.append([timestamp - offset * hour_ms, price])
+            total_volumes.append([timestamp - offset * hour_ms, coin['price'] * rng.uniform(1e5, 1e6)])
+    return {'prices': prices, 'market_caps': [], 'total_volumes': total_volumes}
+
+
+class StubState:
+    """Монеты, настройки и счетчики запросов заглушки"""
+
+    def __init__(self, coins, latency_ms=0, rate_limit=0, error_rate=0.0, seed=0):
+        self.coins = coins
+        self.by_id = {coin['id']: coin for coin in coins}
+        self.latency_ms = latency_ms
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = None
+        self.window_requests = 0
+        self.counters = {'page': 0, 'search': 0, 'ohlc': 0, 'market_chart': 0, 'rate_limited': 0, 'not_found': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def should_rate_limit(self):
+        """Лимит запросов в минуту к API и случайные 429"""
+        with self.lock:
+            window = int(time.time() // 60)
+            if window != self.window:
+                self.window = window
+                self.window_requests = 0
+            self.window_requests += 1
+
+            limited = bool(self.rate_limit and self.window_requests > self.rate_limit)
+            limited = limited or (self.error_rate and self.rng.random() < self.error_rate)
+            if limited:
+                self.counters['rate_limited'] += 1
+            return limited
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+def make_handler(state):
+    """Обработчик запросов заглушки"""
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            query = urllib.parse.parse_qs(url.query)
+
+            if url.path == '/stats':
+                self.send_json(200, state.snapshot())
+                return
+
+            if state.latency_ms:
+                time.sleep(state.latency_ms / 1000)
+
+            if url.path == PAGE_PATH:
+                state.count('page')
+                body = listing_html(state.coins).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            if not url.path.startswith(API_PREFIX):
+                self.send_json(404, {'error': 'not found'})
+                return
+
+            if state.should_rate_limit():
+                self.send_json(429, {'status': {'error_code': 429, 'error_message': 'rate limited'}})
+                return
+
+            path = url.path[len(API_PREFIX):]
+
+            if path == '/search':
+                state.count('search')
+                term = query.get('query', [''])[0].lower()
+                found = [
+                    {'id': coin['id'], 'name': coin['name'], 'symbol': coin['symbol'].lower()}
+                    for coin in state.coins
+                    if term and (term == coin['symbol'].lower() or term in coin['name'].lower())
+                ]
+                self.send_json(200, {'coins': found[:25]})
+                return
+
+            parts = path.strip('/').split('/')
+            if len(parts) == 3 and parts[0] == 'coins' and parts[2] in ('ohlc', 'market_chart'):
+                state.count(parts[2])
+                coin = state.by_id.get(parts[1])
+                if not coin:
+                    state.count('not_found')
+                    self.send_json(404, {'error': 'coin not found'})
+                    return
+                days = int(query.get('days', ['30'])[0])
+                if parts[2] == 'ohlc':
+                    self.send_json(200, coin_candles(coin, days))
+                else:
+                    self.send_json(200, coin_market_chart(coin, days))
+                return
+
+            self.send_json(404, {'error': 'not found'})
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub(coins_count=50, seed=1, latency_ms=0, rate_limit=0, error_rate=0.0, port=0):
+    """Запускает заглушку в отдельном потоке, возвращает (сервер, состояние, базовый URL)"""
+    state = StubState(generate_coins(coins_count, seed), latency_ms, rate_limit, error_rate, seed)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, name="coingecko-stub", daemon=True)
+    thread.start()
+    return server, state, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная замена CoinGecko для бенчмарков")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--coins', type=int, default=50, help="Монет на странице листинга")
+    parser.add_argument('--seed', type=int, default=1, help="Seed генерации монет")
+    parser.add_argument('--latency-ms', type=int, default=0, help="Задержка каждого ответа")
+    parser.add_argument('--rate-limit', type=int, default=0, help="Запросов к API в минуту (0 - без лимита)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Доля случайных ответов 429")
+    args = parser.parse_args()
+
+    server, _, base_url = start_stub(args.coins, args.seed, args.latency_ms, args.rate_limit,
+                                     args.error_rate, args.port)
+    log.info(f"🧪 Заглушка CoinGecko: {base_url}{PAGE_PATH}, API: {base_url}{API_PREFIX}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Потоковый экспорт свечей из OHLC таблиц в сжатые файлы по монетам и месяцам.
+
+Файлы: <out>/coin=<ohlc таблица>/month=YYYY-MM/part-<первая>-<последняя свеча>.parquet
+(или .csv.gz без pyarrow) - такую раскладку по разделам понимают pyarrow.dataset,
+DuckDB и Spark. Свечи не собираются в память целиком: с pyarrow строки читаются
+серверным курсором батчами по EXPORT_BATCH_ROWS и дописываются в Parquet, без
+него CSV идет напрямую из COPY ... TO STDOUT в gzip.
+
+Инкрементальный экспорт (--incremental) выгружает только свечи новее
+последней выгруженной: водяные знаки монет хранятся в export_state.json и
+обновляются после каждой монеты, поэтому прерванный запуск продолжается с той
+же монеты. Свечи только дописываются в конец по времени (см. save_crypto),
+так что водяной знак по "timestamp" не пропускает строк. Повторный полный экспорт
+заменяет пересекающиеся части месяца одной новой частью, строки не дублируются.
+
+Пример: python3 export_candles.py --symbols PEPE,WIF --since 2025-01-01 --out ./export --incremental
+"""
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from candle_files import CandleFileWriter, pq
+from log_config import get_logger
+from metrics import write_atomic
+from parser_ohlcv_db import get_db_connection
+
+log = get_logger('export')
+
+EXPORT_DIR = os.environ.get('EXPORT_DIR', './export')
+EXPORT_BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS', '50000'))
+STATE_FILE = 'export_state.json'
+# Имя части: part-<первая>-<последняя свеча>.parquet / .csv.gz
+PART_PATTERN = re.compile(r'^part-(\d+)-(\d+)\.(parquet|csv\.gz)$')
+
+COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+# Приведение типов: таблицы старого формата хранят DECIMAL
+SELECT_COLUMNS = ('"timestamp", open::float8, high::float8, low::float8, close::float8, volume::float8')
+
+
+def date_ms(value):
+    """Дата YYYY-MM-DD (UTC) в миллисекунды"""
+    return int(datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def month_ranges(first_ms, last_ms):
+    """Месяцы (YYYY-MM, начало мс, начало следующего мс), покрывающие [first_ms, last_ms]"""
+    month = datetime.fromtimestamp(first_ms / 1000, timezone.utc).replace(day=1, hour=0, minute=0,
+                                                                         second=0, microsecond=0)
+    while int(month.timestamp() * 1000) <= last_ms:
+        following = (month + timedelta(days=32)).replace(day=1)
+        yield month.strftime('%Y-%m'), int(month.timestamp() * 1000), int(following.timestamp() * 1000)
+        month = following
+
+
+def load_state(out_dir):
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_state(out_dir, state):
+    write_atomic(os.path.join(out_dir, STATE_FILE), json.dumps(state, indent=2, sort_keys=True))
+
+
+def select_coins(cursor, symbols):
+    """Монеты с существующими OHLC таблицами (все или по списку символов)"""
+    cursor.execute("""
+        SELECT symbol, added_date, ohlc_table_name FROM cryptocurrencies
+        WHERE ohlc_table_name IS NOT NULL
+        AND to_regclass(ohlc_table_name) IS NOT NULL
+        AND (%s OR symbol = ANY(%s))
+        ORDER BY symbol, added_date
+    """, (not symbols, symbols))
+    return cursor.fetchall()
+
+
+def month_parts(month_dir):
+    """Готовые части раздела месяца: список (первая свеча, последняя свеча, путь)"""
+    if not os.path.isdir(month_dir):
+        return []
+    parts = []
+    for name in os.listdir(month_dir):
+        match = PART_PATTERN.match(name)
+        if match:
+            parts.append((int(match.group(1)), int(match.group(2)), os.path.join(month_dir, name)))
+    return parts
+
+
+def replaced_parts(month_dir, start_ms, end_ms):
+    """Части, которые заменит выгрузка [start_ms, end_ms], и расширенный до них диапазон.
+
+    Диапазон расширяется до границ пересекающихся частей, чтобы новая часть
+    содержала все их строки и старые можно было удалить без потерь.
+    """
+    parts = month_parts(month_dir)
+    replaced = []
+    changed = True
+    while changed:
+        changed = False
+        for part in parts:
+            if part not in replaced and part[0] <= end_ms and part[1] >= start_ms:
+                replaced.append(part)
+                start_ms, end_ms = min(start_ms, part[0]), max(end_ms, part[1])
+                changed = True
+    return replaced, start_ms, end_ms
+
+
+def export_range_copy(cursor, table_name, start_ms, end_ms, path_base):
+    """CSV.gz напрямую из COPY ... TO STDOUT, возвращает (путь, строк)"""
+    path = path_base + '.csv.gz'
+    tmp_path = path + '.tmp'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    query = cursor.mogrify(f"""
+        SELECT {SELECT_COLUMNS} FROM {table_name}
+        WHERE "timestamp" >= %s AND "timestamp" <= %s
+        ORDER BY "timestamp"
+    """, (start_ms, end_ms)).decode('utf-8')
+
+    with gzip.open(tmp_path, 'wb') as f:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+    rows = cursor.rowcount
+
+    if rows <= 0:
+        os.remove(tmp_path)
+        return None, 0
+    os.replace(tmp_path, path)
+    return path, rows
+
+
+def export_range_cursor(conn, table_name, start_ms, end_ms, path_base):
+    """Parquet батчами из серверного курсора, возвращает (путь, строк)"""
+    writer = CandleFileWriter(path_base, COLUMNS)
+    cursor = conn.cursor(name=f"export_{table_name}")
+    cursor.itersize = EXPORT_BATCH_ROWS
+    try:
+        cursor.execute(f"""
+            SELECT {SELECT_COLUMNS} FROM {table_name}
+            WHERE "timestamp" >= %s AND "timestamp" <= %s
+            ORDER BY "timestamp"
+        """, (start_ms, end_ms))
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_ROWS)
+            if not rows:
+                break
+            writer.write_rows(rows)
+    except Exception:
+        writer.abort()
+        raise
+    finally:
+        cursor.close()
+    return writer.close(), writer.rows_written
+
+
+def export_coin(conn, table_name, from_ms, to_ms, out_dir):
+    """Выгружает свечи монеты в (from_ms, to_ms] по месяцам, возвращает (строк, файлов, последний timestamp)"""
+    cursor = conn.cursor()
+    try:
+        # Верхняя граница фиксируется заранее: свечи, вставленные во время экспорта, уйдут в следующий
+        cursor.execute(f"""
+            SELECT MIN("timestamp"), MAX("timestamp") FROM {table_name}
+            WHERE "timestamp" > %s AND "timestamp" <= %s
+        """, (from_ms, to_ms))
+        first_ms, last_ms = cursor.fetchone()
+        if first_ms is None:
+            return 0, 0, None
+
+        rows_total = 0
+        files = 0
+        for month, month_start, month_end in month_ranges(first_ms, last_ms):
+            start_ms = max(month_start, first_ms)
+            end_ms = min(month_end - 1, last_ms)
+            # Повторная выгрузка месяца заменяет пересекающиеся части одной новой,
+            # иначе строки в разделе дублировались бы
+            month_dir = os.path.join(out_dir, f"coin={table_name}", f"month={month}")
+            replaced, start_ms, end_ms = replaced_parts(month_dir, start_ms, end_ms)
+            path_base = os.path.join(month_dir, f"part-{start_ms}-{end_ms}")
+            if pq:
+                path, rows = export_range_cursor(conn, table_name, start_ms, end_ms, path_base)
+            else:
+                path, rows = export_range_copy(cursor, table_name, start_ms, end_ms, path_base)
+            if path:
+                # Старые части удаляются только после того, как новая записана целиком
+                for _, _, old_path in replaced:
+                    if old_path != path:
+                        os.remove(old_path)
+                rows_total += rows
+                files += 1
+        return rows_total, files, last_ms
+    finally:
+        cursor.close()
+
+
+def run_export(symbols, since=None, until=None, out_dir=EXPORT_DIR, incremental=False):
+    """Экспортирует свечи выбранных монет, возвращает итоги или None при ошибке подключения"""
+    conn = get_db_connection()
+    if not conn:
+        log.error("❌ Не удалось подключиться к базе данных")
+        return None
+
+    state = load_state(out_dir)
+    since_ms = date_ms(since) - 1 if since else -1
+    until_ms = date_ms(until) + 24 * 3600 * 1000 - 1 if until else 2 ** 62
+    totals = {'coins': 0, 'rows': 0, 'files': 0}
+    started = time.perf_counter()
+
+    log.info(f"📤 Экспорт свечей в {out_dir} ({'Parquet' if pq else 'CSV.gz через COPY'}), "
+             f"{'инкрементальный' if incremental else 'полный'}")
+    try:
+        cursor = conn.cursor()
+        coins = select_coins(cursor, symbols)
+        cursor.close()
+        conn.commit()
+
+        for symbol, added_date, table_name in coins:
+            from_ms = max(since_ms, state.get(table_name, -1)) if incremental else since_ms
+            rows, files, last_ms = export_coin(conn, table_name, from_ms, until_ms, out_dir)
+            conn.commit()
+            if not rows:
+                continue
+
+            if last_ms > state.get(table_name, -1):
+                state[table_name] = last_ms
+                save_state(out_dir, state)
+            totals['coins'] += 1
+            totals['rows'] += rows
+            totals['files'] += files
+            log.info(f"   {symbol} ({added_date}): свечей {rows}, файлов {files}")
+
+    finally:
+        conn.close()
+
+    seconds = time.perf_counter() - started
+    log.info(f"📊 Выгружено монет: {totals['coins']}, свечей: {totals['rows']}, файлов: {totals['files']} "
+             f"за {seconds:.1f} с ({totals['rows'] / seconds if seconds else 0:.0f} свечей/с)")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковый экспорт свечей в Parquet/CSV.gz по монетам и месяцам")
+    parser.add_argument('--symbols', default='', help="Символы через запятую (по умолчанию все монеты)")
+    parser.add_argument('--since', help="С даты YYYY-MM-DD (UTC)")
+    parser.add_argument('--until', help="По дату YYYY-MM-DD включительно (UTC)")
+    parser.add_argument('--out', default=EXPORT_DIR, help="Каталог экспорта")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Только свечи новее выгруженных прошлым экспортом (export_state.json)")
+    args = parser.parse_args()
+
+    symbols = [symbol.strip().upper() for symbol in args.symbols.split(',') if symbol.strip()]
+    if run_export(symbols, args.since, args.until, args.out, args.incremental) is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
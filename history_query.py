@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Запросы к истории JSON вывода по индексу (history_store.py): цена и свечи монеты за период.
+
+Монета ищется по символу или ID CoinGecko в index.jsonl, затем читаются и
+распаковываются только порции, в которых она есть: для цены - с последнего
+добавления монеты в листинг до конца периода, для свечей - порции со свечами,
+попадающими в период. Остальные сегменты не открываются.
+
+Пример: python3 history_query.py PEPE --days 14 --candles
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from history_store import expand_candle, load_index, read_chunk
+
+HISTORY_DIR = './logs/history'
+
+# Поля листинга в таблице цены
+PRICE_FIELDS = ('price', 'change_24h', 'market_cap', 'fdv')
+
+
+def match_keys(index, coin):
+    """Ключи монеты (SYMBOL|slug, в старых сегментах SYMBOL|added) по символу или ID CoinGecko"""
+    coin = coin.lower()
+    keys = set()
+    for entry in index:
+        for key in list(entry['listed']) + list(entry['candles']):
+            if key.split('|', 1)[0].lower() == coin or entry['coin_ids'].get(key, '').lower() == coin:
+                keys.add(key)
+    return sorted(keys)
+
+
+def listing_entries(index, key, since):
+    """Порции снимков монеты: от последнего добавления в листинг до since и все после"""
+    touched = [position for position, entry in enumerate(index) if key in entry['listed']]
+    start = 0
+    for position in touched:
+        if index[position]['at'] > since:
+            break
+        if index[position]['listed'][key] == 'added':
+            start = position
+    return [index[position] for position in touched if position >= start]
+
+
+def candle_entries(index, key, since_ms):
+    """Порции со свечами монеты, последняя свеча которых не раньше since_ms"""
+    return [entry for entry in index if key in entry['candles'] and entry['candles'][key][1] >= since_ms]
+
+
+def query_coin(directory, index, key, since, with_candles=True):
+    """История монеты: {'key', 'coin_id', 'listing': [(время, поля)], 'candles': [...], 'chunks_read'}"""
+    since_iso = since.isoformat()
+    since_ms = int(since.timestamp() * 1000)
+    result = {'key': key, 'coin_id': None, 'listing': [], 'candles': [], 'chunks_read': 0}
+
+    entries = listing_entries(index, key, since_iso)
+    if with_candles:
+        entries += candle_entries(index, key, since_ms)
+    # Каждая порция читается один раз, в порядке записи
+    order = {id(entry): position for position, entry in enumerate(index)}
+    entries = sorted({id(entry): entry for entry in entries}.values(), key=lambda entry: order[id(entry)])
+
+    fields = None
+    candles = {}
+    for entry in entries:
+        result['chunks_read'] += 1
+        for record in read_chunk(directory, entry):
+            if record['type'] == 'snapshot':
+                if key in record['added']:
+                    fields = dict(record['added'][key])
+                elif key in record['changed'] and fields is not None:
+                    fields.update(record['changed'][key])
+                elif key in record['removed']:
+                    fields = None
+                if fields is not None and key in record['order'] and record['at'] >= since_iso:
+                    result['listing'].append((record['at'], dict(fields)))
+            elif with_candles and record['type'] == 'candles' and record['key'] == key:
+                result['coin_id'] = record.get('coin_id') or result['coin_id']
+                for row in record['candles']:
+                    if row[0] >= since_ms:
+                        candles[row[0]] = row
+
+    if fields and not result['coin_id']:
+        result['coin_id'] = fields.get('coin_id')
+    result['candles'] = [expand_candle(candles[timestamp]) for timestamp in sorted(candles)]
+    return result
+
+
+def print_result(result, with_candles):
+    """Таблица цены по запускам и свечи"""
+    print(f"\n🪙 {result['key']} (ID: {result['coin_id'] or '-'})")
+    print(f"{'Время запуска':<20} " + ' '.join(f"{field:>16}" for field in PRICE_FIELDS))
+    for at, fields in result['listing']:
+        print(f"{at[:19]:<20} " + ' '.join(f"{str(fields.get(field, '')):>16}" for field in PRICE_FIELDS))
+
+    if with_candles:
+        print(f"\n📊 Свечей: {len(result['candles'])}")
+        for candle in result['candles']:
+            print(f"   {candle['datetime'][:16]}  O: {candle['open']:.8g}  H: {candle['high']:.8g}  "
+                  f"L: {candle['low']:.8g}  C: {candle['close']:.8g}")
+
+
+def print_files(index):
+    """Диапазон времени и количество порций по каждому сегменту"""
+    segments = {}
+    for entry in index:
+        segment = segments.setdefault(entry['segment'], {'chunks': 0, 'from': entry['at'], 'to': entry['at']})
+        segment['chunks'] += 1
+        segment['to'] = entry['at']
+    for name, segment in segments.items():
+        print(f"📁 {name}: {segment['from'][:19]} - {segment['to'][:19]}, запусков {segment['chunks']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Цена и свечи монеты из истории JSON вывода")
+    parser.add_argument('coin', nargs='?', help="Символ или ID CoinGecko")
+    parser.add_argument('--days', type=int, default=14, help="За сколько дней")
+    parser.add_argument('--candles', action='store_true', help="Показать свечи")
+    parser.add_argument('--json', action='store_true', help="Вывод в JSON")
+    parser.add_argument('--files', action='store_true', help="Диапазоны времени сегментов")
+    parser.add_argument('--dir', default=HISTORY_DIR, help="Каталог истории")
+    args = parser.parse_args()
+
+    index = load_index(args.dir)
+    if not index:
+        print(f"❌ Индекс истории не найден в {args.dir} (python3 history_store.py --reindex)")
+        sys.exit(1)
+
+    if args.files:
+        print_files(index)
+    if not args.coin:
+        return
+
+    keys = match_keys(index, args.coin)
+    if not keys:
+        print(f"❌ Монета {args.coin} не найдена в истории")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    since = datetime.now() - timedelta(days=args.days)
+    results = [query_coin(args.dir, index, key, since, args.candles) for key in keys]
+
+    if args.json:
+        print(json.dumps([{**result, 'listing': [{'at': at, **fields} for at, fields in result['listing']]}
+                          for result in results], ensure_ascii=False, indent=2))
+        return
+
+    for result in results:
+        print_result(result, args.candles)
+    print(f"\n⏱️ Прочитано порций: {sum(result['chunks_read'] for result in results)} из {len(index)} "
+          f"за {time.perf_counter() - started:.3f} с")
+
+
+if __name__ == "__main__":
+    main()
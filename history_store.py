@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+История JSON вывода (parser_ohlcv.py): сжатые JSONL сегменты только с дозаписью.
+
+Вместо полного файла на каждый запуск в сегмент дописывается одна сжатая
+порция строк:
+- snapshot - листинг запуска как разница с прошлым: новые монеты целиком,
+  у остальных только изменившиеся поля, исчезнувшие монеты и порядок строк;
+- candles - только свечи монеты новее уже записанных ([timestamp, o, h, l, c]).
+
+Сегмент сменяется по размеру (HISTORY_ROTATE_BYTES); первый снимок нового
+сегмента полный, поэтому листинги читаются из любого сегмента отдельно.
+Сжатие - zstandard (если установлен) или gzip; каждая порция - отдельный
+кадр zstd / член gzip, поэтому дозапись не переписывает файл.
+
+Рядом с сегментами ведется индекс index.jsonl: на каждую порцию - сегмент,
+смещение и длина, время запуска, монеты снимка и диапазоны свечей по монетам.
+Запросы (history_query.py) читают и распаковывают только нужные порции.
+
+Пример: python3 history_store.py --import logs/last_50_cryptos_2*.json --delete-imported
+"""
+import argparse
+import glob
+import gzip
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+from coin_identity import candle_key
+from log_config import get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = get_logger('history')
+
+HISTORY_ROTATE_BYTES = int(os.environ.get('HISTORY_ROTATE_BYTES', str(32 * 1024 * 1024)))
+# Сколько дней хранить закрытые сегменты (0 - не удалять)
+HISTORY_KEEP_DAYS = int(os.environ.get('HISTORY_KEEP_DAYS', '0'))
+
+INDEX_NAME = 'index.jsonl'
+
+# Поля свечи в строке candles
+CANDLE_FIELDS = ('timestamp', 'open', 'high', 'low', 'close')
+
+
+def segment_extension():
+    """Расширение сегментов с учетом доступного сжатия"""
+    return '.jsonl.zst' if zstandard else '.jsonl.gz'
+
+
+def compress_chunk(data):
+    """Одна порция строк как отдельный кадр zstd или член gzip"""
+    if zstandard:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress_chunk(path, data):
+    """Распаковывает одну порцию сегмента"""
+    if path.endswith('.zst'):
+        if not zstandard:
+            raise RuntimeError(f"для чтения {path} нужен пакет zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def open_segment(path):
+    """Текстовый поток всех порций сегмента"""
+    if path.endswith('.zst'):
+        if not zstandard:
+            raise RuntimeError(f"для чтения {path} нужен пакет zstandard")
+        raw = open(path, 'rb')
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True,
+                                                                           closefd=True), encoding='utf-8')
+    return gzip.open(path, 'rt', encoding='utf-8')
+
+
+def listing_fields(crypto):
+    """Поля монеты для снимка листинга (без свечей)"""
+    return {field: value for field, value in crypto.items() if field != 'ohlcv'}
+
+
+def expand_candle(row):
+    """Свеча из строки candles в формате fetch_ohlc_data"""
+    candle = dict(zip(CANDLE_FIELDS + ('volume',), row))
+    dt = datetime.fromtimestamp(candle['timestamp'] / 1000)
+    candle.update(datetime=dt.isoformat(), date=dt.strftime('%Y-%m-%d'), time=dt.strftime('%H:%M:%S'))
+    return candle
+
+
+class HistoryStore:
+    """Каталог сегментов истории и состояние для расчета разницы (state.json)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.state_path = os.path.join(directory, 'state.json')
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'segment': None, 'listing': {}, 'watermarks': {}}
+
+    def save_state(self):
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.state_path)
+
+    def current_segment(self):
+        """Путь сегмента для дозаписи и признак нового сегмента"""
+        segment = self.state.get('segment')
+        if segment:
+            path = os.path.join(self.directory, segment)
+            if os.path.exists(path) and os.path.getsize(path) < HISTORY_ROTATE_BYTES:
+                return path, False
+
+        segment = f"history_{datetime.now().strftime('%Y%m%d_%H%M%S')}{segment_extension()}"
+        self.state['segment'] = segment
+        return os.path.join(self.directory, segment), True
+
+    def build_records(self, cryptos, timestamp, source, full):
+        """Строки запуска: снимок листинга как разница и новые свечи"""
+        listing = {candle_key(crypto): listing_fields(crypto) for crypto in cryptos}
+        previous = {} if full else self.state['listing']
+
+        changed = {}
+        for key, fields in listing.items():
+            if key in previous:
+                diff = {field: value for field, value in fields.items() if previous[key].get(field) != value}
+                if diff:
+                    changed[key] = diff
+
+        records = [{
+            'type': 'snapshot',
+            'at': timestamp,
+            'source': source,
+            'full': full,
+            'order': list(listing),
+            'added': {key: fields for key, fields in listing.items() if key not in previous},
+            'changed': changed,
+            'removed': [key for key in previous if key not in listing]
+        }]
+
+        watermarks = self.state['watermarks']
+        for crypto in cryptos:
+            # Ключ по slug/ID: сдвиг даты добавления не выгружает свечи заново.
+            # Знак под старым ключом SYMBOL|added подхватывается после обновления
+            key = candle_key(crypto)
+            legacy_key = f"{crypto['symbol']}|{crypto['added']}"
+            watermark = watermarks.get(key, watermarks.get(legacy_key, 0))
+            rows = [
+                [candle[field] for field in CANDLE_FIELDS]
+                + ([candle['volume']] if candle.get('volume') is not None else [])
+                for candle in crypto.get('ohlcv') or []
+                if candle['timestamp'] > watermark
+            ]
+            if rows:
+                records.append({'type': 'candles', 'key': key, 'coin_id': crypto.get('coin_id'), 'candles': rows})
+                watermarks[key] = max(row[0] for row in rows)
+
+        self.state['listing'] = listing
+        return records
+
+    def append(self, cryptos, source, timestamp=None):
+        """Дописывает запуск в текущий сегмент, возвращает (путь, байт записано)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path, full = self.current_segment()
+        records = self.build_records(cryptos, timestamp or datetime.now().isoformat(), source, full)
+
+        data = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n' for record in records)
+        chunk = compress_chunk(data.encode('utf-8'))
+        with open(path, 'ab') as f:
+            offset = f.tell()
+            f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Если процесс упадет до записи индекса или состояния, индекс восстанавливается
+        # rebuild_index(), а следующий запуск допишет свечи повторно (при чтении дубликаты отбрасываются)
+        append_index(self.directory, index_entry(os.path.basename(path), offset, len(chunk), records))
+        self.save_state()
+        self.prune()
+        return path, len(chunk)
+
+    def prune(self):
+        """Удаляет закрытые сегменты старше HISTORY_KEEP_DAYS"""
+        if not HISTORY_KEEP_DAYS:
+            return []
+
+        cutoff = datetime.now().timestamp() - HISTORY_KEEP_DAYS * 24 * 60 * 60
+        current = os.path.join(self.directory, self.state['segment'])
+        removed = []
+        for path in segment_paths(self.directory):
+            if path != current and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed.append(path)
+
+        if removed:
+            removed_names = {os.path.basename(path) for path in removed}
+            write_index(self.directory, [entry for entry in load_index(self.directory)
+                                         if entry['segment'] not in removed_names])
+        return removed
+
+
+def segment_paths(directory):
+    """Сегменты истории в порядке записи"""
+    paths = glob.glob(os.path.join(directory, 'history_*.jsonl.gz')) + \
+        glob.glob(os.path.join(directory, 'history_*.jsonl.zst'))
+    return sorted(paths, key=os.path.basename)
+
+
+def index_entry(segment, offset, length, records):
+    """Строка индекса для порции: где лежит, когда записана, какие монеты и свечи в ней"""
+    entry = {'segment': segment, 'offset': offset, 'length': length, 'listed': {}, 'candles': {}, 'coin_ids': {}}
+    for record in records:
+        if record['type'] == 'snapshot':
+            entry['at'] = record['at']
+            entry['listed'].update({key: 'added' for key in record['added']})
+            entry['listed'].update({key: 'changed' for key in record['changed']})
+            for key, fields in record['added'].items():
+                if fields.get('coin_id'):
+                    entry['coin_ids'][key] = fields['coin_id']
+        elif record['type'] == 'candles':
+            timestamps = [row[0] for row in record['candles']]
+            entry['candles'][record['key']] = [min(timestamps), max(timestamps)]
+            if record.get('coin_id'):
+                entry['coin_ids'][record['key']] = record['coin_id']
+    return entry
+
+
+def append_index(directory, entry):
+    """Дописывает строку в индекс"""
+    path = os.path.join(directory, INDEX_NAME)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+
+def write_index(directory, entries):
+    """Перезаписывает индекс целиком (через временный файл)"""
+    path = os.path.join(directory, INDEX_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+    os.replace(path + '.tmp', path)
+
+
+def load_index(directory):
+    """Строки индекса по порядку записи (оборванная последняя строка пропускается)"""
+    entries = []
+    try:
+        with open(os.path.join(directory, INDEX_NAME), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_chunk(directory, entry):
+    """Строки одной порции по строке индекса (читается только она)"""
+    path = os.path.join(directory, entry['segment'])
+    with open(path, 'rb') as f:
+        f.seek(entry['offset'])
+        data = f.read(entry['length'])
+    return [json.loads(line) for line in decompress_chunk(path, data).decode('utf-8').splitlines() if line]
+
+
+def iter_chunks(path):
+    """Порции сегмента: (смещение, длина, строки) - для восстановления индекса"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    offset = 0
+    while offset < len(data):
+        if path.endswith('.zst'):
+            decompressor = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        try:
+            content = decompressor.decompress(data[offset:])
+        except Exception:
+            # Оборванная последняя порция
+            break
+        if not decompressor.eof:
+            break
+        length = len(data) - offset - len(decompressor.unused_data)
+        yield offset, length, [json.loads(line) for line in content.decode('utf-8').splitlines() if line]
+        offset += length
+
+
+def rebuild_index(directory):
+    """Строит индекс заново по всем сегментам, возвращает количество порций"""
+    entries = [
+        index_entry(os.path.basename(path), offset, length, records)
+        for path in segment_paths(directory)
+        for offset, length, records in iter_chunks(path)
+    ]
+    write_index(directory, entries)
+    return len(entries)
+
+
+def iter_records(directory):
+    """Все строки истории по порядку"""
+    for path in segment_paths(directory):
+        with open_segment(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def iter_snapshots(records):
+    """Полные листинги запусков: (время, источник, список монет в порядке страницы)"""
+    listing = {}
+    for record in records:
+        if record['type'] != 'snapshot':
+            continue
+        if record['full']:
+            listing = {}
+        for key in record['removed']:
+            listing.pop(key, None)
+        listing.update({key: dict(fields) for key, fields in record['added'].items()})
+        for key, diff in record['changed'].items():
+            listing[key].update(diff)
+        yield record['at'], record['source'], [dict(listing[key]) for key in record['order']]
+
+
+def load_candles(records, key):
+    """Все свечи монеты из истории по возрастанию времени (без дубликатов)"""
+    candles = {}
+    for record in records:
+        if record['type'] == 'candles' and record['key'] == key:
+            for row in record['candles']:
+                candles[row[0]] = row
+    return [expand_candle(candles[timestamp]) for timestamp in sorted(candles)]
+
+
+def import_legacy_files(store, paths, delete=False):
+    """Переносит старые файлы last_50_cryptos_*.json в историю в порядке времени"""
+    imported = 0
+    for path in sorted(paths):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        store.append(data.get('cryptos', []), data.get('source'), data.get('timestamp'))
+        imported += 1
+        if delete:
+            os.remove(path)
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сжатая история JSON вывода парсера")
+    parser.add_argument('--dir', default='./logs/history', help="Каталог сегментов истории")
+    parser.add_argument('--import', dest='import_files', nargs='+', metavar='FILE',
+                        help="Перенести старые файлы last_50_cryptos_*.json")
+    parser.add_argument('--delete-imported', action='store_true', help="Удалить перенесенные файлы")
+    parser.add_argument('--reindex', action='store_true', help="Построить индекс index.jsonl заново")
+    args = parser.parse_args()
+
+    if args.reindex:
+        log.info(f"🗂️ Индекс перестроен: порций {rebuild_index(args.dir)}")
+
+    if args.import_files:
+        legacy_size = sum(os.path.getsize(path) for path in args.import_files)
+        imported = import_legacy_files(HistoryStore(args.dir), args.import_files, args.delete_imported)
+        log.info(f"📦 Перенесено файлов: {imported} ({legacy_size / 1024 / 1024:.1f} MB)")
+
+    segments = segment_paths(args.dir)
+    total_size = sum(os.path.getsize(path) for path in segments)
+    snapshots = sum(1 for _ in iter_snapshots(iter_records(args.dir)))
+    log.info(f"📚 История {args.dir}: сегментов {len(segments)}, {total_size / 1024 / 1024:.2f} MB, "
+             f"запусков {snapshots}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Запись и воспроизведение HTTP ответов (кассеты) для офлайн запусков парсеров.
+
+HTTP_CASSETTE_MODE:
+  off    - обычные запросы (по умолчанию)
+  record - запросы выполняются, каждый ответ (включая ошибки 404/429) пишется в кассету
+  replay - ответы берутся из кассеты, сеть не используется
+
+Кассета - JSONL, сжатый gzip (HTTP_CASSETTE_PATH). Ответы хранятся по ключу
+"МЕТОД URL" в порядке получения: повторные запросы одного URL (например 429,
+затем 200) воспроизводятся в той же последовательности. При воспроизведении
+HTTP_CASSETTE_LATENCY=original повторяет исходную задержку ответа, none - без задержки.
+"""
+import atexit
+import base64
+import email.message
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+CASSETTE_MODE = os.environ.get('HTTP_CASSETTE_MODE', 'off')
+CASSETTE_PATH = os.environ.get('HTTP_CASSETTE_PATH', './cassettes/coingecko.jsonl.gz')
+CASSETTE_LATENCY = os.environ.get('HTTP_CASSETTE_LATENCY', 'original')
+
+_lock = threading.Lock()
+_record_file = None
+_replay_entries = None
+_replay_positions = {}
+
+
+class CassetteResponse(io.BytesIO):
+    """Ответ из кассеты с интерфейсом ответа urllib (read, info, getcode, status)"""
+
+    def __init__(self, url, status, headers, body):
+        super().__init__(body)
+        self.url = url
+        self.status = status
+        self.headers = build_headers(headers)
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+
+def build_headers(headers):
+    """Заголовки в виде email.message.Message, как у urllib"""
+    message = email.message.Message()
+    for name, value in headers:
+        message[name] = value
+    return message
+
+
+def request_key(req):
+    """Ключ запроса в кассете"""
+    if isinstance(req, str):
+        return f"GET {req}"
+    return f"{req.get_method()} {req.full_url}"
+
+
+def record_entry(key, status, headers, body, latency):
+    """Дописывает ответ в кассету"""
+    global _record_file
+
+    entry = {
+        'key': key,
+        'status': status,
+        'headers': headers,
+        'body': base64.b64encode(body).decode('ascii'),
+        'latency': round(latency, 4)
+    }
+
+    with _lock:
+        if _record_file is None:
+            os.makedirs(os.path.dirname(CASSETTE_PATH) or '.', exist_ok=True)
+            _record_file = gzip.open(CASSETTE_PATH, 'wt', encoding='utf-8')
+        _record_file.write(json.dumps(entry) + '\n')
+        _record_file.flush()
+
+
+@atexit.register
+def close_cassette():
+    """Закрывает записываемую кассету (дописывает конец gzip потока)"""
+    global _record_file
+    with _lock:
+        if _record_file:
+            _record_file.close()
+            _record_file = None
+
+
+def load_cassette(path=None):
+    """Загружает кассету: ключ -> список ответов в порядке записи"""
+    entries = {}
+    with gzip.open(path or CASSETTE_PATH, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries.setdefault(entry['key'], []).append(entry)
+        except (EOFError, json.JSONDecodeError):
+            # Запись оборвалась: используем ответы, записанные до обрыва
+            pass
+    return entries
+
+
+def record_urlopen(req, **kwargs):
+    """Выполняет запрос и записывает ответ (или HTTP ошибку) в кассету"""
+    key = request_key(req)
+    started = time.perf_counter()
+
+    try:
+        response = urllib.request.urlopen(req, **kwargs)
+        body = response.read()
+        headers = list(response.info().items())
+        record_entry(key, response.status, headers, body, time.perf_counter() - started)
+        return CassetteResponse(response.geturl(), response.status, headers, body)
+
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        headers = list(e.headers.items()) if e.headers else []
+        record_entry(key, e.code, headers, body, time.perf_counter() - started)
+        raise urllib.error.HTTPError(e.url, e.code, e.reason, build_headers(headers), io.BytesIO(body))
+
+
+def replay_urlopen(req, **kwargs):
+    """Возвращает следующий записанный ответ на запрос"""
+    global _replay_entries
+
+    key = request_key(req)
+    with _lock:
+        if _replay_entries is None:
+            _replay_entries = load_cassette()
+
+        responses = _replay_entries.get(key)
+        if not responses:
+            raise urllib.error.URLError(f"нет записи в кассете: {key}")
+
+        # Последний ответ повторяется, если запросов больше, чем записано
+        position = _replay_positions.get(key, 0)
+        _replay_positions[key] = position + 1
+        entry = responses[min(position, len(responses) - 1)]
+
+    if CASSETTE_LATENCY == 'original':
+        time.sleep(entry['latency'])
+
+    body = base64.b64decode(entry['body'])
+    url = key.split(' ', 1)[1]
+
+    if entry['status'] >= 400:
+        raise urllib.error.HTTPError(url, entry['status'], 'Replayed', build_headers(entry['headers']),
+                                     io.BytesIO(body))
+
+    return CassetteResponse(url, entry['status'], entry['headers'], body)
+
+
+def urlopen(req, **kwargs):
+    """Замена urllib.request.urlopen с учетом режима кассеты"""
+    if CASSETTE_MODE == 'record':
+        return record_urlopen(req, **kwargs)
+    if CASSETTE_MODE == 'replay':
+        return replay_urlopen(req, **kwargs)
+    return urllib.request.urlopen(req, **kwargs)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Подписка на события загрузки вместо опроса cryptocurrencies и OHLC таблиц.
+
+Триггеры migrate_ingest_events.sql пишут каждое событие в таблицу
+ingest_events и отправляют его в канал ingest_events после commit:
+- coin_added       новая монета (symbol, name, chain, added_date, coin_gecko_id);
+- candles          новые свечи монеты в диапазоне (from, to] по timestamp;
+- coin_id_changed  сменился ID CoinGecko (old, new).
+
+EventSubscriber слушает канал и передает события обработчику батчами (до
+INGEST_BATCH_SIZE событий или INGEST_BATCH_WAIT секунд). После обрыва
+подключения и при старте пропущенные события дочитываются из ingest_events по
+id: LISTEN выполняется до дочитывания, поэтому событие между ними не теряется.
+Транзакции фиксируются не в порядке id, поэтому позиция - это последние
+доставленные id (INGEST_REPLAY_OVERLAP штук), а не только максимальный:
+дочитывание начинается от самого старого из них и пропускает уже доставленные.
+Позиция сохраняется в файл состояния после каждого батча, доставка - "хотя бы
+один раз": если обработчик упал, батч придет снова.
+
+Пример обработчика:
+
+    def handle(events):
+        for event in events:
+            if event['kind'] == 'candles':
+                refresh(event['crypto_id'], event['payload']['from'], event['payload']['to'])
+
+    EventSubscriber(handle, state_path='events_state.json').run()
+
+Из консоли: python3 ingest_events.py --kinds candles,coin_added --state events_state.json
+"""
+import argparse
+import json
+import os
+import select
+import threading
+import time
+from collections import deque
+
+import psycopg2.extensions
+
+from log_config import get_logger
+from metrics import write_atomic
+from parser_ohlcv_db import get_db_connection
+
+log = get_logger('events')
+
+EVENTS_CHANNEL = 'ingest_events'
+EVENT_KINDS = ('coin_added', 'candles', 'coin_id_changed')
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '100'))
+INGEST_BATCH_WAIT = float(os.environ.get('INGEST_BATCH_WAIT', '1'))
+# Сколько последних доставленных id помнить для дочитывания событий, зафиксированных не по порядку
+INGEST_REPLAY_OVERLAP = int(os.environ.get('INGEST_REPLAY_OVERLAP', '1000'))
+RECONNECT_DELAY = 5
+
+
+class EventSubscriber:
+    """Подписчик на события загрузки: уведомления + дочитывание из ingest_events"""
+
+    def __init__(self, handler, after_id=None, state_path=None, kinds=None,
+                 batch_size=INGEST_BATCH_SIZE, batch_wait=INGEST_BATCH_WAIT):
+        self.handler = handler
+        self.state_path = state_path
+        self.kinds = set(kinds) if kinds else None
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.stop_event = threading.Event()
+
+        self.recent = deque(maxlen=INGEST_REPLAY_OVERLAP)
+        self.last_id = after_id
+        if after_id is None and state_path and os.path.exists(state_path):
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.last_id = state['last_id']
+            self.recent.extend(state.get('recent_ids', []))
+        self.seen = set(self.recent)
+
+    def save_state(self):
+        if self.state_path:
+            write_atomic(self.state_path, json.dumps({'last_id': self.last_id, 'recent_ids': list(self.recent)}))
+
+    def deliver(self, events):
+        """Передает обработчику еще не доставленные события и сдвигает позицию"""
+        events = sorted({event['id']: event for event in events if event['id'] not in self.seen}.values(),
+                        key=lambda event: event['id'])
+        if not events:
+            return
+        wanted = [event for event in events if self.kinds is None or event['kind'] in self.kinds]
+        if wanted:
+            self.handler(wanted)
+
+        for event in events:
+            if len(self.recent) == self.recent.maxlen:
+                self.seen.discard(self.recent[0])
+            self.recent.append(event['id'])
+            self.seen.add(event['id'])
+        self.last_id = max(self.last_id, events[-1]['id'])
+        self.save_state()
+
+    def catch_up(self, cursor):
+        """Дочитывает события, пропущенные без подписки, возвращает их количество"""
+        if self.last_id is None:
+            # Первый запуск без позиции: только события после подписки
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM ingest_events")
+            self.last_id = cursor.fetchone()[0]
+            self.save_state()
+            return 0
+
+        position = min(self.recent) - 1 if self.recent else self.last_id
+        total = 0
+        while True:
+            cursor.execute("""
+                SELECT id, kind, crypto_id, payload FROM ingest_events
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s
+            """, (position, self.batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                return total
+            self.deliver([{'id': row[0], 'kind': row[1], 'crypto_id': row[2], 'payload': row[3]} for row in rows])
+            total += len(rows)
+            position = rows[-1][0]
+
+    def listen(self, conn):
+        """Собирает уведомления в батчи до обрыва подключения или остановки"""
+        pending = []
+        first_at = None
+        while not self.stop_event.is_set():
+            timeout = RECONNECT_DELAY if not pending else max(0.0, first_at + self.batch_wait - time.monotonic())
+            if select.select([conn], [], [], timeout) != ([], [], []):
+                conn.poll()
+                while conn.notifies:
+                    pending.append(json.loads(conn.notifies.pop(0).payload))
+                    if first_at is None:
+                        first_at = time.monotonic()
+
+            if pending and (len(pending) >= self.batch_size or time.monotonic() - first_at >= self.batch_wait):
+                self.deliver(pending)
+                pending = []
+                first_at = None
+
+    def run(self):
+        """Подписка с переподключением; завершается после stop()"""
+        while not self.stop_event.is_set():
+            conn = get_db_connection()
+            if conn is None:
+                self.stop_event.wait(RECONNECT_DELAY)
+                continue
+            try:
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {EVENTS_CHANNEL}")
+                    missed = self.catch_up(cursor)
+                log.info(f"👂 Подписка на {EVENTS_CHANNEL} с события #{self.last_id}, дочитано пропущенных: {missed}")
+                self.listen(conn)
+            except Exception as e:
+                # Недоставленные события придут снова при дочитывании
+                log.warning(f"⚠️ Подписка на события прервана: {e}")
+            finally:
+                conn.close()
+            self.stop_event.wait(RECONNECT_DELAY)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def print_events(events):
+    for event in events:
+        print(json.dumps(event, ensure_ascii=False, separators=(',', ':')), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поток событий загрузки (новые монеты, свечи, смена ID) в stdout")
+    parser.add_argument('--after-id', type=int, help="Начать после события с этим id (0 - все события журнала)")
+    parser.add_argument('--state', help="Файл позиции: после перезапуска продолжить с нее")
+    parser.add_argument('--kinds', default='', help=f"Типы событий через запятую ({', '.join(EVENT_KINDS)})")
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    unknown = set(kinds) - set(EVENT_KINDS)
+    if unknown:
+        parser.error(f"неизвестные типы событий: {', '.join(sorted(unknown))}")
+
+    subscriber = EventSubscriber(print_events, after_id=args.after_id, state_path=args.state, kinds=kinds)
+    try:
+        subscriber.run()
+    except KeyboardInterrupt:
+        subscriber.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,10 +11,10 @@ CREATE TABLE IF NOT EXISTS cryptocurrencies (
     added_date DATE,
     added_raw VARCHAR(100),
     coin_gecko_id VARCHAR(255),
+    page_slug VARCHAR(255), -- slug страницы монеты на CoinGecko (coin_identity.py)
     ohlc_table_name VARCHAR(100), -- Имя таблицы с OHLC данными
     first_seen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(symbol, added_date)
+    last_updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Индексы для улучшения производительности
@@ -22,6 +22,10 @@ CREATE INDEX idx_crypto_symbol ON cryptocurrencies(symbol);
 CREATE INDEX idx_crypto_added_date ON cryptocurrencies(added_date);
 CREATE INDEX idx_crypto_gecko_id ON cryptocurrencies(coin_gecko_id);
 CREATE INDEX idx_crypto_ohlc_table ON cryptocurrencies(ohlc_table_name);
+CREATE UNIQUE INDEX uq_crypto_page_slug ON cryptocurrencies(page_slug) WHERE page_slug IS NOT NULL;
+-- Символ и дата уникальны только у монет без slug: две разные монеты с одним тикером,
+-- добавленные в один день, различаются slug страницы (coin_identity.py)
+CREATE UNIQUE INDEX uq_crypto_symbol_added ON cryptocurrencies(symbol, added_date) WHERE page_slug IS NULL;
 
 -- Функция для обновления last_updated_at
 CREATE OR REPLACE FUNCTION update_last_updated_at()
@@ -62,44 +66,41 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
--- Функция для создания OHLC таблицы для конкретной монеты
-CREATE OR REPLACE FUNCTION create_ohlc_table(p_symbol VARCHAR, p_added_date DATE)
+-- Время свечи в UTC из миллисекунд "timestamp" (дата и время не хранятся отдельно).
+-- Старый столбец datetime парсер заполнял по локальному времени процесса
+-- (в Docker-образе это UTC, при запуске на хосте с другим поясом значения расходятся)
+CREATE OR REPLACE FUNCTION ohlc_datetime(p_timestamp BIGINT)
+RETURNS TIMESTAMP AS $$
+    SELECT to_timestamp(p_timestamp / 1000.0) AT TIME ZONE 'UTC';
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Функция для создания OHLC таблицы с заданным именем
+CREATE OR REPLACE FUNCTION create_ohlc_table_named(p_table_name VARCHAR)
 RETURNS VARCHAR AS $$
 DECLARE
-    v_table_name VARCHAR;
+    v_table_name VARCHAR := p_table_name;
     v_sql TEXT;
 BEGIN
-    -- Получаем безопасное имя таблицы
-    v_table_name := safe_table_name(p_symbol, p_added_date);
-
     -- Проверяем, существует ли уже таблица
     IF NOT EXISTS (SELECT 1 FROM information_schema.tables
                    WHERE table_schema = 'public'
                    AND table_name = v_table_name) THEN
 
-        -- Создаем таблицу OHLC
+        -- Компактная OHLC таблица: одно поле времени (первичный ключ - единственный индекс),
+        -- цены в DOUBLE PRECISION, объем NULL пока неизвестен.
+        -- Дата и время вычисляются через ohlc_datetime("timestamp")
         v_sql := format('
             CREATE TABLE %I (
-                id SERIAL PRIMARY KEY,
-                timestamp BIGINT NOT NULL UNIQUE,
-                datetime TIMESTAMP NOT NULL,
-                date DATE NOT NULL,
-                time TIME NOT NULL,
-                open DECIMAL(20, 8) NOT NULL,
-                high DECIMAL(20, 8) NOT NULL,
-                low DECIMAL(20, 8) NOT NULL,
-                close DECIMAL(20, 8) NOT NULL,
-                volume DECIMAL(20, 8) DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                "timestamp" BIGINT PRIMARY KEY,
+                open DOUBLE PRECISION NOT NULL,
+                high DOUBLE PRECISION NOT NULL,
+                low DOUBLE PRECISION NOT NULL,
+                close DOUBLE PRECISION NOT NULL,
+                volume DOUBLE PRECISION
             )', v_table_name);
 
         EXECUTE v_sql;
 
-        -- Создаем индексы
-        EXECUTE format('CREATE INDEX idx_%I_timestamp ON %I(timestamp)', v_table_name, v_table_name);
-        EXECUTE format('CREATE INDEX idx_%I_datetime ON %I(datetime)', v_table_name, v_table_name);
-        EXECUTE format('CREATE INDEX idx_%I_date ON %I(date)', v_table_name, v_table_name);
-
         RAISE NOTICE 'Created OHLC table: %', v_table_name;
     END IF;
 
@@ -107,6 +108,28 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Функция для создания OHLC таблицы для конкретной монеты
+CREATE OR REPLACE FUNCTION create_ohlc_table(p_symbol VARCHAR, p_added_date DATE)
+RETURNS VARCHAR AS $$
+    SELECT create_ohlc_table_named(safe_table_name(p_symbol, p_added_date));
+$$ LANGUAGE sql;
+
+-- Имя OHLC таблицы новой монеты: ohlc_<символ>_<дата>, а если это имя уже занято
+-- другой монетой с тем же символом и датой (другой slug страницы) - с хэшем slug
+CREATE OR REPLACE FUNCTION ohlc_table_name_for(p_symbol VARCHAR, p_added_date DATE, p_page_slug VARCHAR)
+RETURNS VARCHAR AS $$
+DECLARE
+    v_table_name VARCHAR;
+BEGIN
+    v_table_name := safe_table_name(p_symbol, p_added_date);
+    IF p_page_slug IS NOT NULL
+       AND EXISTS (SELECT 1 FROM cryptocurrencies WHERE ohlc_table_name = v_table_name) THEN
+        v_table_name := LEFT(v_table_name, 54) || '_' || LEFT(MD5(p_page_slug), 8);
+    END IF;
+    RETURN v_table_name;
+END;
+$$ LANGUAGE plpgsql;
+
 -- Триггер для автоматического создания OHLC таблицы при добавлении новой криптовалюты
 CREATE OR REPLACE FUNCTION create_ohlc_table_trigger()
 RETURNS TRIGGER AS $$
@@ -114,7 +137,7 @@ DECLARE
     v_table_name VARCHAR;
 BEGIN
     -- Создаем таблицу OHLC для новой монеты
-    v_table_name := create_ohlc_table(NEW.symbol, NEW.added_date);
+    v_table_name := create_ohlc_table_named(ohlc_table_name_for(NEW.symbol, NEW.added_date, NEW.page_slug));
 
     -- Обновляем запись с именем таблицы
     NEW.ohlc_table_name := v_table_name;
@@ -146,7 +169,7 @@ FROM cryptocurrencies c;
 -- Функция для получения последних OHLC данных монеты
 CREATE OR REPLACE FUNCTION get_latest_ohlc(p_symbol VARCHAR, p_added_date DATE, p_limit INTEGER DEFAULT 10)
 RETURNS TABLE (
-    timestamp BIGINT,
+    "timestamp" BIGINT,
     datetime TIMESTAMP,
     open DECIMAL,
     high DECIMAL,
@@ -168,9 +191,10 @@ BEGIN
 
     -- Выполняем запрос
     v_sql := format('
-        SELECT timestamp, datetime, open, high, low, close
+        SELECT "timestamp", ohlc_datetime("timestamp"),
+               open::DECIMAL, high::DECIMAL, low::DECIMAL, close::DECIMAL
         FROM %I
-        ORDER BY timestamp DESC
+        ORDER BY "timestamp" DESC
         LIMIT %s
     ', v_table_name, p_limit);
 
@@ -178,6 +202,312 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Снимок последней свечи каждой монеты (обновляется парсером при загрузке OHLC)
+CREATE TABLE IF NOT EXISTS latest_candle (
+    crypto_id INTEGER PRIMARY KEY REFERENCES cryptocurrencies(id) ON DELETE CASCADE,
+    "timestamp" BIGINT NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_latest_candle_timestamp ON latest_candle("timestamp");
+
+-- Последние свечи по списку монет (NULL - все монеты) одним запросом к снимку
+CREATE OR REPLACE FUNCTION get_latest_candles(p_symbols VARCHAR[] DEFAULT NULL)
+RETURNS TABLE (
+    symbol VARCHAR,
+    added_date DATE,
+    "timestamp" BIGINT,
+    datetime TIMESTAMP,
+    open DECIMAL,
+    high DECIMAL,
+    low DECIMAL,
+    close DECIMAL
+) AS $$
+    SELECT c.symbol, c.added_date, lc."timestamp", lc.datetime,
+           lc.open, lc.high, lc.low, lc.close
+    FROM latest_candle lc
+    JOIN cryptocurrencies c ON c.id = lc.crypto_id
+    WHERE p_symbols IS NULL OR c.symbol = ANY(p_symbols)
+    ORDER BY c.symbol, c.added_date;
+$$ LANGUAGE sql STABLE;
+
+-- Свечи нескольких монет за период: один UNION ALL по их OHLC таблицам за один вызов
+CREATE OR REPLACE FUNCTION get_ohlc_range(p_symbols VARCHAR[], p_from TIMESTAMP, p_to TIMESTAMP DEFAULT NULL)
+RETURNS TABLE (
+    symbol VARCHAR,
+    added_date DATE,
+    "timestamp" BIGINT,
+    datetime TIMESTAMP,
+    open DECIMAL,
+    high DECIMAL,
+    low DECIMAL,
+    close DECIMAL
+) AS $$
+DECLARE
+    v_from_ms BIGINT;
+    v_to_ms BIGINT;
+    v_sql TEXT;
+BEGIN
+    -- Границы периода в миллисекундах, как в столбце "timestamp" OHLC таблиц
+    v_from_ms := (EXTRACT(EPOCH FROM p_from AT TIME ZONE 'UTC') * 1000)::BIGINT;
+    v_to_ms := (EXTRACT(EPOCH FROM COALESCE(p_to AT TIME ZONE 'UTC', NOW())) * 1000)::BIGINT;
+
+    SELECT string_agg(format('
+        SELECT %L::VARCHAR, %L::DATE, o."timestamp", ohlc_datetime(o."timestamp"),
+               o.open::DECIMAL, o.high::DECIMAL, o.low::DECIMAL, o.close::DECIMAL
+        FROM %I o
+        WHERE o."timestamp" BETWEEN %s AND %s',
+        c.symbol, c.added_date, c.ohlc_table_name, v_from_ms, v_to_ms), ' UNION ALL ')
+    INTO v_sql
+    FROM cryptocurrencies c
+    WHERE c.symbol = ANY(p_symbols)
+    AND c.ohlc_table_name IS NOT NULL
+    AND to_regclass(c.ohlc_table_name) IS NOT NULL;
+
+    IF v_sql IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY EXECUTE v_sql || ' ORDER BY 1, 2, 3';
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Дневные бары монет, чьи OHLC таблицы удалены по сроку хранения
+CREATE TABLE IF NOT EXISTS ohlc_daily_archive (
+    symbol VARCHAR(50) NOT NULL,
+    added_date DATE NOT NULL,
+    coin_gecko_id VARCHAR(255),
+    date DATE NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    volume DOUBLE PRECISION,
+    candles_count INTEGER NOT NULL,
+    PRIMARY KEY (symbol, added_date, date)
+);
+
+-- Журнал retention.py: какие монеты заархивированы и удалены, сколько места освобождено
+CREATE TABLE IF NOT EXISTS retention_log (
+    id SERIAL PRIMARY KEY,
+    crypto_id INTEGER NOT NULL UNIQUE,
+    symbol VARCHAR(50) NOT NULL,
+    added_date DATE,
+    ohlc_table_name VARCHAR(100),
+    archive_path TEXT,
+    rows_archived INTEGER DEFAULT 0,
+    daily_bars INTEGER DEFAULT 0,
+    bytes_reclaimed BIGINT DEFAULT 0,
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Состояние планировщика обновления свечей (refresh_scheduler.py)
+CREATE TABLE IF NOT EXISTS coin_refresh_state (
+    crypto_id INTEGER PRIMARY KEY REFERENCES cryptocurrencies(id) ON DELETE CASCADE,
+    next_due_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    priority DOUBLE PRECISION NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'active', -- active | dead
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    flat_runs INTEGER NOT NULL DEFAULT 0,
+    volatility DOUBLE PRECISION,
+    last_attempt_at TIMESTAMP,
+    last_success_at TIMESTAMP,
+    last_outcome VARCHAR(20), -- ok | flat | failed
+    claimed_by VARCHAR(100), -- воркер, взявший задание (parser_worker.py)
+    claimed_until TIMESTAMP -- срок аренды задания
+);
+
+CREATE INDEX IF NOT EXISTS idx_refresh_state_due ON coin_refresh_state(next_due_at);
+
+-- Общий лимит запросов к API для воркеров: счетчик запросов в каждой минуте
+CREATE TABLE IF NOT EXISTS api_rate_budget (
+    window_start TIMESTAMP PRIMARY KEY,
+    requests INTEGER NOT NULL DEFAULT 0
+);
+
+-- Журнал запусков парсера (run_ledger.py): cron, цикл обновления свечей демона или воркер
+CREATE TABLE IF NOT EXISTS parser_runs (
+    id BIGSERIAL PRIMARY KEY,
+    mode VARCHAR(20) NOT NULL, -- cron | daemon | worker
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP NOT NULL,
+    duration_seconds DOUBLE PRECISION NOT NULL,
+    status VARCHAR(20) NOT NULL, -- ok | no_coins | page_failed | stopped
+    stage_seconds JSONB NOT NULL DEFAULT '{}', -- длительность этапов: {"page_fetch": 1.2, ...}
+    coins_parsed INTEGER NOT NULL DEFAULT 0,
+    coins_refreshed INTEGER NOT NULL DEFAULT 0,
+    api_calls INTEGER NOT NULL DEFAULT 0,
+    rate_limited INTEGER NOT NULL DEFAULT 0,
+    candles_inserted INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    code_version VARCHAR(64),
+    host VARCHAR(100)
+);
+
+CREATE INDEX IF NOT EXISTS idx_parser_runs_started ON parser_runs(started_at);
+
+-- Тренды по дням: длительность, пропускная способность и доля 429
+CREATE OR REPLACE VIEW parser_runs_daily AS
+SELECT
+    started_at::date AS day,
+    mode,
+    COUNT(*) AS runs,
+    COUNT(*) FILTER (WHERE status <> 'ok') AS failed_runs,
+    ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_seconds)::numeric, 1) AS median_seconds,
+    ROUND(MAX(duration_seconds)::numeric, 1) AS max_seconds,
+    SUM(coins_refreshed) AS coins_refreshed,
+    SUM(api_calls) AS api_calls,
+    SUM(rate_limited) AS rate_limited,
+    SUM(candles_inserted) AS candles_inserted,
+    ROUND(SUM(candles_inserted) / NULLIF(SUM(duration_seconds), 0)::numeric, 2) AS candles_per_second,
+    SUM(errors) AS errors
+FROM parser_runs
+GROUP BY started_at::date, mode;
+
+-- Уведомления о новых данных для сброса кэша сервиса чтения (read_service.py)
+-- Новые свечи монеты: снимок latest_candle обновляется в той же транзакции, что и OHLC таблица,
+-- уведомление доставляется после commit (с id монеты)
+CREATE OR REPLACE FUNCTION notify_candles_ingested()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('candles_ingested', COALESCE(NEW.crypto_id, OLD.crypto_id)::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER latest_candle_notify
+    AFTER INSERT OR UPDATE OR DELETE ON latest_candle
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_candles_ingested();
+
+-- Изменения листинга: одно уведомление на запрос, а не на строку
+CREATE OR REPLACE FUNCTION notify_listing_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('listing_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER cryptocurrencies_notify
+    AFTER INSERT OR UPDATE OR DELETE ON cryptocurrencies
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_listing_changed();
+
+-- Метрики монет по новым свечам (coin_metrics.py): доходность, просадка от максимума
+-- с листинга, волатильность за 7 дней и скользящее состояние для инкрементального пересчета
+CREATE TABLE IF NOT EXISTS coin_metrics (
+    crypto_id INTEGER PRIMARY KEY REFERENCES cryptocurrencies(id) ON DELETE CASCADE,
+    "timestamp" BIGINT NOT NULL,
+    close DOUBLE PRECISION,
+    return_4h DOUBLE PRECISION,
+    return_24h DOUBLE PRECISION,
+    return_7d DOUBLE PRECISION,
+    listing_high DOUBLE PRECISION,
+    drawdown DOUBLE PRECISION,
+    volatility_7d DOUBLE PRECISION,
+    recent_timestamps BIGINT[] NOT NULL DEFAULT '{}',
+    recent_closes DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Метрики по сетям (chain)
+CREATE OR REPLACE VIEW coin_metrics_by_chain AS
+SELECT
+    COALESCE(NULLIF(c.chain, ''), 'unknown') AS chain,
+    COUNT(*) AS coins,
+    AVG(m.return_24h) AS avg_return_24h,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY m.return_24h) AS median_return_24h,
+    AVG(m.return_7d) AS avg_return_7d,
+    AVG(m.drawdown) AS avg_drawdown,
+    AVG(m.volatility_7d) AS avg_volatility_7d
+FROM coin_metrics m
+JOIN cryptocurrencies c ON c.id = m.crypto_id
+GROUP BY COALESCE(NULLIF(c.chain, ''), 'unknown');
+
+-- Журнал событий загрузки (ingest_events.py): новая монета, новые свечи с диапазоном, смена ID CoinGecko.
+-- Каждое событие пишется в ingest_events и уходит в канал ingest_events после commit;
+-- подписчик, пропустивший уведомления, дочитывает события из таблицы по id
+CREATE TABLE IF NOT EXISTS ingest_events (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL, -- coin_added, candles, coin_id_changed
+    crypto_id INTEGER NOT NULL, -- без внешнего ключа: события переживают удаление монеты ретеншном
+    payload JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_events_created_at ON ingest_events(created_at);
+
+CREATE OR REPLACE FUNCTION publish_ingest_event(p_kind VARCHAR, p_crypto_id INTEGER, p_payload JSONB)
+RETURNS VOID AS $$
+DECLARE
+    v_id BIGINT;
+BEGIN
+    INSERT INTO ingest_events (kind, crypto_id, payload)
+    VALUES (p_kind, p_crypto_id, p_payload)
+    RETURNING id INTO v_id;
+
+    PERFORM pg_notify('ingest_events', json_build_object(
+        'id', v_id, 'kind', p_kind, 'crypto_id', p_crypto_id, 'payload', p_payload)::TEXT);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Новая монета и смена ID CoinGecko
+CREATE OR REPLACE FUNCTION publish_coin_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM publish_ingest_event('coin_added', NEW.id, jsonb_build_object(
+            'symbol', NEW.symbol, 'name', NEW.name, 'chain', NEW.chain,
+            'added_date', NEW.added_date, 'coin_gecko_id', NEW.coin_gecko_id));
+    ELSE
+        PERFORM publish_ingest_event('coin_id_changed', NEW.id, jsonb_build_object(
+            'symbol', NEW.symbol, 'old', OLD.coin_gecko_id, 'new', NEW.coin_gecko_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER cryptocurrencies_coin_added_event
+    AFTER INSERT ON cryptocurrencies
+    FOR EACH ROW
+    EXECUTE FUNCTION publish_coin_event();
+
+CREATE TRIGGER cryptocurrencies_coin_id_event
+    AFTER UPDATE OF coin_gecko_id ON cryptocurrencies
+    FOR EACH ROW
+    WHEN (OLD.coin_gecko_id IS DISTINCT FROM NEW.coin_gecko_id)
+    EXECUTE FUNCTION publish_coin_event();
+
+-- Новые свечи: снимок latest_candle сдвигается вперед в той же транзакции, что и запись в OHLC таблицу,
+-- свечи только дописываются, поэтому новые свечи - (from, to]; from = null у первой загрузки монеты
+CREATE OR REPLACE FUNCTION publish_candles_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM publish_ingest_event('candles', NEW.crypto_id, jsonb_build_object(
+        'symbol', (SELECT symbol FROM cryptocurrencies WHERE id = NEW.crypto_id),
+        'from', CASE WHEN TG_OP = 'UPDATE' THEN OLD."timestamp" END,
+        'to', NEW."timestamp"));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER latest_candle_insert_event
+    AFTER INSERT ON latest_candle
+    FOR EACH ROW
+    EXECUTE FUNCTION publish_candles_event();
+
+CREATE TRIGGER latest_candle_update_event
+    AFTER UPDATE ON latest_candle
+    FOR EACH ROW
+    WHEN (NEW."timestamp" > OLD."timestamp")
+    EXECUTE FUNCTION publish_candles_event();
+
 -- Функция для очистки старых OHLC таблиц
 CREATE OR REPLACE FUNCTION cleanup_old_ohlc_tables(p_days_to_keep INTEGER DEFAULT 90)
 RETURNS INTEGER AS $$
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Логирование парсера: уровни, текстовый или JSON формат и буферизованный вывод.
+
+Вместо print(..., flush=True) на каждую строку записи копятся в буфере и
+выводятся одной записью: при заполнении буфера (LOG_BUFFER строк), раз в
+LOG_FLUSH_INTERVAL секунд, сразу для WARNING и выше и при завершении процесса.
+
+LOG_LEVEL - DEBUG, INFO, WARNING, ERROR (по умолчанию INFO)
+LOG_FORMAT - text или json (одна JSON запись на строку)
+"""
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOG_BUFFER = int(os.environ.get('LOG_BUFFER', '200'))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', '2'))
+
+# Поля LogRecord, которые не относятся к дополнительным данным записи
+STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+_setup_lock = threading.Lock()
+_configured = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON запись на строку; поля из extra= попадают в запись как есть"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage().strip()
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BufferedStreamHandler(logging.Handler):
+    """Копит отформатированные строки и пишет их в поток одним вызовом"""
+
+    def __init__(self, stream, capacity, flush_interval):
+        super().__init__()
+        self.stream = stream
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.monotonic()
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self.lock:
+            self.buffer.append(line)
+            urgent = (record.levelno >= logging.WARNING or len(self.buffer) >= self.capacity
+                      or time.monotonic() - self.last_flush >= self.flush_interval)
+        if urgent:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.buffer:
+                return
+            data = '\n'.join(self.buffer) + '\n'
+            self.buffer = []
+            self.last_flush = time.monotonic()
+            try:
+                self.stream.write(data)
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass
+
+
+def start_flush_thread(handler):
+    """Периодически сбрасывает буфер, чтобы строки не задерживались при простое (демон)"""
+
+    def flush_loop():
+        while True:
+            time.sleep(handler.flush_interval)
+            handler.flush()
+
+    thread = threading.Thread(target=flush_loop, name="log-flush", daemon=True)
+    thread.start()
+
+
+def setup_logging():
+    """Настраивает логгер 'parser' один раз на процесс"""
+    global _configured
+
+    with _setup_lock:
+        if _configured:
+            return
+        _configured = True
+
+        if LOG_FORMAT == 'json':
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s', '%Y-%m-%d %H:%M:%S')
+
+        handler = BufferedStreamHandler(sys.stdout, max(LOG_BUFFER, 1), LOG_FLUSH_INTERVAL)
+        handler.setFormatter(formatter)
+
+        logger = logging.getLogger('parser')
+        logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+        atexit.register(handler.flush)
+        if LOG_BUFFER > 1:
+            start_flush_thread(handler)
+
+
+def get_logger(name):
+    """Логгер модуля парсера (parser.<name>)"""
+    setup_logging()
+    return logging.getLogger(f'parser.{name}')
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+4-часовые свечи с объемом из ответа /coins/{id}/market_chart.
+
+/ohlc не возвращает объем, поэтому колонка volume OHLC таблиц оставалась
+пустой. /market_chart за один запрос отдает цены (prices) и объемы
+(total_volumes) - при days от 2 до 90 это почасовые точки. Точки группируются
+в те же 4-часовые интервалы, что и свечи /ohlc (timestamp свечи - время ее
+закрытия): open/close - первая и последняя цена интервала, high/low -
+максимум и минимум.
+
+total_volumes - скользящий объем торгов за 24 часа, а не объем за час,
+поэтому объемы интервала не суммируются: объем свечи - среднее значение
+24-часового объема в интервале, пересчитанное на 4 часа (x 4/24).
+
+Последняя точка /market_chart - текущий момент, поэтому последний интервал
+обычно еще не закрыт: такие свечи (время закрытия в будущем) отбрасываются,
+иначе незавершенная свеча заняла бы свой timestamp в OHLC таблице навсегда.
+
+С numpy интервалы считаются одним векторным проходом (reduceat/bincount),
+без numpy - обычным циклом по точкам.
+"""
+import os
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Источник свечей: ohlc - /ohlc (без объема), market_chart - /market_chart (OHLC и объем одним запросом)
+CANDLE_SOURCE = os.environ.get('CANDLE_SOURCE', 'ohlc')
+
+CANDLE_INTERVAL_MS = 4 * 60 * 60 * 1000
+VOLUME_WINDOW_MS = 24 * 60 * 60 * 1000
+
+
+def bucket_end(timestamp, interval_ms=CANDLE_INTERVAL_MS):
+    """Время закрытия интервала, в который попадает точка"""
+    return -(-int(timestamp) // interval_ms) * interval_ms
+
+
+def bucket_python(prices, total_volumes, interval_ms=CANDLE_INTERVAL_MS):
+    """Свечи [timestamp, open, high, low, close, volume] циклом по точкам"""
+    candles = {}
+    for timestamp, price in sorted(prices):
+        if price is None:
+            continue
+        end = bucket_end(timestamp, interval_ms)
+        candle = candles.get(end)
+        if candle is None:
+            candles[end] = [end, price, price, price, price, None]
+        else:
+            candle[2] = max(candle[2], price)
+            candle[3] = min(candle[3], price)
+            candle[4] = price
+
+    volumes = {}
+    for timestamp, volume in total_volumes:
+        if volume is not None:
+            volumes.setdefault(bucket_end(timestamp, interval_ms), []).append(volume)
+    for end, values in volumes.items():
+        if end in candles:
+            candles[end][5] = sum(values) / len(values) * interval_ms / VOLUME_WINDOW_MS
+
+    return [candles[end] for end in sorted(candles)]
+
+
+def bucket_numpy(prices, total_volumes, interval_ms=CANDLE_INTERVAL_MS):
+    """Свечи [timestamp, open, high, low, close, volume] векторным проходом"""
+    points = np.asarray([point for point in prices if point[1] is not None], dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return []
+    points = points[np.argsort(points[:, 0], kind='stable')]
+    ends = -(-points[:, 0].astype(np.int64) // interval_ms) * interval_ms
+    price = points[:, 1]
+
+    keys, starts = np.unique(ends, return_index=True)
+    lasts = np.append(starts[1:], len(price)) - 1
+    high = np.maximum.reduceat(price, starts)
+    low = np.minimum.reduceat(price, starts)
+
+    volume = np.full(len(keys), np.nan)
+    volume_points = np.asarray([point for point in total_volumes if point[1] is not None],
+                               dtype=np.float64).reshape(-1, 2)
+    if len(volume_points):
+        volume_ends = -(-volume_points[:, 0].astype(np.int64) // interval_ms) * interval_ms
+        positions = np.searchsorted(keys, volume_ends).clip(max=len(keys) - 1)
+        matched = keys[positions] == volume_ends
+        sums = np.bincount(positions[matched], weights=volume_points[matched, 1], minlength=len(keys))
+        counts = np.bincount(positions[matched], minlength=len(keys))
+        has_volume = counts > 0
+        volume[has_volume] = sums[has_volume] / counts[has_volume] * interval_ms / VOLUME_WINDOW_MS
+
+    return [
+        [int(key), float(open_), float(high_), float(low_), float(close), None if np.isnan(vol) else float(vol)]
+        for key, open_, high_, low_, close, vol in zip(keys, price[starts], high, low, price[lasts], volume)
+    ]
+
+
+def bucket_market_chart(data, interval_ms=CANDLE_INTERVAL_MS, now_ms=None):
+    """Закрытые свечи [timestamp, open, high, low, close, volume] из ответа /market_chart"""
+    prices = data.get('prices') or []
+    total_volumes = data.get('total_volumes') or []
+    if np is not None:
+        candles = bucket_numpy(prices, total_volumes, interval_ms)
+    else:
+        candles = bucket_python(prices, total_volumes, interval_ms)
+
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    return [candle for candle in candles if candle[0] <= now_ms]
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Объединение дубликатов монет в cryptocurrencies и их OHLC таблиц.
+
+До появления coin_identity.py одна монета могла получить несколько строк
+(symbol, added_date) из-за сдвига даты добавления между запусками - и для
+каждой строки триггер создавал свою OHLC таблицу. Дубликатами считаются
+строки с одинаковым page_slug, с одинаковыми символом и ID CoinGecko, или с
+одинаковым символом и датами добавления в пределах допуска (если slug строк
+не противоречат друг другу).
+
+В каждой группе остается самая ранняя строка: свечи остальных переносятся в
+ее таблицу (ON CONFLICT DO NOTHING), их таблицы и строки удаляются (если таблицы
+у оставшейся строки нет, она забирает таблицу первого дубликата), slug и ID
+CoinGecko переносятся, снимок последней свечи пересчитывается. Каждая группа -
+отдельная транзакция. Когда дубликатов по slug не осталось, создается
+уникальный индекс uq_crypto_page_slug.
+"""
+import argparse
+import sys
+
+from coin_identity import ADDED_DATE_TOLERANCE_DAYS
+from log_config import get_logger
+from parser_ohlcv_db import get_db_connection
+
+log = get_logger('merge')
+
+LOCK_TIMEOUT = '5s'
+
+
+def load_coins(cursor):
+    """Все монеты с полями для поиска дубликатов"""
+    cursor.execute("""
+        SELECT id, name, symbol, added_date, page_slug, coin_gecko_id, ohlc_table_name
+        FROM cryptocurrencies
+        ORDER BY id
+    """)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def same_coin(a, b, tolerance):
+    """Одна ли это монета"""
+    if a['page_slug'] and b['page_slug']:
+        return a['page_slug'] == b['page_slug']
+    if a['symbol'] != b['symbol']:
+        return False
+    if a['coin_gecko_id'] and a['coin_gecko_id'] == b['coin_gecko_id']:
+        return True
+    return bool(a['added_date'] and b['added_date']
+                and abs((a['added_date'] - b['added_date']).days) <= tolerance)
+
+
+def find_duplicate_groups(coins, tolerance=ADDED_DATE_TOLERANCE_DAYS):
+    """Группы дубликатов (списки строк по возрастанию id, в группе больше одной строки)"""
+    parent = {coin['id']: coin['id'] for coin in coins}
+    slugs = {coin['id']: {coin['page_slug']} - {None} for coin in coins}
+
+    def root(coin_id):
+        while parent[coin_id] != coin_id:
+            parent[coin_id] = parent[parent[coin_id]]
+            coin_id = parent[coin_id]
+        return coin_id
+
+    def union(a, b):
+        root_a, root_b = root(a), root(b)
+        # Группа не может объединить монеты с разными slug (через строку без slug)
+        if root_a == root_b or (slugs[root_a] and slugs[root_b] and slugs[root_a] != slugs[root_b]):
+            return
+        parent[root_b] = root_a
+        slugs[root_a] |= slugs[root_b]
+
+    by_symbol = {}
+    by_slug = {}
+    for coin in coins:
+        by_symbol.setdefault(coin['symbol'], []).append(coin)
+        if coin['page_slug']:
+            by_slug.setdefault(coin['page_slug'], []).append(coin)
+
+    for candidates in list(by_symbol.values()) + list(by_slug.values()):
+        for i, a in enumerate(candidates):
+            for b in candidates[i + 1:]:
+                if same_coin(a, b, tolerance):
+                    union(a['id'], b['id'])
+
+    groups = {}
+    for coin in coins:
+        groups.setdefault(root(coin['id']), []).append(coin)
+    return [sorted(group, key=lambda coin: coin['id']) for group in groups.values() if len(group) > 1]
+
+
+def table_exists(cursor, table_name):
+    """Существует ли таблица"""
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+    return cursor.fetchone()[0]
+
+
+def refresh_latest_candle(cursor, crypto_id, table_name):
+    """Пересчитывает снимок последней свечи монеты по ее таблице"""
+    cursor.execute(f"""
+        INSERT INTO latest_candle (crypto_id, "timestamp", datetime, open, high, low, close)
+        SELECT %s, "timestamp", ohlc_datetime("timestamp"), open, high, low, close
+        FROM {table_name}
+        ORDER BY "timestamp" DESC
+        LIMIT 1
+        ON CONFLICT (crypto_id) DO UPDATE SET
+            "timestamp" = EXCLUDED."timestamp",
+            datetime = EXCLUDED.datetime,
+            open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            updated_at = CURRENT_TIMESTAMP
+    """, (crypto_id,))
+
+
+def merge_group(cursor, group):
+    """Переносит свечи дубликатов в самую раннюю строку группы, возвращает перенесенные свечи"""
+    survivor, duplicates = group[0], group[1:]
+    target = survivor['ohlc_table_name']
+    target_exists = bool(target) and table_exists(cursor, target)
+    moved = 0
+
+    for duplicate in duplicates:
+        source = duplicate['ohlc_table_name']
+        if source and source != target and table_exists(cursor, source):
+            if target_exists:
+                cursor.execute(f"""
+                    INSERT INTO {target} ("timestamp", open, high, low, close, volume)
+                    SELECT "timestamp", open, high, low, close, volume FROM {source}
+                    ON CONFLICT ("timestamp") DO NOTHING
+                """)
+                moved += cursor.rowcount
+                cursor.execute(f"DROP TABLE IF EXISTS {source}")
+            else:
+                # У оставшейся строки таблицы нет: она забирает таблицу дубликата целиком
+                cursor.execute(f"SELECT COUNT(*) FROM {source}")
+                moved += cursor.fetchone()[0]
+                cursor.execute("UPDATE cryptocurrencies SET ohlc_table_name = %s WHERE id = %s",
+                               (source, survivor['id']))
+                target, target_exists = source, True
+
+        # latest_candle и coin_refresh_state удаляются каскадом
+        cursor.execute("DELETE FROM cryptocurrencies WHERE id = %s", (duplicate['id'],))
+
+    # slug и ID - после удаления дубликатов (уникальный индекс по slug)
+    cursor.execute("""
+        UPDATE cryptocurrencies SET
+            page_slug = COALESCE(page_slug, %s),
+            coin_gecko_id = COALESCE(coin_gecko_id, %s)
+        WHERE id = %s
+    """, (
+        next((coin['page_slug'] for coin in duplicates if coin['page_slug']), None),
+        next((coin['coin_gecko_id'] for coin in duplicates if coin['coin_gecko_id']), None),
+        survivor['id']
+    ))
+
+    if target_exists:
+        refresh_latest_candle(cursor, survivor['id'], target)
+    return moved
+
+
+def ensure_unique_slug_index(cursor):
+    """Уникальный индекс по slug, если дубликатов по slug больше нет"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT page_slug FROM cryptocurrencies
+            WHERE page_slug IS NOT NULL
+            GROUP BY page_slug HAVING COUNT(*) > 1
+        ) duplicated
+    """)
+    if cursor.fetchone()[0]:
+        return False
+
+    cursor.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_crypto_page_slug
+        ON cryptocurrencies(page_slug) WHERE page_slug IS NOT NULL
+    """)
+    cursor.execute("DROP INDEX IF EXISTS idx_crypto_page_slug")
+    return True
+
+
+def run_merge(tolerance=ADDED_DATE_TOLERANCE_DAYS, dry_run=False):
+    """Находит и объединяет дубликаты, возвращает итоги: групп, удалено строк, перенесено свечей"""
+    conn = get_db_connection()
+    if not conn:
+        log.error("❌ Не удалось подключиться к базе данных")
+        return None
+
+    cursor = conn.cursor()
+    totals = {'groups': 0, 'removed': 0, 'moved': 0}
+    try:
+        cursor.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+        groups = find_duplicate_groups(load_coins(cursor), tolerance)
+        conn.commit()
+        log.info(f"🔎 Найдено групп дубликатов: {len(groups)} (допуск даты: {tolerance} дн.)")
+
+        for group in groups:
+            survivor = group[0]
+            removed = ', '.join(f"#{coin['id']} {coin['added_date']}" for coin in group[1:])
+            log.info(f"   {survivor['symbol']} ({survivor['name']}): остается #{survivor['id']} "
+                     f"{survivor['added_date']} {survivor['ohlc_table_name']}, удаляются: {removed}")
+            if dry_run:
+                continue
+
+            try:
+                moved = merge_group(cursor, group)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                log.error(f"❌ Ошибка объединения {survivor['symbol']}: {e}")
+                continue
+
+            totals['groups'] += 1
+            totals['removed'] += len(group) - 1
+            totals['moved'] += moved
+
+        if dry_run:
+            log.info("🔎 Dry run: изменения не внесены")
+            return totals
+
+        if ensure_unique_slug_index(cursor):
+            log.info("🔒 Уникальный индекс uq_crypto_page_slug создан")
+        conn.commit()
+
+        log.info(f"📊 Объединено групп: {totals['groups']}, удалено строк и таблиц: {totals['removed']}, "
+                 f"перенесено свечей: {totals['moved']}")
+        return totals
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Объединение дубликатов монет и их OHLC таблиц")
+    parser.add_argument('--tolerance', type=int, default=ADDED_DATE_TOLERANCE_DAYS,
+                        help="Допуск даты добавления (дни) для монет без slug")
+    parser.add_argument('--dry-run', action='store_true', help="Только показать группы дубликатов")
+    args = parser.parse_args()
+
+    if run_merge(args.tolerance, args.dry_run) is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
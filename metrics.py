@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Метрики парсера: счетчики, гистограммы и значения по этапам работы.
+
+Метрики копятся в памяти процесса и выгружаются:
+- в формате Prometheus: textfile для node_exporter (METRICS_TEXTFILE) или /metrics демона;
+- в JSON сводку запуска (METRICS_SUMMARY_PATH).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from log_config import get_logger
+
+log = get_logger('metrics')
+
+METRICS_TEXTFILE = os.environ.get('METRICS_TEXTFILE', '')
+METRICS_SUMMARY_PATH = os.environ.get('METRICS_SUMMARY_PATH', './logs/parser_metrics.json')
+
+# Границы гистограмм в секундах (для размеров - задаются отдельно)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HELP = {
+    'parser_page_fetch_seconds': 'Время загрузки страницы листинга',
+    'parser_page_bytes': 'Размер страницы листинга',
+    'parser_rows_parsed_total': 'Монет распарсено со страницы',
+    'parser_api_requests_total': 'Запросов к CoinGecko API',
+    'parser_api_request_seconds': 'Время ответа CoinGecko API',
+    'parser_api_response_bytes_total': 'Байт получено от CoinGecko API',
+    'parser_rate_limited_total': 'Ответов 429 от CoinGecko',
+    'parser_retry_sleep_seconds_total': 'Секунд ожидания после 429',
+    'parser_coin_id_lookups_total': 'Поиск ID монеты по источнику результата',
+    'parser_db_round_trips_total': 'Запросов к PostgreSQL',
+    'parser_db_query_seconds': 'Время запросов к PostgreSQL',
+    'parser_coins_saved_total': 'Монет записано в БД',
+    'parser_ohlc_rows_inserted_total': 'Новых свечей записано в БД',
+    'parser_save_errors_total': 'Ошибок записи монет в БД',
+    'parser_sink_errors_total': 'Ошибок записи в приемники данных',
+    'parser_stage_seconds': 'Время этапа запуска',
+    'parser_last_success_timestamp_seconds': 'Время последнего успешного запуска (unix)',
+    'parser_last_listing_poll_timestamp_seconds': 'Время последней загрузки листинга демоном (unix)',
+    'parser_read_cache_total': 'Запросов к сервису чтения по результату кэша',
+    'parser_read_query_seconds': 'Время запроса сервиса чтения к PostgreSQL',
+    'parser_read_cache_invalidations_total': 'Ответов сброшено из кэша по уведомлениям',
+}
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+def label_key(labels):
+    """Метки в виде ключа словаря"""
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Увеличивает счетчик"""
+    key = (name, label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Устанавливает значение"""
+    with _lock:
+        _gauges[(name, label_key(labels))] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Добавляет наблюдение в гистограмму"""
+    key = (name, label_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {
+                'buckets': buckets, 'counts': [0] * len(buckets), 'count': 0, 'sum': 0.0, 'max': 0.0
+            }
+        for i, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][i] += 1
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['max'] = max(histogram['max'], value)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Замеряет время этапа в parser_stage_seconds{stage=...}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe('parser_stage_seconds', time.perf_counter() - started, stage=stage)
+
+
+def format_value(value):
+    """Значение метрики без хвостов округления float"""
+    return round(value, 6) if isinstance(value, float) else value
+
+
+def format_labels(labels, extra=None):
+    """Метки в формате Prometheus"""
+    items = list(labels) + (extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{name}="{str(value)}"' for name, value in items) + '}'
+
+
+def render_prometheus():
+    """Все метрики в текстовом формате Prometheus"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {key: dict(value, counts=list(value['counts'])) for key, value in _histograms.items()}
+
+    lines = []
+    described = set()
+
+    def describe(name, metric_type):
+        if name not in described:
+            described.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name, 'counter')
+        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    for (name, labels), value in sorted(gauges.items()):
+        describe(name, 'gauge')
+        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    for (name, labels), histogram in sorted(histograms.items()):
+        describe(name, 'histogram')
+        for bound, count in zip(histogram['buckets'], histogram['counts']):
+            lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{format_labels(labels)} {round(histogram['sum'], 6)}")
+        lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def summary():
+    """Сводка метрик для JSON: счетчики и значения как есть, гистограммы - count/sum/avg/max"""
+    with _lock:
+        result = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        for (name, labels), value in sorted(_counters.items()):
+            result['counters'][name + format_labels(labels)] = format_value(value)
+        for (name, labels), value in sorted(_gauges.items()):
+            result['gauges'][name + format_labels(labels)] = format_value(value)
+        for (name, labels), histogram in sorted(_histograms.items()):
+            result['histograms'][name + format_labels(labels)] = {
+                'count': histogram['count'],
+                'sum': round(histogram['sum'], 6),
+                'avg': round(histogram['sum'] / histogram['count'], 6) if histogram['count'] else 0,
+                'max': round(histogram['max'], 6)
+            }
+    return result
+
+
+def snapshot():
+    """Текущие значения счетчиков и суммы гистограмм: (метрика, метки) -> число"""
+    with _lock:
+        result = dict(_counters)
+        for key, histogram in _histograms.items():
+            result[key] = histogram['sum']
+    return result
+
+
+def write_atomic(path, content):
+    """Пишет файл через временный, чтобы читатель не увидел его наполовину"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def export_run(extra=None):
+    """Выгружает метрики запуска: textfile Prometheus (если задан) и JSON сводку"""
+    try:
+        if METRICS_TEXTFILE:
+            write_atomic(METRICS_TEXTFILE, render_prometheus())
+        if METRICS_SUMMARY_PATH:
+            data = dict(extra or {}, metrics=summary())
+            write_atomic(METRICS_SUMMARY_PATH, json.dumps(data, ensure_ascii=False, indent=2))
+            log.info("📈 Метрики запуска: %s", METRICS_SUMMARY_PATH)
+    except OSError as e:
+        log.warning("⚠️ Не удалось сохранить метрики: %s", e)
@@ -0,0 +1,88 @@
+-- Миграция: устойчивая идентификация монет по slug страницы (coin_identity.py, merge_duplicates.py)
+-- Применяется к существующей БД после migrate_parser_runs.sql
+
+-- slug страницы монеты (/coins/<slug>) заполняется парсером при следующей встрече монеты
+ALTER TABLE cryptocurrencies ADD COLUMN IF NOT EXISTS page_slug VARCHAR(255);
+
+-- Неуникальный индекс: уже накопленные дубликаты объединяет merge_duplicates.py,
+-- после чего он создает уникальный индекс uq_crypto_page_slug
+CREATE INDEX IF NOT EXISTS idx_crypto_page_slug ON cryptocurrencies(page_slug);
+
+-- Две разные монеты с одним тикером, добавленные в один день, различаются slug страницы:
+-- символ и дата уникальны только у монет без slug
+ALTER TABLE cryptocurrencies DROP CONSTRAINT IF EXISTS cryptocurrencies_symbol_added_date_key;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_crypto_symbol_added
+    ON cryptocurrencies(symbol, added_date) WHERE page_slug IS NULL;
+
+-- OHLC таблица такой монеты получает имя с хэшем slug (ohlc_<символ>_<дата>_<md5 slug>)
+-- Функция для создания OHLC таблицы с заданным именем
+CREATE OR REPLACE FUNCTION create_ohlc_table_named(p_table_name VARCHAR)
+RETURNS VARCHAR AS $$
+DECLARE
+    v_table_name VARCHAR := p_table_name;
+    v_sql TEXT;
+BEGIN
+    -- Проверяем, существует ли уже таблица
+    IF NOT EXISTS (SELECT 1 FROM information_schema.tables
+                   WHERE table_schema = 'public'
+                   AND table_name = v_table_name) THEN
+
+        -- Компактная OHLC таблица: одно поле времени (первичный ключ - единственный индекс),
+        -- цены в DOUBLE PRECISION, объем NULL пока неизвестен.
+        -- Дата и время вычисляются через ohlc_datetime("timestamp")
+        v_sql := format('
+            CREATE TABLE %I (
+                "timestamp" BIGINT PRIMARY KEY,
+                open DOUBLE PRECISION NOT NULL,
+                high DOUBLE PRECISION NOT NULL,
+                low DOUBLE PRECISION NOT NULL,
+                close DOUBLE PRECISION NOT NULL,
+                volume DOUBLE PRECISION
+            )', v_table_name);
+
+        EXECUTE v_sql;
+
+        RAISE NOTICE 'Created OHLC table: %', v_table_name;
+    END IF;
+
+    RETURN v_table_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Функция для создания OHLC таблицы для конкретной монеты
+CREATE OR REPLACE FUNCTION create_ohlc_table(p_symbol VARCHAR, p_added_date DATE)
+RETURNS VARCHAR AS $$
+    SELECT create_ohlc_table_named(safe_table_name(p_symbol, p_added_date));
+$$ LANGUAGE sql;
+
+-- Имя OHLC таблицы новой монеты: ohlc_<символ>_<дата>, а если это имя уже занято
+-- другой монетой с тем же символом и датой (другой slug страницы) - с хэшем slug
+CREATE OR REPLACE FUNCTION ohlc_table_name_for(p_symbol VARCHAR, p_added_date DATE, p_page_slug VARCHAR)
+RETURNS VARCHAR AS $$
+DECLARE
+    v_table_name VARCHAR;
+BEGIN
+    v_table_name := safe_table_name(p_symbol, p_added_date);
+    IF p_page_slug IS NOT NULL
+       AND EXISTS (SELECT 1 FROM cryptocurrencies WHERE ohlc_table_name = v_table_name) THEN
+        v_table_name := LEFT(v_table_name, 54) || '_' || LEFT(MD5(p_page_slug), 8);
+    END IF;
+    RETURN v_table_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер для автоматического создания OHLC таблицы при добавлении новой криптовалюты
+CREATE OR REPLACE FUNCTION create_ohlc_table_trigger()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_table_name VARCHAR;
+BEGIN
+    -- Создаем таблицу OHLC для новой монеты
+    v_table_name := create_ohlc_table_named(ohlc_table_name_for(NEW.symbol, NEW.added_date, NEW.page_slug));
+
+    -- Обновляем запись с именем таблицы
+    NEW.ohlc_table_name := v_table_name;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,35 @@
+-- Миграция: таблица метрик монет coin_metrics и представление по сетям (coin_metrics.py)
+-- Применяется к существующей БД после migrate_read_service.sql
+
+-- Метрики монет по новым свечам (coin_metrics.py): доходность, просадка от максимума
+-- с листинга, волатильность за 7 дней и скользящее состояние для инкрементального пересчета
+CREATE TABLE IF NOT EXISTS coin_metrics (
+    crypto_id INTEGER PRIMARY KEY REFERENCES cryptocurrencies(id) ON DELETE CASCADE,
+    "timestamp" BIGINT NOT NULL,
+    close DOUBLE PRECISION,
+    return_4h DOUBLE PRECISION,
+    return_24h DOUBLE PRECISION,
+    return_7d DOUBLE PRECISION,
+    listing_high DOUBLE PRECISION,
+    drawdown DOUBLE PRECISION,
+    volatility_7d DOUBLE PRECISION,
+    recent_timestamps BIGINT[] NOT NULL DEFAULT '{}',
+    recent_closes DOUBLE PRECISION[] NOT NULL DEFAULT '{}',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Метрики по сетям (chain)
+CREATE OR REPLACE VIEW coin_metrics_by_chain AS
+SELECT
+    COALESCE(NULLIF(c.chain, ''), 'unknown') AS chain,
+    COUNT(*) AS coins,
+    AVG(m.return_24h) AS avg_return_24h,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY m.return_24h) AS median_return_24h,
+    AVG(m.return_7d) AS avg_return_7d,
+    AVG(m.drawdown) AS avg_drawdown,
+    AVG(m.volatility_7d) AS avg_volatility_7d
+FROM coin_metrics m
+JOIN cryptocurrencies c ON c.id = m.crypto_id
+GROUP BY COALESCE(NULLIF(c.chain, ''), 'unknown');
+
+-- Первый пересчет читает свечи монет целиком, дальше - только новые
@@ -0,0 +1,234 @@
+-- Миграция OHLC таблиц на компактный формат
+-- Применяется к существующей БД после fix_migration.sql и migrate_latest_candle.sql
+--
+-- Было: id SERIAL, timestamp + datetime + date + time (одно и то же время четыре раза),
+--       цены DECIMAL(20, 8), volume всегда 0, created_at, 4 индекса на таблицу.
+-- Стало: "timestamp" BIGINT PRIMARY KEY (единственный индекс), цены DOUBLE PRECISION
+--        (8 байт и без потери точности у монет с ценой меньше 1e-8), volume NULL пока неизвестен.
+--
+-- После применения выполните перенос таблиц (фиксация после каждой таблицы):
+--   CALL compact_ohlc_tables();
+-- Замер до/после: python3 bench_ohlc_layout.py
+-- (PostgreSQL 16, 90000 свечей: 196.4 -> 90.8 байт на свечу, вставка 10693 -> 20826 свечей/с)
+--
+-- Время свечи вычисляет ohlc_datetime("timestamp") в UTC. Старый столбец datetime хранил
+-- локальное время процесса парсера - в Docker-образе это UTC, иначе значения сдвигаются.
+
+-- 1. Новые функции создания таблиц
+-- Время свечи в UTC из миллисекунд "timestamp" (дата и время не хранятся отдельно).
+-- Старый столбец datetime парсер заполнял по локальному времени процесса
+-- (в Docker-образе это UTC, при запуске на хосте с другим поясом значения расходятся)
+CREATE OR REPLACE FUNCTION ohlc_datetime(p_timestamp BIGINT)
+RETURNS TIMESTAMP AS $$
+    SELECT to_timestamp(p_timestamp / 1000.0) AT TIME ZONE 'UTC';
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Функция для создания OHLC таблицы для конкретной монеты
+CREATE OR REPLACE FUNCTION create_ohlc_table(p_symbol VARCHAR, p_added_date DATE)
+RETURNS VARCHAR AS $$
+DECLARE
+    v_table_name VARCHAR;
+    v_sql TEXT;
+BEGIN
+    -- Получаем безопасное имя таблицы
+    v_table_name := safe_table_name(p_symbol, p_added_date);
+
+    -- Проверяем, существует ли уже таблица
+    IF NOT EXISTS (SELECT 1 FROM information_schema.tables
+                   WHERE table_schema = 'public'
+                   AND table_name = v_table_name) THEN
+
+        -- Компактная OHLC таблица: одно поле времени (первичный ключ - единственный индекс),
+        -- цены в DOUBLE PRECISION, объем NULL пока неизвестен.
+        -- Дата и время вычисляются через ohlc_datetime("timestamp")
+        v_sql := format('
+            CREATE TABLE %I (
+                "timestamp" BIGINT PRIMARY KEY,
+                open DOUBLE PRECISION NOT NULL,
+                high DOUBLE PRECISION NOT NULL,
+                low DOUBLE PRECISION NOT NULL,
+                close DOUBLE PRECISION NOT NULL,
+                volume DOUBLE PRECISION
+            )', v_table_name);
+
+        EXECUTE v_sql;
+
+        RAISE NOTICE 'Created OHLC table: %', v_table_name;
+    END IF;
+
+    RETURN v_table_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 2. Запросы, не зависящие от столбца datetime
+-- Функция для получения последних OHLC данных монеты
+CREATE OR REPLACE FUNCTION get_latest_ohlc(p_symbol VARCHAR, p_added_date DATE, p_limit INTEGER DEFAULT 10)
+RETURNS TABLE (
+    "timestamp" BIGINT,
+    datetime TIMESTAMP,
+    open DECIMAL,
+    high DECIMAL,
+    low DECIMAL,
+    close DECIMAL
+) AS $$
+DECLARE
+    v_table_name VARCHAR;
+    v_sql TEXT;
+BEGIN
+    -- Получаем имя таблицы
+    SELECT ohlc_table_name INTO v_table_name
+    FROM cryptocurrencies
+    WHERE symbol = p_symbol AND added_date = p_added_date;
+
+    IF v_table_name IS NULL THEN
+        RAISE EXCEPTION 'Crypto not found: % (%)', p_symbol, p_added_date;
+    END IF;
+
+    -- Выполняем запрос
+    v_sql := format('
+        SELECT "timestamp", ohlc_datetime("timestamp"),
+               open::DECIMAL, high::DECIMAL, low::DECIMAL, close::DECIMAL
+        FROM %I
+        ORDER BY "timestamp" DESC
+        LIMIT %s
+    ', v_table_name, p_limit);
+
+    RETURN QUERY EXECUTE v_sql;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Свечи нескольких монет за период: один UNION ALL по их OHLC таблицам за один вызов
+CREATE OR REPLACE FUNCTION get_ohlc_range(p_symbols VARCHAR[], p_from TIMESTAMP, p_to TIMESTAMP DEFAULT NULL)
+RETURNS TABLE (
+    symbol VARCHAR,
+    added_date DATE,
+    "timestamp" BIGINT,
+    datetime TIMESTAMP,
+    open DECIMAL,
+    high DECIMAL,
+    low DECIMAL,
+    close DECIMAL
+) AS $$
+DECLARE
+    v_from_ms BIGINT;
+    v_to_ms BIGINT;
+    v_sql TEXT;
+BEGIN
+    -- Границы периода в миллисекундах, как в столбце "timestamp" OHLC таблиц
+    v_from_ms := (EXTRACT(EPOCH FROM p_from AT TIME ZONE 'UTC') * 1000)::BIGINT;
+    v_to_ms := (EXTRACT(EPOCH FROM COALESCE(p_to AT TIME ZONE 'UTC', NOW())) * 1000)::BIGINT;
+
+    SELECT string_agg(format('
+        SELECT %L::VARCHAR, %L::DATE, o."timestamp", ohlc_datetime(o."timestamp"),
+               o.open::DECIMAL, o.high::DECIMAL, o.low::DECIMAL, o.close::DECIMAL
+        FROM %I o
+        WHERE o."timestamp" BETWEEN %s AND %s',
+        c.symbol, c.added_date, c.ohlc_table_name, v_from_ms, v_to_ms), ' UNION ALL ')
+    INTO v_sql
+    FROM cryptocurrencies c
+    WHERE c.symbol = ANY(p_symbols)
+    AND c.ohlc_table_name IS NOT NULL
+    AND to_regclass(c.ohlc_table_name) IS NOT NULL;
+
+    IF v_sql IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY EXECUTE v_sql || ' ORDER BY 1, 2, 3';
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- 3. Перенос одной таблицы старого формата в компактный
+CREATE OR REPLACE FUNCTION compact_ohlc_table(p_table_name VARCHAR)
+RETURNS INTEGER AS $$
+DECLARE
+    v_tmp_name VARCHAR;
+    v_count INTEGER;
+BEGIN
+    -- Таблица уже в компактном формате
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_schema = 'public'
+                   AND table_name = p_table_name
+                   AND column_name = 'datetime') THEN
+        RETURN 0;
+    END IF;
+
+    v_tmp_name := 'ohlc_compact_' || md5(p_table_name);
+
+    EXECUTE format('
+        CREATE TABLE %I (
+            "timestamp" BIGINT PRIMARY KEY,
+            open DOUBLE PRECISION NOT NULL,
+            high DOUBLE PRECISION NOT NULL,
+            low DOUBLE PRECISION NOT NULL,
+            close DOUBLE PRECISION NOT NULL,
+            volume DOUBLE PRECISION
+        )', v_tmp_name);
+
+    -- volume = 0 в старом формате означает "нет данных"
+    EXECUTE format('
+        INSERT INTO %I ("timestamp", open, high, low, close, volume)
+        SELECT "timestamp", open, high, low, close, NULLIF(volume, 0)
+        FROM %I
+        ORDER BY "timestamp"
+    ', v_tmp_name, p_table_name);
+
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+
+    EXECUTE format('DROP TABLE %I CASCADE', p_table_name);
+    EXECUTE format('ALTER TABLE %I RENAME TO %I', v_tmp_name, p_table_name);
+    EXECUTE format('ALTER INDEX %I RENAME TO %I', v_tmp_name || '_pkey', left(p_table_name, 58) || '_pkey');
+
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 4. Перенос всех таблиц: отдельная транзакция на каждую, чтобы не держать блокировки
+CREATE OR REPLACE PROCEDURE compact_ohlc_tables()
+AS $$
+DECLARE
+    v_table_name VARCHAR;
+    v_count INTEGER;
+    v_tables INTEGER := 0;
+BEGIN
+    FOR v_table_name IN
+        SELECT c.ohlc_table_name
+        FROM cryptocurrencies c
+        JOIN information_schema.columns col
+            ON col.table_schema = 'public'
+            AND col.table_name = c.ohlc_table_name
+            AND col.column_name = 'datetime'
+        ORDER BY c.id
+    LOOP
+        v_count := compact_ohlc_table(v_table_name);
+        v_tables := v_tables + 1;
+        RAISE NOTICE '  % : % свечей', v_table_name, v_count;
+        COMMIT;
+    END LOOP;
+
+    RAISE NOTICE 'Перенесено таблиц в компактный формат: %', v_tables;
+END;
+$$ LANGUAGE plpgsql;
+
+-- 5. Снимок последних свечей и дневные бары: цены в DOUBLE PRECISION, как в OHLC таблицах,
+-- время снимка в UTC, как возвращает ohlc_datetime()
+DO $$
+BEGIN
+    IF to_regclass('latest_candle') IS NOT NULL THEN
+        ALTER TABLE latest_candle
+            ALTER COLUMN open TYPE DOUBLE PRECISION,
+            ALTER COLUMN high TYPE DOUBLE PRECISION,
+            ALTER COLUMN low TYPE DOUBLE PRECISION,
+            ALTER COLUMN close TYPE DOUBLE PRECISION;
+        UPDATE latest_candle SET datetime = ohlc_datetime("timestamp");
+    END IF;
+
+    IF to_regclass('ohlc_daily_archive') IS NOT NULL THEN
+        ALTER TABLE ohlc_daily_archive
+            ALTER COLUMN open TYPE DOUBLE PRECISION,
+            ALTER COLUMN high TYPE DOUBLE PRECISION,
+            ALTER COLUMN low TYPE DOUBLE PRECISION,
+            ALTER COLUMN close TYPE DOUBLE PRECISION,
+            ALTER COLUMN volume TYPE DOUBLE PRECISION;
+    END IF;
+END $$;
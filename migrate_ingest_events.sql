@@ -0,0 +1,84 @@
+-- Миграция: журнал событий загрузки ingest_events и уведомления подписчикам (ingest_events.py)
+-- Применяется к существующей БД после migrate_coin_metrics.sql
+
+-- Журнал событий загрузки (ingest_events.py): новая монета, новые свечи с диапазоном, смена ID CoinGecko.
+-- Каждое событие пишется в ingest_events и уходит в канал ingest_events после commit;
+-- подписчик, пропустивший уведомления, дочитывает события из таблицы по id
+CREATE TABLE IF NOT EXISTS ingest_events (
+    id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL, -- coin_added, candles, coin_id_changed
+    crypto_id INTEGER NOT NULL, -- без внешнего ключа: события переживают удаление монеты ретеншном
+    payload JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_ingest_events_created_at ON ingest_events(created_at);
+
+CREATE OR REPLACE FUNCTION publish_ingest_event(p_kind VARCHAR, p_crypto_id INTEGER, p_payload JSONB)
+RETURNS VOID AS $$
+DECLARE
+    v_id BIGINT;
+BEGIN
+    INSERT INTO ingest_events (kind, crypto_id, payload)
+    VALUES (p_kind, p_crypto_id, p_payload)
+    RETURNING id INTO v_id;
+
+    PERFORM pg_notify('ingest_events', json_build_object(
+        'id', v_id, 'kind', p_kind, 'crypto_id', p_crypto_id, 'payload', p_payload)::TEXT);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Новая монета и смена ID CoinGecko
+CREATE OR REPLACE FUNCTION publish_coin_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM publish_ingest_event('coin_added', NEW.id, jsonb_build_object(
+            'symbol', NEW.symbol, 'name', NEW.name, 'chain', NEW.chain,
+            'added_date', NEW.added_date, 'coin_gecko_id', NEW.coin_gecko_id));
+    ELSE
+        PERFORM publish_ingest_event('coin_id_changed', NEW.id, jsonb_build_object(
+            'symbol', NEW.symbol, 'old', OLD.coin_gecko_id, 'new', NEW.coin_gecko_id));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cryptocurrencies_coin_added_event ON cryptocurrencies;
+CREATE TRIGGER cryptocurrencies_coin_added_event
+    AFTER INSERT ON cryptocurrencies
+    FOR EACH ROW
+    EXECUTE FUNCTION publish_coin_event();
+
+DROP TRIGGER IF EXISTS cryptocurrencies_coin_id_event ON cryptocurrencies;
+CREATE TRIGGER cryptocurrencies_coin_id_event
+    AFTER UPDATE OF coin_gecko_id ON cryptocurrencies
+    FOR EACH ROW
+    WHEN (OLD.coin_gecko_id IS DISTINCT FROM NEW.coin_gecko_id)
+    EXECUTE FUNCTION publish_coin_event();
+
+-- Новые свечи: снимок latest_candle сдвигается вперед в той же транзакции, что и запись в OHLC таблицу,
+-- свечи только дописываются, поэтому новые свечи - (from, to]; from = null у первой загрузки монеты
+CREATE OR REPLACE FUNCTION publish_candles_event()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM publish_ingest_event('candles', NEW.crypto_id, jsonb_build_object(
+        'symbol', (SELECT symbol FROM cryptocurrencies WHERE id = NEW.crypto_id),
+        'from', CASE WHEN TG_OP = 'UPDATE' THEN OLD."timestamp" END,
+        'to', NEW."timestamp"));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS latest_candle_insert_event ON latest_candle;
+CREATE TRIGGER latest_candle_insert_event
+    AFTER INSERT ON latest_candle
+    FOR EACH ROW
+    EXECUTE FUNCTION publish_candles_event();
+
+DROP TRIGGER IF EXISTS latest_candle_update_event ON latest_candle;
+CREATE TRIGGER latest_candle_update_event
+    AFTER UPDATE ON latest_candle
+    FOR EACH ROW
+    WHEN (NEW."timestamp" > OLD."timestamp")
+    EXECUTE FUNCTION publish_candles_event();
@@ -0,0 +1,12 @@
+-- Миграция: очередь заданий обновления свечей для нескольких воркеров (parser_worker.py)
+-- Применяется к существующей БД после migrate_refresh_state.sql
+
+-- Аренда задания: воркер, взявший монету, и срок, после которого она снова доступна
+ALTER TABLE coin_refresh_state ADD COLUMN IF NOT EXISTS claimed_by VARCHAR(100);
+ALTER TABLE coin_refresh_state ADD COLUMN IF NOT EXISTS claimed_until TIMESTAMP;
+
+-- Общий лимит запросов к API: счетчик запросов в каждой минуте
+CREATE TABLE IF NOT EXISTS api_rate_budget (
+    window_start TIMESTAMP PRIMARY KEY,
+    requests INTEGER NOT NULL DEFAULT 0
+);
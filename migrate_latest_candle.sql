@@ -0,0 +1,115 @@
+-- Миграция: снимок последних свечей и запросы по нескольким монетам сразу
+-- Применяется к существующей БД после fix_migration.sql
+
+-- Время свечи в UTC из миллисекунд "timestamp" (как в init_separate_tables.sql):
+-- работает и со старым, и с компактным форматом OHLC таблиц
+CREATE OR REPLACE FUNCTION ohlc_datetime(p_timestamp BIGINT)
+RETURNS TIMESTAMP AS $$
+    SELECT to_timestamp(p_timestamp / 1000.0) AT TIME ZONE 'UTC';
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Снимок последней свечи каждой монеты (обновляется парсером при загрузке OHLC)
+CREATE TABLE IF NOT EXISTS latest_candle (
+    crypto_id INTEGER PRIMARY KEY REFERENCES cryptocurrencies(id) ON DELETE CASCADE,
+    "timestamp" BIGINT NOT NULL,
+    datetime TIMESTAMP NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_latest_candle_timestamp ON latest_candle("timestamp");
+
+-- Последние свечи по списку монет (NULL - все монеты) одним запросом к снимку
+CREATE OR REPLACE FUNCTION get_latest_candles(p_symbols VARCHAR[] DEFAULT NULL)
+RETURNS TABLE (
+    symbol VARCHAR,
+    added_date DATE,
+    "timestamp" BIGINT,
+    datetime TIMESTAMP,
+    open DECIMAL,
+    high DECIMAL,
+    low DECIMAL,
+    close DECIMAL
+) AS $$
+    SELECT c.symbol, c.added_date, lc."timestamp", lc.datetime,
+           lc.open, lc.high, lc.low, lc.close
+    FROM latest_candle lc
+    JOIN cryptocurrencies c ON c.id = lc.crypto_id
+    WHERE p_symbols IS NULL OR c.symbol = ANY(p_symbols)
+    ORDER BY c.symbol, c.added_date;
+$$ LANGUAGE sql STABLE;
+
+-- Свечи нескольких монет за период: один UNION ALL по их OHLC таблицам за один вызов
+CREATE OR REPLACE FUNCTION get_ohlc_range(p_symbols VARCHAR[], p_from TIMESTAMP, p_to TIMESTAMP DEFAULT NULL)
+RETURNS TABLE (
+    symbol VARCHAR,
+    added_date DATE,
+    "timestamp" BIGINT,
+    datetime TIMESTAMP,
+    open DECIMAL,
+    high DECIMAL,
+    low DECIMAL,
+    close DECIMAL
+) AS $$
+DECLARE
+    v_from_ms BIGINT;
+    v_to_ms BIGINT;
+    v_sql TEXT;
+BEGIN
+    -- Границы периода в миллисекундах, как в столбце "timestamp" OHLC таблиц
+    v_from_ms := (EXTRACT(EPOCH FROM p_from AT TIME ZONE 'UTC') * 1000)::BIGINT;
+    v_to_ms := (EXTRACT(EPOCH FROM COALESCE(p_to AT TIME ZONE 'UTC', NOW())) * 1000)::BIGINT;
+
+    SELECT string_agg(format('
+        SELECT %L::VARCHAR, %L::DATE, o."timestamp", ohlc_datetime(o."timestamp"),
+               o.open::DECIMAL, o.high::DECIMAL, o.low::DECIMAL, o.close::DECIMAL
+        FROM %I o
+        WHERE o."timestamp" BETWEEN %s AND %s',
+        c.symbol, c.added_date, c.ohlc_table_name, v_from_ms, v_to_ms), ' UNION ALL ')
+    INTO v_sql
+    FROM cryptocurrencies c
+    WHERE c.symbol = ANY(p_symbols)
+    AND c.ohlc_table_name IS NOT NULL
+    AND to_regclass(c.ohlc_table_name) IS NOT NULL;
+
+    IF v_sql IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY EXECUTE v_sql || ' ORDER BY 1, 2, 3';
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Заполнение снимка из уже существующих OHLC таблиц
+DO $$
+DECLARE
+    v_crypto RECORD;
+BEGIN
+    FOR v_crypto IN
+        SELECT id, ohlc_table_name
+        FROM cryptocurrencies
+        WHERE ohlc_table_name IS NOT NULL
+        AND to_regclass(ohlc_table_name) IS NOT NULL
+    LOOP
+        EXECUTE format('
+            INSERT INTO latest_candle (crypto_id, "timestamp", datetime, open, high, low, close)
+            SELECT %s, "timestamp", ohlc_datetime("timestamp"), open, high, low, close
+            FROM %I
+            ORDER BY "timestamp" DESC
+            LIMIT 1
+            ON CONFLICT (crypto_id) DO UPDATE SET
+                "timestamp" = EXCLUDED."timestamp",
+                datetime = EXCLUDED.datetime,
+                open = EXCLUDED.open,
+                high = EXCLUDED.high,
+                low = EXCLUDED.low,
+                close = EXCLUDED.close,
+                updated_at = CURRENT_TIMESTAMP
+        ', v_crypto.id, v_crypto.ohlc_table_name);
+    END LOOP;
+
+    RAISE NOTICE 'Снимок latest_candle заполнен: % монет', (SELECT COUNT(*) FROM latest_candle);
+END $$;
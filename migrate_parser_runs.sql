@@ -0,0 +1,41 @@
+-- Миграция: журнал запусков парсера (run_ledger.py, run_trends.py)
+-- Применяется к существующей БД после migrate_job_queue.sql
+
+-- Одна строка на запуск: cron, цикл обновления свечей демона или воркер
+CREATE TABLE IF NOT EXISTS parser_runs (
+    id BIGSERIAL PRIMARY KEY,
+    mode VARCHAR(20) NOT NULL, -- cron | daemon | worker
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP NOT NULL,
+    duration_seconds DOUBLE PRECISION NOT NULL,
+    status VARCHAR(20) NOT NULL, -- ok | no_coins | page_failed | stopped
+    stage_seconds JSONB NOT NULL DEFAULT '{}', -- длительность этапов: {"page_fetch": 1.2, ...}
+    coins_parsed INTEGER NOT NULL DEFAULT 0,
+    coins_refreshed INTEGER NOT NULL DEFAULT 0,
+    api_calls INTEGER NOT NULL DEFAULT 0,
+    rate_limited INTEGER NOT NULL DEFAULT 0,
+    candles_inserted INTEGER NOT NULL DEFAULT 0,
+    errors INTEGER NOT NULL DEFAULT 0,
+    code_version VARCHAR(64),
+    host VARCHAR(100)
+);
+
+CREATE INDEX IF NOT EXISTS idx_parser_runs_started ON parser_runs(started_at);
+
+-- Тренды по дням: длительность, пропускная способность и доля 429
+CREATE OR REPLACE VIEW parser_runs_daily AS
+SELECT
+    started_at::date AS day,
+    mode,
+    COUNT(*) AS runs,
+    COUNT(*) FILTER (WHERE status <> 'ok') AS failed_runs,
+    ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_seconds)::numeric, 1) AS median_seconds,
+    ROUND(MAX(duration_seconds)::numeric, 1) AS max_seconds,
+    SUM(coins_refreshed) AS coins_refreshed,
+    SUM(api_calls) AS api_calls,
+    SUM(rate_limited) AS rate_limited,
+    SUM(candles_inserted) AS candles_inserted,
+    ROUND(SUM(candles_inserted) / NULLIF(SUM(duration_seconds), 0)::numeric, 2) AS candles_per_second,
+    SUM(errors) AS errors
+FROM parser_runs
+GROUP BY started_at::date, mode;
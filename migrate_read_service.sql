@@ -0,0 +1,33 @@
+-- Миграция: уведомления о новых данных для сброса кэша сервиса чтения (read_service.py)
+-- Применяется к существующей БД после migrate_coin_identity.sql
+
+-- Новые свечи монеты: снимок latest_candle обновляется в той же транзакции, что и OHLC таблица,
+-- уведомление доставляется после commit (с id монеты)
+CREATE OR REPLACE FUNCTION notify_candles_ingested()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('candles_ingested', COALESCE(NEW.crypto_id, OLD.crypto_id)::TEXT);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS latest_candle_notify ON latest_candle;
+CREATE TRIGGER latest_candle_notify
+    AFTER INSERT OR UPDATE OR DELETE ON latest_candle
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_candles_ingested();
+
+-- Изменения листинга: одно уведомление на запрос, а не на строку
+CREATE OR REPLACE FUNCTION notify_listing_changed()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('listing_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cryptocurrencies_notify ON cryptocurrencies;
+CREATE TRIGGER cryptocurrencies_notify
+    AFTER INSERT OR UPDATE OR DELETE ON cryptocurrencies
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_listing_changed();
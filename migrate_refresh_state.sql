@@ -0,0 +1,18 @@
+-- Миграция: состояние планировщика обновления свечей (срок и приоритет по монетам)
+-- Применяется к существующей БД после fix_migration.sql
+
+-- Состояние планировщика обновления свечей (refresh_scheduler.py)
+CREATE TABLE IF NOT EXISTS coin_refresh_state (
+    crypto_id INTEGER PRIMARY KEY REFERENCES cryptocurrencies(id) ON DELETE CASCADE,
+    next_due_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    priority DOUBLE PRECISION NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'active', -- active | dead
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    flat_runs INTEGER NOT NULL DEFAULT 0,
+    volatility DOUBLE PRECISION,
+    last_attempt_at TIMESTAMP,
+    last_success_at TIMESTAMP,
+    last_outcome VARCHAR(20) -- ok | flat | failed
+);
+
+CREATE INDEX IF NOT EXISTS idx_refresh_state_due ON coin_refresh_state(next_due_at);
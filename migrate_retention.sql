@@ -0,0 +1,31 @@
+-- Миграция: таблицы для retention.py (архив дневных баров и журнал удалений)
+-- Применяется к существующей БД после fix_migration.sql
+
+-- Дневные бары монет, чьи OHLC таблицы удалены по сроку хранения
+CREATE TABLE IF NOT EXISTS ohlc_daily_archive (
+    symbol VARCHAR(50) NOT NULL,
+    added_date DATE NOT NULL,
+    coin_gecko_id VARCHAR(255),
+    date DATE NOT NULL,
+    open DOUBLE PRECISION NOT NULL,
+    high DOUBLE PRECISION NOT NULL,
+    low DOUBLE PRECISION NOT NULL,
+    close DOUBLE PRECISION NOT NULL,
+    volume DOUBLE PRECISION,
+    candles_count INTEGER NOT NULL,
+    PRIMARY KEY (symbol, added_date, date)
+);
+
+-- Журнал retention.py: какие монеты заархивированы и удалены, сколько места освобождено
+CREATE TABLE IF NOT EXISTS retention_log (
+    id SERIAL PRIMARY KEY,
+    crypto_id INTEGER NOT NULL UNIQUE,
+    symbol VARCHAR(50) NOT NULL,
+    added_date DATE,
+    ohlc_table_name VARCHAR(100),
+    archive_path TEXT,
+    rows_archived INTEGER DEFAULT 0,
+    daily_bars INTEGER DEFAULT 0,
+    bytes_reclaimed BIGINT DEFAULT 0,
+    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Режим демона парсера: постоянная работа вместо запуска из cron.
+
+Между циклами сохраняется теплое состояние: потоки-писатели БД со своими
+подключениями, кэш ID монет и водяные знаки OHLC таблиц. Страница листинга
+опрашивается каждые LISTING_POLL_INTERVAL секунд, а свечи обновляются сразу
+после закрытия каждой 4-часовой свечи (с задержкой CANDLE_REFRESH_DELAY).
+Состояние доступно по HTTP на HEALTH_PORT (/health), метрики Prometheus - /metrics.
+
+Запуск: python3 parser_ohlcv_db.py --daemon
+"""
+import json
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from coin_identity import candle_key
+from log_config import get_logger
+import parser_ohlcv_db as parser
+from refresh_scheduler import CANDLE_REFRESH_DELAY, next_candle_boundary, run_deadline
+from run_ledger import RunLedger
+
+log = get_logger('daemon')
+
+# Интервал опроса страницы новых монет (секунды)
+LISTING_POLL_INTERVAL = int(os.environ.get('LISTING_POLL_INTERVAL', '300'))
+
+# Поля листинга, которые пишет в cryptocurrencies save_crypto(): монета без их изменений не перезаписывается
+LISTING_FIELDS = ('name', 'chain', 'price', 'change_24h', 'market_cap', 'fdv', 'added', 'added_raw', 'page_slug')
+
+# Порт HTTP эндпоинта состояния (0 - отключен)
+HEALTH_PORT = int(os.environ.get('HEALTH_PORT', '8080'))
+
+# Событие остановки (SIGTERM/SIGINT): то же, что прерывает ожидания парсера после ответа 429
+stop_event = parser.STOP_EVENT
+
+# Состояние демона для /health
+health = {
+    'started_at': None,
+    'last_listing_poll': None,
+    'last_listing_error': None,
+    'last_candle_refresh': None,
+    'next_candle_refresh': None,
+    'listed_coins': 0,
+    'cycles': 0
+}
+health_lock = threading.Lock()
+
+
+def update_health(**values):
+    """Обновляет состояние демона"""
+    with health_lock:
+        health.update(values)
+
+
+def health_snapshot(write_queue):
+    """Возвращает (здоров ли демон, состояние для ответа)"""
+    with health_lock:
+        snapshot = dict(health)
+
+    now = time.time()
+    snapshot['queue_size'] = write_queue.qsize()
+    snapshot['uptime_seconds'] = int(now - snapshot['started_at']) if snapshot['started_at'] else 0
+
+    # Нездоров, если листинг давно не удавалось загрузить
+    max_listing_age = max(3 * LISTING_POLL_INTERVAL, 900)
+    last_poll = snapshot['last_listing_poll'] or snapshot['started_at'] or now
+    healthy = not stop_event.is_set() and now - last_poll <= max_listing_age
+    snapshot['status'] = 'ok' if healthy else 'unhealthy'
+
+    for key in ['started_at', 'last_listing_poll', 'last_candle_refresh', 'next_candle_refresh']:
+        if snapshot[key]:
+            snapshot[key] = datetime.fromtimestamp(snapshot[key]).isoformat()
+
+    return healthy, snapshot
+
+
+def start_health_server(write_queue):
+    """Запускает HTTP эндпоинт /health в отдельном потоке"""
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            if self.path.rstrip('/') not in ('', '/health'):
+                self.send_error(404)
+                return
+
+            healthy, snapshot = health_snapshot(write_queue)
+            body = json.dumps(snapshot, ensure_ascii=False).encode('utf-8')
+
+            self.send_response(200 if healthy else 503)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Не засоряем лог запросами healthcheck
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', HEALTH_PORT), HealthHandler)
+    thread = threading.Thread(target=server.serve_forever, name="health-server", daemon=True)
+    thread.start()
+    log.info(f"🩺 Health эндпоинт: http://0.0.0.0:{HEALTH_PORT}/health")
+    return server
+
+
+def poll_listing(write_queue, known_coins):
+    """Загружает страницу новых монет и передает писателям БД новые и изменившиеся, возвращает список монет.
+
+    known_coins - поля листинга монет на прошлом опросе (ключ coin_identity.candle_key)
+    """
+    html = parser.fetch_page()
+    if not html:
+        update_health(last_listing_error=datetime.now().isoformat())
+        return None
+
+    cryptos = parser.parse_html_limited(html, limit=parser.MAX_COINS)
+    if not cryptos:
+        update_health(last_listing_error=datetime.now().isoformat())
+        return None
+
+    new_coins = 0
+    changed_coins = 0
+    for crypto in cryptos:
+        key = candle_key(crypto)
+        fields = {field: crypto.get(field) for field in LISTING_FIELDS}
+        if key not in known_coins:
+            new_coins += 1
+        elif known_coins[key] != fields:
+            changed_coins += 1
+        else:
+            # Строка в БД уже такая же - запись не нужна
+            continue
+        known_coins[key] = fields
+        parser.enqueue_for_write(write_queue, crypto)
+
+    log.info(f"📋 Листинг: {len(cryptos)} монет, новых с прошлого опроса: {new_coins}, "
+             f"изменившихся: {changed_coins}")
+    update_health(last_listing_poll=time.time(), listed_coins=len(cryptos))
+    metrics.set_gauge('parser_last_listing_poll_timestamp_seconds', int(time.time()))
+    return cryptos
+
+
+def refresh_candles(write_queue, cryptos):
+    """Загружает свечи монет, срок которых наступил, по приоритету и до дедлайна"""
+    log.info("📊 Обновление 4-часовых свечей")
+    ledger = RunLedger('daemon')
+
+    # Листинг этих монет должен быть записан до того, как к ним добавятся свечи
+    write_queue.join()
+
+    due, _ = parser.plan_refresh(cryptos)
+    deadline = run_deadline(time.time())
+
+    ohlcv_count = 0
+    for crypto in due:
+        if stop_event.is_set():
+            log.info("🛑 Обновление свечей прервано остановкой демона")
+            break
+        if time.time() >= deadline:
+            log.info("⏰ Дедлайн: оставшиеся монеты обновятся в следующем цикле")
+            break
+
+        if parser.fetch_crypto_ohlcv(crypto):
+            ohlcv_count += 1
+        parser.enqueue_for_write(write_queue, crypto)
+
+    # Дожидаемся записи, чтобы цикл считался завершенным только после commit
+    write_queue.join()
+    log.info(f"✅ Свечи обновлены для {ohlcv_count} монет")
+    parser.update_metrics()
+    update_health(last_candle_refresh=time.time())
+    metrics.set_gauge('parser_last_success_timestamp_seconds', int(time.time()))
+    metrics.export_run({'status': 'ok', 'finished': datetime.now().isoformat(), 'mode': 'daemon'})
+    parser.record_run(ledger, 'stopped' if stop_event.is_set() else 'ok', len(cryptos), ohlcv_count)
+
+
+def handle_stop_signal(signum, frame):
+    """Корректная остановка по SIGTERM/SIGINT"""
+    log.info(f"🛑 Получен сигнал {signum}, завершаем текущую монету и останавливаемся...")
+    stop_event.set()
+
+
+def run_daemon():
+    """Основной цикл демона"""
+    log.info("=" * 80)
+    log.info("🚀 ПАРСЕР КРИПТОВАЛЮТ В РЕЖИМЕ ДЕМОНА")
+    log.info(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    log.info(f"Опрос листинга: каждые {LISTING_POLL_INTERVAL} с, свечи: через {CANDLE_REFRESH_DELAY} с "
+             f"после закрытия 4-часовой свечи")
+    log.info("=" * 80)
+
+    signal.signal(signal.SIGTERM, handle_stop_signal)
+    signal.signal(signal.SIGINT, handle_stop_signal)
+
+    update_health(started_at=time.time())
+
+    # Теплое состояние: ID монет из БД и постоянные писатели БД
+    cached_ids = parser.load_coin_id_cache()
+    log.info(f"⚡ Загружено известных ID монет: {cached_ids}")
+
+    write_queue, writers, save_stats = parser.start_db_writers()
+    health_server = start_health_server(write_queue) if HEALTH_PORT else None
+
+    known_coins = {}
+    cryptos = []
+
+    # Первое обновление свечей сразу при старте, дальше - по границам свечей
+    next_poll = time.time()
+    next_refresh = time.time()
+
+    try:
+        while not stop_event.is_set():
+            now = time.time()
+
+            if now >= next_poll or now >= next_refresh:
+                polled = poll_listing(write_queue, known_coins)
+                if polled:
+                    cryptos = polled
+                next_poll = time.time() + LISTING_POLL_INTERVAL
+
+            if now >= next_refresh and not stop_event.is_set():
+                if cryptos:
+                    refresh_candles(write_queue, cryptos)
+                next_refresh = next_candle_boundary(time.time())
+                update_health(next_candle_refresh=next_refresh)
+                log.info(f"⏰ Следующее обновление свечей: "
+                         f"{datetime.fromtimestamp(next_refresh).strftime('%Y-%m-%d %H:%M:%S')}")
+
+            with health_lock:
+                health['cycles'] += 1
+
+            stop_event.wait(max(0, min(next_poll, next_refresh) - time.time()))
+
+    finally:
+        log.info("💾 Дожидаемся записи оставшихся монет...")
+        parser.stop_db_writers(write_queue, writers, save_stats)
+        if health_server:
+            health_server.shutdown()
+        log.info("✅ Демон остановлен")
+
+
+if __name__ == "__main__":
+    run_daemon()
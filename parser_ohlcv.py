@@ -7,6 +7,15 @@ import re
 from datetime import datetime, timedelta
 import time
 import ssl
+import logging
+
+import http_cassette
+from candle_store import CANDLE_STORE_DIR, store_candles
+from coin_identity import candle_key, page_slug
+from history_store import HistoryStore
+from log_config import get_logger
+
+log = get_logger('files')
 
 # URL страницы с новыми криптовалютами
 BASE_URL = "https://www.coingecko.com/ru/new-cryptocurrencies"
@@ -15,6 +24,9 @@ API_BASE = "https://api.coingecko.com/api/v3"
 # Количество монет для парсинга
 MAX_COINS = 50
 
+# ID, для которых CoinGecko вернул 404 на /ohlc (slug страницы не совпал с ID API)
+NOT_FOUND_COIN_IDS = set()
+
 
 def create_ssl_context():
     """Создает SSL контекст для HTTPS запросов"""
@@ -26,7 +38,7 @@ def create_ssl_context():
 
 def fetch_page():
     """Загружает HTML страницу"""
-    print(f"🌐 Загрузка страницы: {BASE_URL}", flush=True)
+    log.info(f"🌐 Загрузка страницы: {BASE_URL}")
 
     try:
         # Создаем запрос с заголовками
@@ -42,7 +54,7 @@ def fetch_page():
 
         # Выполняем запрос
         context = create_ssl_context()
-        response = urllib.request.urlopen(req, context=context, timeout=30)
+        response = http_cassette.urlopen(req, context=context, timeout=30)
 
         # Читаем ответ
         if response.info().get('Content-Encoding') == 'gzip':
@@ -51,22 +63,22 @@ def fetch_page():
         else:
             html = response.read().decode('utf-8')
 
-        print(f"✅ Страница загружена, размер: {len(html)} байт", flush=True)
+        log.info(f"✅ Страница загружена, размер: {len(html)} байт")
         return html
 
     except urllib.error.HTTPError as e:
-        print(f"❌ HTTP ошибка: {e.code} {e.reason}", flush=True)
+        log.error(f"❌ HTTP ошибка: {e.code} {e.reason}")
         if e.code == 403:
-            print("💡 CoinGecko блокирует запросы. Попробуйте использовать VPN", flush=True)
+            log.info("💡 CoinGecko блокирует запросы. Попробуйте использовать VPN")
         return None
     except Exception as e:
-        print(f"❌ Ошибка при загрузке: {e}", flush=True)
+        log.error(f"❌ Ошибка при загрузке: {e}")
         return None
 
 
 def search_coin_id(coin_name, coin_symbol, retry_count=0):
     """Ищет ID монеты в CoinGecko API с обработкой rate limit"""
-    print(f"  🔍 Поиск ID для {coin_name} ({coin_symbol})...", flush=True)
+    log.info(f"  🔍 Поиск ID для {coin_name} ({coin_symbol})...")
 
     # Преобразуем символ в нижний регистр для поиска
     search_query = coin_symbol.lower()
@@ -78,7 +90,7 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
         req.add_header('Accept', 'application/json')
 
         context = create_ssl_context()
-        response = urllib.request.urlopen(req, context=context, timeout=15)
+        response = http_cassette.urlopen(req, context=context, timeout=15)
         data = json.loads(response.read().decode('utf-8'))
 
         # Ищем точное совпадение по символу
@@ -90,15 +102,14 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
                     found_symbol = coin.get('symbol', '').upper()
 
                     # Проверка соответствия
-                    print(f"    📌 Найден кандидат: {found_name} ({found_symbol}) - ID: {found_id}", flush=True)
+                    log.debug("    📌 Найден кандидат: %s (%s) - ID: %s", found_name, found_symbol, found_id)
 
                     # Проверяем соответствие названия
                     if coin_name.lower() in found_name.lower() or found_name.lower() in coin_name.lower():
-                        print(f"    ✅ Подтверждено совпадение по названию и символу", flush=True)
+                        log.info("    ✅ Подтверждено совпадение по названию и символу")
                         return found_id
                     else:
-                        print(f"    ⚠️ Название не совпадает: ожидалось '{coin_name}', найдено '{found_name}'",
-                              flush=True)
+                        log.warning(f"    ⚠️ Название не совпадает: ожидалось '{coin_name}', найдено '{found_name}'")
                         # Продолжаем поиск
 
         # Если не нашли по символу, пробуем по названию
@@ -109,7 +120,7 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
         req.add_header('User-Agent', 'Mozilla/5.0')
         req.add_header('Accept', 'application/json')
 
-        response = urllib.request.urlopen(req, context=context, timeout=15)
+        response = http_cassette.urlopen(req, context=context, timeout=15)
         data = json.loads(response.read().decode('utf-8'))
 
         if 'coins' in data and len(data['coins']) > 0:
@@ -120,18 +131,18 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
                 found_name = coin.get('name', '')
                 found_symbol = coin.get('symbol', '').upper()
 
-                print(f"    📌 Кандидат по названию: {found_name} ({found_symbol}) - ID: {found_id}", flush=True)
+                log.debug("    📌 Кандидат по названию: %s (%s) - ID: %s", found_name, found_symbol, found_id)
 
                 # Проверяем точное совпадение символа
                 if found_symbol == coin_symbol.upper():
-                    print(f"    ✅ Найдено точное совпадение по символу: {found_name} ({found_symbol})", flush=True)
+                    log.info(f"    ✅ Найдено точное совпадение по символу: {found_name} ({found_symbol})")
                     return found_id
 
                 # Проверяем перевернутое совпадение (например, "3D (MAN)" vs "MAN (3D)")
                 if (coin_name.upper() == found_symbol and coin_symbol.upper() == found_name.upper()) or \
                         (f"{coin_symbol} ({coin_name})" == f"{found_name} ({found_symbol})") or \
                         (f"{coin_name} ({coin_symbol})" == f"{found_symbol} ({found_name})"):
-                    print(f"    ✅ Найдено перевернутое совпадение: {found_name} ({found_symbol})", flush=True)
+                    log.info(f"    ✅ Найдено перевернутое совпадение: {found_name} ({found_symbol})")
                     return found_id
 
                 # Сохраняем первый результат как запасной
@@ -140,21 +151,20 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
 
             # Если точного совпадения нет, используем лучший найденный результат
             if best_match:
-                print(
-                    f"    ⚠️ Точное совпадение не найдено. Используется: {best_match.get('name', '')} ({best_match.get('symbol', '')})",
-                    flush=True)
+                log.warning(
+                    f"    ⚠️ Точное совпадение не найдено. Используется: {best_match.get('name', '')} ({best_match.get('symbol', '')})")
                 return best_match['id']
 
     except urllib.error.HTTPError as e:
         if e.code == 429 and retry_count < 3:
             wait_time = 60 * (retry_count + 1)  # 60, 120, 180 секунд
-            print(f"    ⚠️ Rate limit превышен. Ожидание {wait_time} секунд...", flush=True)
+            log.warning(f"    ⚠️ Rate limit превышен. Ожидание {wait_time} секунд...")
             time.sleep(wait_time)
             return search_coin_id(coin_name, coin_symbol, retry_count + 1)
         else:
-            print(f"    ❌ Ошибка поиска: {e}", flush=True)
+            log.warning(f"    ⚠️ Ошибка поиска: {e}")
     except Exception as e:
-        print(f"    ❌ Ошибка поиска: {e}", flush=True)
+        log.warning(f"    ⚠️ Ошибка поиска: {e}")
 
     return None
 
@@ -169,7 +179,7 @@ def fetch_ohlc_data(coin_id, days=30, retry_count=0):
         req.add_header('Accept', 'application/json')
 
         context = create_ssl_context()
-        response = urllib.request.urlopen(req, context=context, timeout=15)
+        response = http_cassette.urlopen(req, context=context, timeout=15)
 
         data = json.loads(response.read().decode('utf-8'))
 
@@ -193,35 +203,55 @@ def fetch_ohlc_data(coin_id, days=30, retry_count=0):
                         'close': candle[4]
                     })
 
-            print(f"    ✅ Получено {len(ohlc_processed)} 4-часовых OHLC свечей", flush=True)
+            log.info(f"    ✅ Получено {len(ohlc_processed)} 4-часовых OHLC свечей")
             return ohlc_processed
 
     except urllib.error.HTTPError as e:
         if e.code == 404:
-            print(f"    ⚠️ OHLC данные не найдены", flush=True)
+            NOT_FOUND_COIN_IDS.add(coin_id)
+            log.warning("    ⚠️ OHLC данные не найдены")
         elif e.code == 429:
             if retry_count < 3:
-                print(f"    ⚠️ Превышен лимит API. Ожидание 60 секунд...", flush=True)
+                log.warning("    ⚠️ Превышен лимит API. Ожидание 60 секунд...")
                 time.sleep(60)
-                print(f"    🔄 Повторная попытка получения OHLC для {coin_id}...", flush=True)
+                log.info(f"    🔄 Повторная попытка получения OHLC для {coin_id}...")
                 return fetch_ohlc_data(coin_id, days, retry_count + 1)
             else:
-                print(f"    ❌ Превышен лимит попыток для получения OHLC", flush=True)
+                log.warning("    ⚠️ Превышен лимит попыток для получения OHLC")
         else:
-            print(f"    ❌ HTTP ошибка {e.code}", flush=True)
+            log.warning(f"    ⚠️ HTTP ошибка {e.code}")
     except Exception as e:
-        print(f"    ❌ Ошибка: {e}", flush=True)
+        log.error(f"    ❌ Ошибка: {e}")
 
     return None
 
 
+def fetch_ohlc_for_listing(crypto, days=30):
+    """ID монеты и ее OHLC: ID из ссылки на страницу монеты, поиск - только без ссылки или при 404"""
+    coin_id = crypto.get('page_slug')
+    if coin_id and coin_id not in NOT_FOUND_COIN_IDS:
+        log.info(f"  🔗 ID из ссылки страницы: {coin_id}")
+        time.sleep(3)
+        ohlcv = fetch_ohlc_data(coin_id, days=days)
+        if ohlcv or coin_id not in NOT_FOUND_COIN_IDS:
+            return coin_id, ohlcv
+
+    coin_id = search_coin_id(crypto['name'], crypto['symbol'])
+    if not coin_id:
+        return None, None
+
+    # Увеличенная задержка для соблюдения лимитов API
+    time.sleep(3)  # Увеличено с 1.5 до 3 секунд
+    return coin_id, fetch_ohlc_data(coin_id, days=days)
+
+
 def search_alternative_coin_id(coin_name, coin_symbol, exclude_ids, retry_count=0):
     """Ищет альтернативный ID монеты, исключая уже проверенные"""
     if isinstance(exclude_ids, str):
         exclude_ids = [exclude_ids]
 
-    print(f"    🔎 Поиск альтернативных ID для {coin_name} ({coin_symbol}), исключая {', '.join(exclude_ids)}...",
-          flush=True)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("    🔎 Поиск альтернативных ID для %s (%s), исключая %s...", coin_name, coin_symbol, ', '.join(exclude_ids))
 
     # Пробуем различные варианты поиска
     search_queries = [
@@ -244,7 +274,7 @@ def search_alternative_coin_id(coin_name, coin_symbol, exclude_ids, retry_count=
             req.add_header('Accept', 'application/json')
 
             context = create_ssl_context()
-            response = urllib.request.urlopen(req, context=context, timeout=15)
+            response = http_cassette.urlopen(req, context=context, timeout=15)
             data = json.loads(response.read().decode('utf-8'))
 
             if 'coins' in data:
@@ -260,9 +290,7 @@ def search_alternative_coin_id(coin_name, coin_symbol, exclude_ids, retry_count=
                                 'name': coin.get('name', ''),
                                 'symbol': found_symbol
                             })
-                            print(
-                                f"    📍 Найдена альтернатива: {coin.get('name', '')} ({found_symbol}) - ID: {found_id}",
-                                flush=True)
+                            log.debug("    📍 Найдена альтернатива: %s (%s) - ID: %s", coin.get('name', ''), found_symbol, found_id)
 
             # Небольшая задержка между запросами
             if query != search_queries[-1]:
@@ -270,7 +298,7 @@ def search_alternative_coin_id(coin_name, coin_symbol, exclude_ids, retry_count=
 
         except urllib.error.HTTPError as e:
             if e.code == 429 and retry_count < 1:
-                print(f"    ⚠️ Rate limit при поиске альтернатив. Ожидание 30 секунд...", flush=True)
+                log.warning("    ⚠️ Rate limit при поиске альтернатив. Ожидание 30 секунд...")
                 time.sleep(30)
                 return search_alternative_coin_id(coin_name, coin_symbol, exclude_ids, retry_count + 1)
         except Exception:
@@ -303,7 +331,7 @@ def is_older_than_two_days(added_date_str):
 
 def parse_html_limited(html, limit=MAX_COINS):
     """Парсит HTML и извлекает данные только о первых N монетах"""
-    print(f"🔍 Парсинг HTML (ограничение: {limit} монет)...", flush=True)
+    log.info(f"🔍 Парсинг HTML (ограничение: {limit} монет)...")
 
     cryptos = []
 
@@ -312,8 +340,8 @@ def parse_html_limited(html, limit=MAX_COINS):
         table_pattern = r'<tr[^>]*class="[^"]*hover:tw-bg[^"]*"[^>]*>(.*?)</tr>'
         rows = re.findall(table_pattern, html, re.DOTALL)
 
-        print(f"📊 Найдено строк в таблице: {len(rows)}", flush=True)
-        print(f"🎯 Будут обработаны первые {limit} строк", flush=True)
+        log.info(f"📊 Найдено строк в таблице: {len(rows)}")
+        log.info(f"🎯 Будут обработаны первые {limit} строк")
 
         # Обрабатываем только первые N строк
         rows_to_process = rows[:limit] if len(rows) > limit else rows
@@ -323,15 +351,15 @@ def parse_html_limited(html, limit=MAX_COINS):
                 crypto = parse_row(row)
                 if crypto:
                     cryptos.append(crypto)
-                    print(f"✅ [{i + 1}/{limit}] Найдена монета: {crypto['name']} ({crypto['symbol']})", flush=True)
+                    log.debug("✅ [%d/%d] Найдена монета: %s (%s)", i + 1, limit, crypto['name'], crypto['symbol'])
             except Exception as e:
-                print(f"⚠️ Ошибка при парсинге строки {i + 1}: {e}", flush=True)
+                log.warning(f"⚠️ Ошибка при парсинге строки {i + 1}: {e}")
                 continue
 
         return cryptos
 
     except Exception as e:
-        print(f"❌ Ошибка при парсинге: {e}", flush=True)
+        log.error(f"❌ Ошибка при парсинге: {e}")
         return []
 
 
@@ -348,6 +376,7 @@ def parse_row(row_html):
 
     # Индекс 2 - название и символ
     name_cell = cells[2]
+    crypto['page_slug'] = page_slug(name_cell)
 
     # Ищем все текстовое содержимое между тегами
     text_pattern = r'>([^<>]+)<'
@@ -504,18 +533,28 @@ def save_data(cryptos):
     try:
         with open(data_file, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"💾 Данные сохранены: {data_file}", flush=True)
+        log.info(f"💾 Данные сохранены: {data_file}")
     except Exception as e:
-        print(f"❌ Ошибка сохранения: {e}", flush=True)
+        log.error(f"❌ Ошибка сохранения: {e}")
 
-    # Сохраняем историю
-    history_file = os.path.join(log_dir, f'last_50_cryptos_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    # Дописываем историю: изменения листинга и только новые свечи (пустой запуск не пишется)
+    if not cryptos:
+        return
     try:
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        print(f"📄 История сохранена: {history_file}", flush=True)
+        history_file, written = HistoryStore(os.path.join(log_dir, 'history')).append(
+            cryptos, BASE_URL, data['timestamp'])
+        log.info(f"📄 История дописана: {history_file} (+{written / 1024:.1f} KB)")
     except Exception as e:
-        print(f"⚠️ Ошибка сохранения истории: {e}", flush=True)
+        log.warning(f"⚠️ Ошибка сохранения истории: {e}")
+
+    # Бинарное хранилище свечей для установок без PostgreSQL (включается CANDLE_STORE_DIR)
+    if CANDLE_STORE_DIR:
+        try:
+            stored = sum(store_candles(CANDLE_STORE_DIR, candle_key(crypto), crypto['ohlcv'])
+                         for crypto in cryptos if crypto.get('ohlcv'))
+            log.info(f"🗃️ Хранилище свечей {CANDLE_STORE_DIR}: новых свечей {stored}")
+        except Exception as e:
+            log.warning(f"⚠️ Ошибка записи в хранилище свечей: {e}")
 
 
 def generate_report(cryptos):
@@ -558,22 +597,22 @@ def generate_report(cryptos):
                         f.write(
                             f"      {j + 1}. {full_datetime} - O: {candle['open']:.8f}, H: {candle['high']:.8f}, L: {candle['low']:.8f}, C: {candle['close']:.8f}\n")
 
-        print(f"📊 Отчет создан: {report_file}", flush=True)
+        log.info(f"📊 Отчет создан: {report_file}")
     except Exception as e:
-        print(f"❌ Ошибка создания отчета: {e}", flush=True)
+        log.error(f"❌ Ошибка создания отчета: {e}")
 
 
 def main():
-    print("=" * 80, flush=True)
-    print("🚀 ПАРСЕР ПОСЛЕДНИХ 50 НОВЫХ КРИПТОВАЛЮТ COINGECKO С OHLCV", flush=True)
-    print(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", flush=True)
-    print("=" * 80 + "\n", flush=True)
+    log.info("=" * 80)
+    log.info("🚀 ПАРСЕР ПОСЛЕДНИХ 50 НОВЫХ КРИПТОВАЛЮТ COINGECKO С OHLCV")
+    log.info(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    log.info("=" * 80)
 
     # Загружаем страницу
     html = fetch_page()
 
     if not html:
-        print("❌ Не удалось загрузить страницу", flush=True)
+        log.error("❌ Не удалось загрузить страницу")
         save_data([])
         return
 
@@ -581,54 +620,44 @@ def main():
     cryptos = parse_html_limited(html, limit=MAX_COINS)
 
     if cryptos:
-        print(f"\n✅ Успешно распарсено {len(cryptos)} монет", flush=True)
+        log.info(f"✅ Успешно распарсено {len(cryptos)} монет")
 
         # Проверяем какие монеты старше 2 дней и получаем для них OHLCV
-        print(f"\n📊 Получение 4-часовых OHLCV данных для монет старше 2 дней...\n", flush=True)
+        log.info("📊 Получение 4-часовых OHLCV данных для монет старше 2 дней...")
 
         ohlcv_count = 0
         for crypto in cryptos:
             if is_older_than_two_days(crypto['added']):
-                print(f"🔍 {crypto['name']} ({crypto['symbol']}) - монета старше 2 дней", flush=True)
+                log.info(f"🔍 {crypto['name']} ({crypto['symbol']}) - монета старше 2 дней")
 
-                # Ищем ID монеты
-                coin_id = search_coin_id(crypto['name'], crypto['symbol'])
+                # ID монеты из ссылки на ее страницу (поиск - только если не подошел) и OHLCV за 30 дней
+                coin_id, ohlcv = fetch_ohlc_for_listing(crypto)
 
                 if coin_id:
-                    # Увеличенная задержка для соблюдения лимитов API
-                    time.sleep(3)  # Увеличено с 1.5 до 3 секунд
-
-                    # Получаем OHLCV данные с 4-часовым таймфреймом
-                    ohlcv = fetch_ohlc_data(coin_id, days=30)  # За последние 30 дней
-
                     if ohlcv:
                         # Проверяем соответствие количества свечей возрасту монеты
                         coin_age_days = get_coin_age_days(crypto['added'])
                         max_expected_candles = (coin_age_days * 24) // 4 + 6  # +6 для погрешности
                         actual_candles = len(ohlcv)
 
-                        print(
-                            f"    📊 Проверка данных: возраст монеты {coin_age_days} дней, ожидается макс. {max_expected_candles} свечей",
-                            flush=True)
-                        print(f"    📊 Получено свечей: {actual_candles}", flush=True)
+                        log.debug("    📊 Проверка данных: возраст монеты %d дней, ожидается макс. %d свечей, получено %d",
+                                  coin_age_days, max_expected_candles, actual_candles)
 
-                        if actual_candles > max_expected_candles * 2:  # Если свечей в 2 раза больше ожидаемого
-                            print(
-                                f"    ⚠️ ВНИМАНИЕ: Количество свечей ({actual_candles}) не соответствует возрасту монеты ({coin_age_days} дней)",
-                                flush=True)
-                            print(f"    ⚠️ Возможно, найдена другая монета с похожим названием!", flush=True)
+                        # ID из ссылки страницы - та же монета, перепроверка поиском не нужна
+                        if actual_candles > max_expected_candles * 2 and coin_id != crypto.get('page_slug'):
+                            log.warning(
+                                f"    ⚠️ ВНИМАНИЕ: Количество свечей ({actual_candles}) не соответствует возрасту монеты ({coin_age_days} дней)")
+                            log.warning("    ⚠️ Возможно, найдена другая монета с похожим названием!")
 
                             # Проверяем первую свечу
                             if ohlcv:
                                 first_candle_date = datetime.fromisoformat(ohlcv[0]['datetime'])
                                 days_since_first_candle = (datetime.now() - first_candle_date).days
-                                print(
-                                    f"    📅 Первая свеча датирована: {first_candle_date.strftime('%Y-%m-%d')} ({days_since_first_candle} дней назад)",
-                                    flush=True)
+                                log.info(
+                                    f"    📅 Первая свеча датирована: {first_candle_date.strftime('%Y-%m-%d')} ({days_since_first_candle} дней назад)")
 
                             # Пробуем найти другую монету с таким же символом
-                            print(f"    🔄 Продолжаем поиск более новой монеты {crypto['name']} ({crypto['symbol']})...",
-                                  flush=True)
+                            log.info(f"    🔄 Продолжаем поиск более новой монеты {crypto['name']} ({crypto['symbol']})...")
 
                             # Список уже проверенных ID
                             checked_ids = [coin_id]
@@ -643,8 +672,7 @@ def main():
                                     break
 
                                 alternative_id = alt['id']
-                                print(f"    🔍 Проверяем альтернативную монету: {alt['name']} - ID: {alternative_id}",
-                                      flush=True)
+                                log.debug("    🔍 Проверяем альтернативную монету: %s - ID: %s", alt['name'], alternative_id)
                                 time.sleep(3)
 
                                 # Получаем OHLCV для альтернативной монеты
@@ -652,20 +680,16 @@ def main():
 
                                 if alt_ohlcv:
                                     alt_candles_count = len(alt_ohlcv)
-                                    print(f"    📊 Альтернативная монета: получено {alt_candles_count} свечей",
-                                          flush=True)
-
-                                    # Проверяем первую свечу альтернативной монеты
-                                    alt_first_candle_date = datetime.fromisoformat(alt_ohlcv[0]['datetime'])
-                                    alt_days_since_first = (datetime.now() - alt_first_candle_date).days
-                                    print(
-                                        f"    📅 Первая свеча: {alt_first_candle_date.strftime('%Y-%m-%d')} ({alt_days_since_first} дней назад)",
-                                        flush=True)
+                                    if log.isEnabledFor(logging.DEBUG):
+                                        # Первая свеча альтернативной монеты
+                                        alt_first_candle_date = datetime.fromisoformat(alt_ohlcv[0]['datetime'])
+                                        log.debug("    📊 Альтернативная монета: получено %d свечей, первая свеча: %s (%d дней назад)",
+                                                  alt_candles_count, alt_first_candle_date.strftime('%Y-%m-%d'),
+                                                  (datetime.now() - alt_first_candle_date).days)
 
                                     # Если альтернативная монета подходит по возрасту
                                     if alt_candles_count <= max_expected_candles * 1.5:
-                                        print(f"    ✅ Найдена подходящая монета! Используем ID: {alternative_id}",
-                                              flush=True)
+                                        log.info(f"    ✅ Найдена подходящая монета! Используем ID: {alternative_id}")
                                         crypto['ohlcv'] = alt_ohlcv
                                         crypto['coin_id'] = alternative_id
                                         crypto['candles_count'] = alt_candles_count
@@ -674,15 +698,13 @@ def main():
                                         found_suitable = True
                                         break
                                     else:
-                                        print(
-                                            f"    ❌ Монета {alternative_id} тоже слишком старая ({alt_candles_count} свечей)",
-                                            flush=True)
+                                        log.info(
+                                            f"    ⏭️ Монета {alternative_id} тоже слишком старая ({alt_candles_count} свечей)")
                                         checked_ids.append(alternative_id)
 
                             # Если не нашли подходящую монету среди альтернатив
                             if not found_suitable:
-                                print(f"    ❌ Не найдено подходящих альтернатив среди {len(alternatives)} кандидатов",
-                                      flush=True)
+                                log.warning(f"    ⚠️ Не найдено подходящих альтернатив среди {len(alternatives)} кандидатов")
                                 # Сохраняем первоначальные данные с предупреждением
                                 crypto['ohlcv'] = ohlcv
                                 crypto['coin_id'] = coin_id
@@ -699,12 +721,11 @@ def main():
                             crypto['expected_max_candles'] = max_expected_candles
                             ohlcv_count += 1
                 else:
-                    print(f"    ⚠️ Не удалось найти ID монеты\n", flush=True)
+                    log.warning("    ⚠️ Не удалось найти ID монеты")
             else:
-                print(f"ℹ️ {crypto['name']} ({crypto['symbol']}) - монета младше 2 дней, OHLCV не требуется",
-                      flush=True)
+                log.info(f"ℹ️ {crypto['name']} ({crypto['symbol']}) - монета младше 2 дней, OHLCV не требуется")
 
-        print(f"\n✅ Получено OHLCV для {ohlcv_count} монет", flush=True)
+        log.info(f"✅ Получено OHLCV для {ohlcv_count} монет")
 
         # Сохраняем данные
         save_data(cryptos)
@@ -713,22 +734,21 @@ def main():
         generate_report(cryptos)
 
         # Выводим краткую сводку в консоль
-        print("\n📈 ПОСЛЕДНИЕ 50 МОНЕТ:", flush=True)
-        print("-" * 100, flush=True)
+        log.info("📈 ПОСЛЕДНИЕ 50 МОНЕТ:")
+        log.info("-" * 100)
         for i, crypto in enumerate(cryptos, 1):
             has_ohlcv = "✓" if 'ohlcv' in crypto and crypto['ohlcv'] else " "
-            print(
-                f"{i:2d}. [{has_ohlcv}] {crypto['name']:<25} ({crypto['symbol']:<10}) - {crypto['chain']:<15} - {crypto['added_raw']}",
-                flush=True)
-        print("-" * 100, flush=True)
-        print(f"[✓] - монеты с OHLCV данными ({ohlcv_count} шт.)", flush=True)
+            log.info(
+                f"{i:2d}. [{has_ohlcv}] {crypto['name']:<25} ({crypto['symbol']:<10}) - {crypto['chain']:<15} - {crypto['added_raw']}")
+        log.info("-" * 100)
+        log.info(f"[✓] - монеты с OHLCV данными ({ohlcv_count} шт.)")
 
     else:
-        print("\n❌ Не удалось найти данные о монетах", flush=True)
+        log.error("❌ Не удалось найти данные о монетах")
         save_data([])
 
-    print("\n✅ Парсер завершил работу", flush=True)
-    print("=" * 80 + "\n", flush=True)
+    log.info("✅ Парсер завершил работу")
+    log.info("=" * 80)
 
 
 if __name__ == "__main__":
@@ -2,6 +2,7 @@
 """
 Модифицированная версия парсера с отдельными таблицами OHLC для каждой монеты
 """
+import argparse
 import urllib.request
 import urllib.parse
 import json
@@ -10,17 +11,61 @@ import re
 from datetime import datetime, timedelta
 import time
 import ssl
+import queue
+import threading
 import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
 import sys
 
+import http_cassette
+import coin_metrics
+from coin_identity import apply_identity, candle_key, find_existing_coin, page_slug, resolve_identities
+from log_config import get_logger
+from market_chart import CANDLE_SOURCE, bucket_market_chart
+import metrics
+from refresh_scheduler import (DEAD_AFTER_MISSES, classify_ohlcv, coin_age_days, is_due, load_due_tracked_coins,
+                               load_refresh_states, record_refresh_outcome, refresh_priority, run_deadline)
+from run_journal import RunJournal
+from run_ledger import RunLedger
+from sinks import JsonSnapshotSink, SingleTableDbSink, Sink, SinkFanout, TextReportSink
+
+log = get_logger('db')
+
 # URL страницы с новыми криптовалютами
-BASE_URL = "https://www.coingecko.com/ru/new-cryptocurrencies"
-API_BASE = "https://api.coingecko.com/api/v3"
+BASE_URL = os.environ.get('COINGECKO_PAGE_URL', "https://www.coingecko.com/ru/new-cryptocurrencies")
+API_BASE = os.environ.get('COINGECKO_API_BASE', "https://api.coingecko.com/api/v3")
+
+# Задержка между монетами и ожидание после 429 (секунды)
+API_DELAY = float(os.environ.get('API_DELAY', '3'))
+RATE_LIMIT_WAIT = float(os.environ.get('RATE_LIMIT_WAIT', '60'))
 
 # Количество монет для парсинга
 MAX_COINS = 50
 
+# Конвейер записи: количество потоков-писателей БД и размер очереди между загрузкой и записью
+DB_WRITERS = int(os.environ.get('DB_WRITERS', '1'))
+DB_QUEUE_SIZE = int(os.environ.get('DB_QUEUE_SIZE', '10'))
+
+# Приемники данных через запятую: db, single_db, json, report (см. sinks.py)
+OUTPUT_SINKS = os.environ.get('OUTPUT_SINKS', 'db')
+SINK_NAMES = ('db', 'single_db', 'json', 'report')
+
+# Водяные знаки OHLC таблиц: timestamp последней сохраненной свечи (кэш на время работы процесса)
+OHLC_WATERMARKS = {}
+
+# Кэш найденных ID монет: (SYMBOL, название) -> coin_gecko_id
+COIN_ID_CACHE = {}
+
+# ID, для которых CoinGecko вернул 404 на /ohlc (slug страницы не совпал с ID API)
+NOT_FOUND_COIN_IDS = set()
+
+# Общий для нескольких воркеров лимит запросов к API (задается в parser_worker.py)
+API_RATE_BUDGET = None
+
+# Событие остановки (SIGTERM в режиме демона): прерывает ожидание после ответа 429
+STOP_EVENT = threading.Event()
+
 # Настройки базы данных
 DB_CONFIG = {
     'host': os.environ.get('DB_HOST', 'localhost'),
@@ -31,13 +76,35 @@ DB_CONFIG = {
 }
 
 
+class MetricsCursor(psycopg2.extensions.cursor):
+    """Курсор, который считает запросы к БД и их время"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.inc('parser_db_round_trips_total')
+            metrics.observe('parser_db_query_seconds', time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        # executemany отправляет по запросу на каждую строку
+        vars_list = list(vars_list)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.inc('parser_db_round_trips_total', len(vars_list))
+            metrics.observe('parser_db_query_seconds', time.perf_counter() - started)
+
+
 def get_db_connection():
     """Создает подключение к базе данных"""
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = psycopg2.connect(**DB_CONFIG, cursor_factory=MetricsCursor)
         return conn
     except Exception as e:
-        print(f"❌ Ошибка подключения к БД: {e}", flush=True)
+        log.error(f"❌ Ошибка подключения к БД: {e}")
         return None
 
 
@@ -51,7 +118,7 @@ def create_ssl_context():
 
 def fetch_page():
     """Загружает HTML страницу"""
-    print(f"🌐 Загрузка страницы: {BASE_URL}", flush=True)
+    log.info(f"🌐 Загрузка страницы: {BASE_URL}")
 
     try:
         req = urllib.request.Request(BASE_URL)
@@ -65,30 +132,69 @@ def fetch_page():
         req.add_header('Upgrade-Insecure-Requests', '1')
 
         context = create_ssl_context()
-        response = urllib.request.urlopen(req, context=context, timeout=30)
+        started = time.perf_counter()
+        response = http_cassette.urlopen(req, context=context, timeout=30)
+        body = response.read()
+        metrics.observe('parser_page_fetch_seconds', time.perf_counter() - started)
+        metrics.observe('parser_page_bytes', len(body), buckets=metrics.SIZE_BUCKETS)
 
         if response.info().get('Content-Encoding') == 'gzip':
             import gzip
-            html = gzip.decompress(response.read()).decode('utf-8')
+            html = gzip.decompress(body).decode('utf-8')
         else:
-            html = response.read().decode('utf-8')
+            html = body.decode('utf-8')
 
-        print(f"✅ Страница загружена, размер: {len(html)} байт", flush=True)
+        log.info(f"✅ Страница загружена, размер: {len(html)} байт")
         return html
 
     except urllib.error.HTTPError as e:
-        print(f"❌ HTTP ошибка: {e.code} {e.reason}", flush=True)
+        log.error(f"❌ HTTP ошибка: {e.code} {e.reason}")
         if e.code == 403:
-            print("💡 CoinGecko блокирует запросы. Попробуйте использовать VPN", flush=True)
+            log.info("💡 CoinGecko блокирует запросы. Попробуйте использовать VPN")
         return None
     except Exception as e:
-        print(f"❌ Ошибка при загрузке: {e}", flush=True)
+        log.error(f"❌ Ошибка при загрузке: {e}")
         return None
 
 
+def wait_for_api_budget():
+    """Ждет свободный запрос в общем лимите API, если он включен"""
+    if API_RATE_BUDGET:
+        API_RATE_BUDGET.acquire()
+
+
+def fetch_api_json(req, context, endpoint):
+    """Выполняет запрос к API с учетом общего лимита и метрик, возвращает JSON"""
+    wait_for_api_budget()
+    started = time.perf_counter()
+    try:
+        response = http_cassette.urlopen(req, context=context, timeout=15)
+        body = response.read()
+    finally:
+        metrics.inc('parser_api_requests_total', endpoint=endpoint)
+        metrics.observe('parser_api_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+
+    metrics.inc('parser_api_response_bytes_total', len(body), endpoint=endpoint)
+    return json.loads(body.decode('utf-8'))
+
+
+def count_rate_limit(endpoint, wait_time):
+    """Учитывает ответ 429 и время ожидания после него"""
+    metrics.inc('parser_rate_limited_total', endpoint=endpoint)
+    metrics.inc('parser_retry_sleep_seconds_total', wait_time, endpoint=endpoint)
+
+
+def wait_before_retry(wait_time):
+    """Ждет перед повторным запросом, возвращает False, если пришла остановка"""
+    if STOP_EVENT.wait(wait_time):
+        log.info("    🛑 Ожидание прервано остановкой, повтор отменен")
+        return False
+    return True
+
+
 def search_coin_id(coin_name, coin_symbol, retry_count=0):
     """Ищет ID монеты в CoinGecko API"""
-    print(f"  🔍 Поиск ID для {coin_name} ({coin_symbol})...", flush=True)
+    log.info(f"  🔍 Поиск ID для {coin_name} ({coin_symbol})...")
 
     search_query = coin_symbol.lower()
     url = f"{API_BASE}/search?query={urllib.parse.quote(search_query)}"
@@ -99,8 +205,7 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
         req.add_header('Accept', 'application/json')
 
         context = create_ssl_context()
-        response = urllib.request.urlopen(req, context=context, timeout=15)
-        data = json.loads(response.read().decode('utf-8'))
+        data = fetch_api_json(req, context, 'search')
 
         if 'coins' in data:
             for coin in data['coins']:
@@ -109,10 +214,10 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
                     found_name = coin.get('name', '')
                     found_symbol = coin.get('symbol', '').upper()
 
-                    print(f"    📌 Найден кандидат: {found_name} ({found_symbol}) - ID: {found_id}", flush=True)
+                    log.debug("    📌 Найден кандидат: %s (%s) - ID: %s", found_name, found_symbol, found_id)
 
                     if coin_name.lower() in found_name.lower() or found_name.lower() in coin_name.lower():
-                        print(f"    ✅ Подтверждено совпадение по названию и символу", flush=True)
+                        log.info("    ✅ Подтверждено совпадение по названию и символу")
                         return found_id
 
         # Пробуем поиск по названию
@@ -123,8 +228,7 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
         req.add_header('User-Agent', 'Mozilla/5.0')
         req.add_header('Accept', 'application/json')
 
-        response = urllib.request.urlopen(req, context=context, timeout=15)
-        data = json.loads(response.read().decode('utf-8'))
+        data = fetch_api_json(req, context, 'search')
 
         if 'coins' in data and len(data['coins']) > 0:
             for coin in data['coins'][:5]:
@@ -132,23 +236,44 @@ def search_coin_id(coin_name, coin_symbol, retry_count=0):
                 found_symbol = coin.get('symbol', '').upper()
 
                 if found_symbol == coin_symbol.upper():
-                    print(f"    ✅ Найдено точное совпадение по символу", flush=True)
+                    log.info("    ✅ Найдено точное совпадение по символу")
                     return found_id
 
     except urllib.error.HTTPError as e:
         if e.code == 429 and retry_count < 3:
-            wait_time = 60 * (retry_count + 1)
-            print(f"    ⚠️ Rate limit превышен. Ожидание {wait_time} секунд...", flush=True)
-            time.sleep(wait_time)
-            return search_coin_id(coin_name, coin_symbol, retry_count + 1)
+            wait_time = RATE_LIMIT_WAIT * (retry_count + 1)
+            log.warning(f"    ⚠️ Rate limit превышен. Ожидание {wait_time} секунд...")
+            count_rate_limit('search', wait_time)
+            if wait_before_retry(wait_time):
+                return search_coin_id(coin_name, coin_symbol, retry_count + 1)
         else:
-            print(f"    ❌ Ошибка поиска: {e}", flush=True)
+            log.warning(f"    ⚠️ Ошибка поиска: {e}")
     except Exception as e:
-        print(f"    ❌ Ошибка поиска: {e}", flush=True)
+        log.warning(f"    ⚠️ Ошибка поиска: {e}")
 
     return None
 
 
+def build_ohlc_candle(candle):
+    """Преобразует свечу API [timestamp, open, high, low, close] (и volume, если есть) в словарь"""
+    timestamp = candle[0]
+    dt = datetime.fromtimestamp(timestamp / 1000)
+
+    result = {
+        'timestamp': timestamp,
+        'datetime': dt.isoformat(),
+        'date': dt.strftime('%Y-%m-%d'),
+        'time': dt.strftime('%H:%M:%S'),
+        'open': candle[1],
+        'high': candle[2],
+        'low': candle[3],
+        'close': candle[4]
+    }
+    if len(candle) > 5 and candle[5] is not None:
+        result['volume'] = candle[5]
+    return result
+
+
 def fetch_ohlc_data(coin_id, days=30, retry_count=0):
     """Получает OHLCV данные для монеты"""
     url = f"{API_BASE}/coins/{coin_id}/ohlc?vs_currency=usd&days={days}"
@@ -159,51 +284,88 @@ def fetch_ohlc_data(coin_id, days=30, retry_count=0):
         req.add_header('Accept', 'application/json')
 
         context = create_ssl_context()
-        response = urllib.request.urlopen(req, context=context, timeout=15)
-
-        data = json.loads(response.read().decode('utf-8'))
+        data = fetch_api_json(req, context, 'ohlc')
 
         if data and len(data) > 0:
             ohlc_processed = []
 
             for candle in data:
                 if len(candle) >= 5:
-                    timestamp = candle[0]
-                    dt = datetime.fromtimestamp(timestamp / 1000)
-
-                    ohlc_processed.append({
-                        'timestamp': timestamp,
-                        'datetime': dt.isoformat(),
-                        'date': dt.strftime('%Y-%m-%d'),
-                        'time': dt.strftime('%H:%M:%S'),
-                        'open': candle[1],
-                        'high': candle[2],
-                        'low': candle[3],
-                        'close': candle[4]
-                    })
-
-            print(f"    ✅ Получено {len(ohlc_processed)} 4-часовых OHLC свечей", flush=True)
+                    ohlc_processed.append(build_ohlc_candle(candle))
+
+            log.info(f"    ✅ Получено {len(ohlc_processed)} 4-часовых OHLC свечей")
+            return ohlc_processed
+
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            NOT_FOUND_COIN_IDS.add(coin_id)
+            log.warning("    ⚠️ OHLC данные не найдены")
+        elif e.code == 429:
+            if retry_count < 3:
+                log.warning(f"    ⚠️ Превышен лимит API. Ожидание {RATE_LIMIT_WAIT:.0f} секунд...")
+                count_rate_limit('ohlc', RATE_LIMIT_WAIT)
+                if wait_before_retry(RATE_LIMIT_WAIT):
+                    log.info(f"    🔄 Повторная попытка получения OHLC для {coin_id}...")
+                    return fetch_ohlc_data(coin_id, days, retry_count + 1)
+            else:
+                metrics.inc('parser_rate_limited_total', endpoint='ohlc')
+                log.warning("    ⚠️ Превышен лимит попыток для получения OHLC")
+        else:
+            log.warning(f"    ⚠️ HTTP ошибка {e.code}")
+    except Exception as e:
+        log.error(f"    ❌ Ошибка: {e}")
+
+    return None
+
+
+def fetch_market_chart_data(coin_id, days=30, retry_count=0):
+    """Получает 4-часовые свечи с объемом из /market_chart (цены и объемы одним запросом)"""
+    url = f"{API_BASE}/coins/{coin_id}/market_chart?vs_currency=usd&days={days}"
+
+    try:
+        req = urllib.request.Request(url)
+        req.add_header('User-Agent', 'Mozilla/5.0')
+        req.add_header('Accept', 'application/json')
+
+        context = create_ssl_context()
+        data = fetch_api_json(req, context, 'market_chart')
+
+        candles = bucket_market_chart(data or {})
+        if candles:
+            ohlc_processed = [build_ohlc_candle(candle) for candle in candles]
+            with_volume = sum(1 for candle in ohlc_processed if 'volume' in candle)
+            log.info(f"    ✅ Получено {len(ohlc_processed)} 4-часовых OHLC свечей (с объемом: {with_volume})")
             return ohlc_processed
 
     except urllib.error.HTTPError as e:
         if e.code == 404:
-            print(f"    ⚠️ OHLC данные не найдены", flush=True)
+            NOT_FOUND_COIN_IDS.add(coin_id)
+            log.warning("    ⚠️ Данные market_chart не найдены")
         elif e.code == 429:
             if retry_count < 3:
-                print(f"    ⚠️ Превышен лимит API. Ожидание 60 секунд...", flush=True)
-                time.sleep(60)
-                print(f"    🔄 Повторная попытка получения OHLC для {coin_id}...", flush=True)
-                return fetch_ohlc_data(coin_id, days, retry_count + 1)
+                log.warning(f"    ⚠️ Превышен лимит API. Ожидание {RATE_LIMIT_WAIT:.0f} секунд...")
+                count_rate_limit('market_chart', RATE_LIMIT_WAIT)
+                if wait_before_retry(RATE_LIMIT_WAIT):
+                    log.info(f"    🔄 Повторная попытка получения market_chart для {coin_id}...")
+                    return fetch_market_chart_data(coin_id, days, retry_count + 1)
             else:
-                print(f"    ❌ Превышен лимит попыток для получения OHLC", flush=True)
+                metrics.inc('parser_rate_limited_total', endpoint='market_chart')
+                log.warning("    ⚠️ Превышен лимит попыток для получения market_chart")
         else:
-            print(f"    ❌ HTTP ошибка {e.code}", flush=True)
+            log.warning(f"    ⚠️ HTTP ошибка {e.code}")
     except Exception as e:
-        print(f"    ❌ Ошибка: {e}", flush=True)
+        log.error(f"    ❌ Ошибка: {e}")
 
     return None
 
 
+def fetch_candles(coin_id, days=30):
+    """Свечи монеты из источника CANDLE_SOURCE (ohlc или market_chart)"""
+    if CANDLE_SOURCE == 'market_chart':
+        return fetch_market_chart_data(coin_id, days=days)
+    return fetch_ohlc_data(coin_id, days=days)
+
+
 def is_older_than_two_days(added_date_str):
     """Проверяет, старше ли монета двух дней"""
     try:
@@ -217,7 +379,7 @@ def is_older_than_two_days(added_date_str):
 
 def parse_html_limited(html, limit=MAX_COINS):
     """Парсит HTML и извлекает данные о монетах"""
-    print(f"🔍 Парсинг HTML (ограничение: {limit} монет)...", flush=True)
+    log.info(f"🔍 Парсинг HTML (ограничение: {limit} монет)...")
 
     cryptos = []
 
@@ -225,8 +387,8 @@ def parse_html_limited(html, limit=MAX_COINS):
         table_pattern = r'<tr[^>]*class="[^"]*hover:tw-bg[^"]*"[^>]*>(.*?)</tr>'
         rows = re.findall(table_pattern, html, re.DOTALL)
 
-        print(f"📊 Найдено строк в таблице: {len(rows)}", flush=True)
-        print(f"🎯 Будут обработаны первые {limit} строк", flush=True)
+        log.info(f"📊 Найдено строк в таблице: {len(rows)}")
+        log.info(f"🎯 Будут обработаны первые {limit} строк")
 
         rows_to_process = rows[:limit] if len(rows) > limit else rows
 
@@ -235,15 +397,16 @@ def parse_html_limited(html, limit=MAX_COINS):
                 crypto = parse_row(row)
                 if crypto:
                     cryptos.append(crypto)
-                    print(f"✅ [{i + 1}/{limit}] Найдена монета: {crypto['name']} ({crypto['symbol']})", flush=True)
+                    log.debug("✅ [%d/%d] Найдена монета: %s (%s)", i + 1, limit, crypto['name'], crypto['symbol'])
             except Exception as e:
-                print(f"⚠️ Ошибка при парсинге строки {i + 1}: {e}", flush=True)
+                log.warning(f"⚠️ Ошибка при парсинге строки {i + 1}: {e}")
                 continue
 
+        metrics.inc('parser_rows_parsed_total', len(cryptos))
         return cryptos
 
     except Exception as e:
-        print(f"❌ Ошибка при парсинге: {e}", flush=True)
+        log.error(f"❌ Ошибка при парсинге: {e}")
         return []
 
 
@@ -259,6 +422,7 @@ def parse_row(row_html):
 
     # Парсинг названия и символа
     name_cell = cells[2]
+    crypto['page_slug'] = page_slug(name_cell)
     text_pattern = r'>([^<>]+)<'
     all_texts = re.findall(text_pattern, name_cell)
 
@@ -359,135 +523,315 @@ def parse_added_date(added_text):
     return now.strftime('%Y-%m-%d')
 
 
-def save_to_database_with_separate_tables(cryptos):
-    """Сохраняет данные в БД с отдельными таблицами для OHLC"""
-    conn = get_db_connection()
-    if not conn:
-        print("❌ Не удалось подключиться к базе данных", flush=True)
-        return
-
-    cursor = conn.cursor()
-    saved_count = 0
-    updated_count = 0
+def update_latest_candle(cursor, crypto_id, ohlcv):
+    """Обновляет снимок последней свечи монеты в таблице latest_candle"""
+    latest = max(ohlcv, key=lambda candle: candle['timestamp'])
+
+    cursor.execute("""
+        INSERT INTO latest_candle
+        (crypto_id, "timestamp", datetime, open, high, low, close)
+        VALUES (%s, %s, ohlc_datetime(%s), %s, %s, %s, %s)
+        ON CONFLICT (crypto_id) DO UPDATE SET
+            "timestamp" = EXCLUDED."timestamp",
+            datetime = EXCLUDED.datetime,
+            open = EXCLUDED.open,
+            high = EXCLUDED.high,
+            low = EXCLUDED.low,
+            close = EXCLUDED.close,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE latest_candle."timestamp" <= EXCLUDED."timestamp"
+    """, (
+        crypto_id,
+        latest['timestamp'],
+        latest['timestamp'],
+        float(latest['open']),
+        float(latest['high']),
+        float(latest['low']),
+        float(latest['close'])
+    ))
+
+
+def save_crypto(cursor, crypto):
+    """Сохраняет одну монету и ее OHLC данные.
+
+    Возвращает (новая ли монета, новых свечей, водяной знак). Водяной знак
+    (таблица, timestamp) нужно передать в remember_ohlc_watermark() после commit.
+    """
+    is_new = False
     ohlc_saved_count = 0
+    pending_watermark = None
+
+    # Ищем монету по slug, ID CoinGecko или символу с близкой датой добавления
+    existing = find_existing_coin(cursor, crypto)
+
+    if existing:
+        crypto_id = existing['id']
+        ohlc_table_name = existing['ohlc_table_name']
+        apply_identity(crypto, existing)
+
+        # Обновляем данные монеты
+        cursor.execute("""
+            UPDATE cryptocurrencies SET
+                name = %s,
+                chain = %s,
+                price = %s,
+                change_24h = %s,
+                market_cap = %s,
+                fdv = %s,
+                added_raw = %s,
+                coin_gecko_id = COALESCE(%s, coin_gecko_id),
+                page_slug = COALESCE(page_slug, %s)
+            WHERE id = %s
+        """, (
+            crypto['name'],
+            crypto['chain'],
+            crypto['price'],
+            crypto['change_24h'],
+            crypto['market_cap'],
+            crypto['fdv'],
+            crypto['added_raw'],
+            crypto.get('coin_id'),
+            crypto.get('page_slug'),
+            crypto_id
+        ))
+    else:
+        # Вставляем новую монету (триггер автоматически создаст OHLC таблицу)
+        cursor.execute("""
+            INSERT INTO cryptocurrencies 
+            (name, symbol, chain, price, change_24h, market_cap, fdv, 
+             added_date, added_raw, coin_gecko_id, page_slug)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id, ohlc_table_name
+        """, (
+            crypto['name'],
+            crypto['symbol'],
+            crypto['chain'],
+            crypto['price'],
+            crypto['change_24h'],
+            crypto['market_cap'],
+            crypto['fdv'],
+            crypto['added'],
+            crypto['added_raw'],
+            crypto.get('coin_id'),
+            crypto.get('page_slug')
+        ))
+        result = cursor.fetchone()
+        crypto_id = result[0]
+        ohlc_table_name = result[1]
+        is_new = True
+        log.info(f"    📊 Создана таблица OHLC: {ohlc_table_name}")
+
+    # Сохраняем OHLC данные в отдельную таблицу
+    if 'ohlcv' in crypto and crypto['ohlcv'] and ohlc_table_name:
+        # Последняя сохраненная свеча (из кэша или одним запросом по первичному ключу)
+        watermark = get_ohlc_watermark(cursor, ohlc_table_name)
+
+        # Подготавливаем данные для вставки (только новые)
+        new_ohlc_data = []
+        for candle in crypto['ohlcv']:
+            if watermark is None or candle['timestamp'] > watermark:
+                new_ohlc_data.append((
+                    candle['timestamp'],
+                    float(candle['open']),
+                    float(candle['high']),
+                    float(candle['low']),
+                    float(candle['close']),
+                    candle.get('volume')
+                ))
+
+        # Вставляем только новые OHLC данные (компактный формат, см. migrate_compact_ohlc.sql)
+        if new_ohlc_data:
+            insert_query = f"""
+                INSERT INTO {ohlc_table_name} 
+                ("timestamp", open, high, low, close, volume)
+                VALUES %s
+                ON CONFLICT ("timestamp") DO NOTHING
+            """
+            # Один INSERT на все свечи: rowcount - реально вставленные строки, без конфликтов
+            execute_values(cursor, insert_query, new_ohlc_data, page_size=len(new_ohlc_data))
+            ohlc_saved_count = cursor.rowcount
+
+        # Обновляем снимок последней свечи монеты
+        update_latest_candle(cursor, crypto_id, crypto['ohlcv'])
+
+        new_watermark = max(candle['timestamp'] for candle in crypto['ohlcv'])
+        if watermark is None or new_watermark > watermark:
+            pending_watermark = (ohlc_table_name, new_watermark)
+
+    # Результат обновления свечей для планировщика (в той же транзакции)
+    if crypto.get('refresh_outcome'):
+        status = record_refresh_outcome(cursor, crypto_id, crypto['added'],
+                                        crypto['refresh_outcome'], crypto.get('ohlcv'))
+        if status == 'dead':
+            log.info(f"    💤 {crypto['symbol']}: нет новых свечей {DEAD_AFTER_MISSES} запусков подряд - "
+                     f"монета понижена, следующая проверка через неделю")
+
+    return is_new, ohlc_saved_count, pending_watermark
+
+
+def get_ohlc_watermark(cursor, ohlc_table_name):
+    """Возвращает timestamp последней сохраненной свечи таблицы"""
+    if ohlc_table_name in OHLC_WATERMARKS:
+        return OHLC_WATERMARKS[ohlc_table_name]
+
+    cursor.execute(f'SELECT MAX("timestamp") FROM {ohlc_table_name}')
+    watermark = cursor.fetchone()[0]
+    OHLC_WATERMARKS[ohlc_table_name] = watermark
+    return watermark
+
+
+def remember_ohlc_watermark(pending_watermark):
+    """Запоминает водяной знак таблицы после успешного commit"""
+    if pending_watermark:
+        ohlc_table_name, watermark = pending_watermark
+        OHLC_WATERMARKS[ohlc_table_name] = watermark
+
+
+def new_save_stats():
+    """Счетчики сохранения в БД"""
+    return {'saved': 0, 'updated': 0, 'ohlc_saved': 0, 'errors': 0}
+
+
+def print_save_stats(stats):
+    """Печатает итоги сохранения в БД"""
+    log.info("💾 Сохранено в БД:")
+    log.info(f"   - Новых монет: {stats['saved']}")
+    log.info(f"   - Обновлено монет: {stats['updated']}")
+    log.info(f"   - Новых OHLC записей: {stats['ohlc_saved']}")
+    if stats['errors']:
+        log.info(f"   - Ошибок сохранения: {stats['errors']}")
+
+
+def db_writer_worker(write_queue, stats, stats_lock, worker_number, journal=None):
+    """Поток записи в БД: сохраняет монеты из очереди и фиксирует каждую сразу"""
+    conn = None
+    cursor = None
 
     try:
-        for crypto in cryptos:
+        while True:
+            crypto = write_queue.get()
             try:
-                # Проверяем существование монеты
-                cursor.execute("""
-                    SELECT id, ohlc_table_name FROM cryptocurrencies 
-                    WHERE symbol = %s AND added_date = %s
-                """, (crypto['symbol'], crypto['added']))
-
-                existing = cursor.fetchone()
-
-                if existing:
-                    crypto_id = existing[0]
-                    ohlc_table_name = existing[1]
-
-                    # Обновляем данные монеты
-                    cursor.execute("""
-                        UPDATE cryptocurrencies SET
-                            name = %s,
-                            chain = %s,
-                            price = %s,
-                            change_24h = %s,
-                            market_cap = %s,
-                            fdv = %s,
-                            added_raw = %s,
-                            coin_gecko_id = %s
-                        WHERE id = %s
-                    """, (
-                        crypto['name'],
-                        crypto['chain'],
-                        crypto['price'],
-                        crypto['change_24h'],
-                        crypto['market_cap'],
-                        crypto['fdv'],
-                        crypto['added_raw'],
-                        crypto.get('coin_id'),
-                        crypto_id
-                    ))
-                    updated_count += 1
-                else:
-                    # Вставляем новую монету (триггер автоматически создаст OHLC таблицу)
-                    cursor.execute("""
-                        INSERT INTO cryptocurrencies 
-                        (name, symbol, chain, price, change_24h, market_cap, fdv, 
-                         added_date, added_raw, coin_gecko_id)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        RETURNING id, ohlc_table_name
-                    """, (
-                        crypto['name'],
-                        crypto['symbol'],
-                        crypto['chain'],
-                        crypto['price'],
-                        crypto['change_24h'],
-                        crypto['market_cap'],
-                        crypto['fdv'],
-                        crypto['added'],
-                        crypto['added_raw'],
-                        crypto.get('coin_id')
-                    ))
-                    result = cursor.fetchone()
-                    crypto_id = result[0]
-                    ohlc_table_name = result[1]
-                    saved_count += 1
-                    print(f"    📊 Создана таблица OHLC: {ohlc_table_name}", flush=True)
-
-                # Сохраняем OHLC данные в отдельную таблицу
-                if 'ohlcv' in crypto and crypto['ohlcv'] and ohlc_table_name:
-                    # Получаем существующие timestamp для этой монеты
-                    cursor.execute(f"""
-                        SELECT timestamp FROM {ohlc_table_name}
-                    """)
-                    existing_timestamps = set(row[0] for row in cursor.fetchall())
-
-                    # Подготавливаем данные для вставки (только новые)
-                    new_ohlc_data = []
-                    for candle in crypto['ohlcv']:
-                        if candle['timestamp'] not in existing_timestamps:
-                            new_ohlc_data.append((
-                                candle['timestamp'],
-                                datetime.fromisoformat(candle['datetime']),
-                                datetime.strptime(candle['date'], '%Y-%m-%d').date(),
-                                datetime.strptime(candle['time'], '%H:%M:%S').time(),
-                                float(candle['open']),
-                                float(candle['high']),
-                                float(candle['low']),
-                                float(candle['close'])
-                            ))
-
-                    # Вставляем только новые OHLC данные
-                    if new_ohlc_data:
-                        insert_query = f"""
-                            INSERT INTO {ohlc_table_name} 
-                            (timestamp, datetime, date, time, open, high, low, close)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (timestamp) DO NOTHING
-                        """
-                        cursor.executemany(insert_query, new_ohlc_data)
-                        ohlc_saved_count += len(new_ohlc_data)
-
-                conn.commit()
+                if crypto is None:
+                    break
+
+                # Подключаемся заново, если соединения нет или оно оборвалось
+                if conn is None or conn.closed:
+                    conn = get_db_connection()
+                    cursor = conn.cursor() if conn else None
+
+                if not conn:
+                    log.error(f"❌ Писатель БД #{worker_number}: нет подключения, {crypto['symbol']} пропущена")
+                    with stats_lock:
+                        stats['errors'] += 1
+                    metrics.inc('parser_save_errors_total')
+                    continue
+
+                try:
+                    is_new, ohlc_saved, pending_watermark = save_crypto(cursor, crypto)
+                    conn.commit()
+                    remember_ohlc_watermark(pending_watermark)
+                    if journal and crypto.get('refresh_outcome'):
+                        journal.committed(crypto)
+                except Exception as e:
+                    log.warning(f"⚠️ Ошибка при сохранении {crypto['name']}: {e}")
+                    if not conn.closed:
+                        conn.rollback()
+                    with stats_lock:
+                        stats['errors'] += 1
+                    metrics.inc('parser_save_errors_total')
+                    continue
+
+                with stats_lock:
+                    stats['saved' if is_new else 'updated'] += 1
+                    stats['ohlc_saved'] += ohlc_saved
+                metrics.inc('parser_coins_saved_total', status='new' if is_new else 'updated')
+                metrics.inc('parser_ohlc_rows_inserted_total', ohlc_saved)
+
+                if ohlc_saved:
+                    log.info(f"    💾 {crypto['symbol']}: записано {ohlc_saved} новых свечей")
+            finally:
+                write_queue.task_done()
+    finally:
+        if cursor and not cursor.closed:
+            cursor.close()
+        if conn and not conn.closed:
+            conn.close()
 
-            except Exception as e:
-                print(f"⚠️ Ошибка при сохранении {crypto['name']}: {e}", flush=True)
-                conn.rollback()
-                continue
 
-        print(f"\n💾 Сохранено в БД:", flush=True)
-        print(f"   - Новых монет: {saved_count}", flush=True)
-        print(f"   - Обновлено монет: {updated_count}", flush=True)
-        print(f"   - Новых OHLC записей: {ohlc_saved_count}", flush=True)
+def start_db_writers(writers_count=DB_WRITERS, queue_size=DB_QUEUE_SIZE, journal=None):
+    """Запускает потоки записи в БД, возвращает (очередь, потоки, статистика)"""
+    write_queue = queue.Queue(maxsize=queue_size)
+    stats = new_save_stats()
+    stats_lock = threading.Lock()
 
-    except Exception as e:
-        print(f"❌ Общая ошибка при сохранении в БД: {e}", flush=True)
-        conn.rollback()
-    finally:
-        cursor.close()
-        conn.close()
+    writers = []
+    for worker_number in range(1, writers_count + 1):
+        writer = threading.Thread(
+            target=db_writer_worker,
+            args=(write_queue, stats, stats_lock, worker_number, journal),
+            name=f"db-writer-{worker_number}",
+            daemon=True
+        )
+        writer.start()
+        writers.append(writer)
+
+    return write_queue, writers, stats
+
+
+def enqueue_for_write(write_queue, crypto):
+    """Передает монету писателям БД; блокируется, если БД не успевает (backpressure)"""
+    if write_queue.full():
+        log.info(f"    ⏳ Очередь записи в БД заполнена ({write_queue.maxsize}), ожидание...")
+    write_queue.put(crypto)
+
+
+def stop_db_writers(write_queue, writers, stats):
+    """Дожидается записи всех монет из очереди и останавливает потоки"""
+    for _ in writers:
+        write_queue.put(None)
+    for writer in writers:
+        writer.join()
+
+    print_save_stats(stats)
+
+
+class SeparateTablesDbSink(Sink):
+    """Приемник БД с отдельными OHLC таблицами: передает монеты писателям БД"""
+
+    name = 'db'
+    bounded = True
+
+    def __init__(self, journal=None):
+        self.write_queue, self.writers, self.stats = start_db_writers(journal=journal)
+        log.info(f"💾 Запущено писателей БД: {len(self.writers)}, размер очереди: {self.write_queue.maxsize}")
+
+    def write(self, crypto):
+        enqueue_for_write(self.write_queue, crypto)
+
+    def close(self):
+        stop_db_writers(self.write_queue, self.writers, self.stats)
+
+
+def build_sinks(sink_names, journal=None):
+    """Создает приемники по именам, возвращает (раздатчик, статистика БД или None)"""
+    sinks = []
+    db_stats = None
+
+    for name in sink_names:
+        if name == 'db':
+            db_sink = SeparateTablesDbSink(journal)
+            db_stats = db_sink.stats
+            sinks.append(db_sink)
+        elif name == 'single_db':
+            sinks.append(SingleTableDbSink(dict(DB_CONFIG, database=os.environ.get('SINGLE_TABLE_DB_NAME',
+                                                                                    DB_CONFIG['database']))))
+        elif name == 'json':
+            sinks.append(JsonSnapshotSink())
+        elif name == 'report':
+            sinks.append(TextReportSink())
+
+    log.info(f"📤 Приемники данных: {', '.join(sink.name for sink in sinks)}")
+    return SinkFanout(sinks, DB_QUEUE_SIZE), db_stats
 
 
 def get_database_stats_separate_tables():
@@ -547,100 +891,389 @@ def get_database_stats_separate_tables():
         return stats
 
     except Exception as e:
-        print(f"❌ Ошибка получения статистики: {e}", flush=True)
+        log.error(f"❌ Ошибка получения статистики: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def load_coin_id_cache():
+    """Загружает уже известные ID монет из БД в COIN_ID_CACHE, возвращает их количество"""
+    conn = get_db_connection()
+    if not conn:
+        return 0
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT symbol, name, coin_gecko_id FROM cryptocurrencies
+            WHERE coin_gecko_id IS NOT NULL
+        """)
+        for symbol, name, coin_gecko_id in cursor.fetchall():
+            COIN_ID_CACHE[(symbol.upper(), name.lower())] = coin_gecko_id
+        return len(COIN_ID_CACHE)
+    except Exception as e:
+        log.warning(f"⚠️ Не удалось загрузить кэш ID монет: {e}")
+        return 0
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def resolve_coin_id(crypto):
+    """ID монеты и его источник: ссылка на страницу монеты, затем известный или кэш, затем поиск.
+
+    ID, на которые /ohlc уже ответил 404, пропускаются.
+    """
+    slug = crypto.get('page_slug')
+    if slug and slug not in NOT_FOUND_COIN_IDS:
+        log.info(f"    🔗 ID из ссылки страницы: {slug}")
+        metrics.inc('parser_coin_id_lookups_total', result='page_link')
+        return slug, 'page_link'
+
+    coin_id = crypto.get('coin_id') or COIN_ID_CACHE.get((crypto['symbol'].upper(), crypto['name'].lower()))
+    if coin_id and coin_id not in NOT_FOUND_COIN_IDS:
+        log.info(f"    ⚡ ID из кэша: {coin_id}")
+        metrics.inc('parser_coin_id_lookups_total', result='cache')
+        return coin_id, 'cache'
+
+    coin_id = search_coin_id(crypto['name'], crypto['symbol'])
+    metrics.inc('parser_coin_id_lookups_total', result='search_hit' if coin_id else 'search_miss')
+    return coin_id, 'search'
+
+
+def fetch_crypto_ohlcv(crypto, journal=None):
+    """Находит ID монеты и загружает ее OHLCV, возвращает True если свечи получены"""
+    # Демон обновляет одни и те же словари монет: свечи и исход прошлого цикла не должны
+    # записаться вместе с исходом этого, если загрузка завершится раньше
+    crypto.pop('ohlcv', None)
+    crypto.pop('refresh_outcome', None)
+
+    if not is_older_than_two_days(crypto['added']):
+        log.info(f"ℹ️ {crypto['name']} ({crypto['symbol']}) - монета младше 2 дней, OHLC не требуется")
+        return False
+
+    log.info(f"🔍 {crypto['name']} ({crypto['symbol']}) - монета старше 2 дней")
+
+    # ID монеты: из ссылки на страницу, уже известный или из кэша; поиск - только если их нет
+    coin_id, source = resolve_coin_id(crypto)
+    ohlcv = None
+    while coin_id:
+        COIN_ID_CACHE[(crypto['symbol'].upper(), crypto['name'].lower())] = coin_id
+        if journal:
+            journal.id_resolved(crypto, coin_id)
+
+        time.sleep(API_DELAY)  # Задержка для соблюдения лимитов API
+
+        # Получаем OHLCV данные
+        ohlcv = fetch_candles(coin_id, days=30)
+        if ohlcv or source == 'search' or coin_id not in NOT_FOUND_COIN_IDS:
+            break
+        # API не знает ID из ссылки или кэша - следующий источник
+        log.info(f"    🔄 ID {coin_id} не найден в API, пробуем другой источник...")
+        coin_id, source = resolve_coin_id(crypto)
+
+    if not ohlcv and STOP_EVENT.is_set():
+        # Загрузку прервала остановка: это не промах монеты для планировщика
+        return False
+
+    if not coin_id:
+        log.warning("    ⚠️ Не удалось найти ID монеты")
+        crypto['refresh_outcome'] = 'failed'
+        return False
+
+    crypto['refresh_outcome'] = classify_ohlcv(ohlcv)
+
+    if ohlcv:
+        crypto['ohlcv'] = ohlcv
+        crypto['coin_id'] = coin_id
+        if journal:
+            journal.fetched(crypto)
+        return True
+
+    return False
+
+
+def restore_from_journal(crypto, progress):
+    """Переносит в монету прогресс прерванного запуска, возвращает True если свечи уже есть"""
+    if progress['coin_id']:
+        crypto['coin_id'] = progress['coin_id']
+
+    if not progress['candles']:
+        return False
+
+    crypto['ohlcv'] = [build_ohlc_candle(candle) for candle in progress['candles']]
+    crypto['refresh_outcome'] = classify_ohlcv(crypto['ohlcv'])
+    return True
+
+
+def plan_refresh(cryptos):
+    """Делит монеты на требующие обновления свечей (по убыванию приоритета) и остальные.
+
+    К монетам со страницы добавляются отслеживаемые монеты из БД, срок обновления
+    которых наступил. Возвращает (к обновлению, без обновления свечей).
+    """
+    states = {}
+    tracked = []
+    crypto_ids = [None] * len(cryptos)
+
+    conn = get_db_connection()
+    if conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        try:
+            # Каноническая дата добавления и id строки: состояние и свечи уже известной монеты не теряются
+            crypto_ids = resolve_identities(cursor, cryptos)
+            states = load_refresh_states(cursor)
+            tracked = load_due_tracked_coins(cursor, [crypto_id for crypto_id in crypto_ids if crypto_id])
+        except Exception as e:
+            log.warning(f"⚠️ Состояние планировщика недоступно ({e}), обновляются все монеты")
+        finally:
+            cursor.close()
+            conn.close()
+
+    now = datetime.now()
+    due = []
+    skipped = []
+
+    crypto_ids = crypto_ids + [crypto['crypto_id'] for crypto in tracked]
+    for crypto, crypto_id in zip(cryptos + tracked, crypto_ids):
+        state = states.get(crypto_id)
+
+        if not is_older_than_two_days(crypto['added']) or not is_due(state, now):
+            skipped.append(crypto)
+            continue
+
+        crypto['refresh_priority'] = refresh_priority(state, coin_age_days(crypto['added']), now)
+        due.append(crypto)
+
+    due.sort(key=lambda crypto: crypto['refresh_priority'], reverse=True)
+
+    log.info(f"🗓️ К обновлению свечей: {len(due)} монет (из них из БД: {len(tracked)}), "
+             f"без обновления: {len(skipped)}")
+    return due, [crypto for crypto in skipped if not crypto.get('tracked_only')]
+
+
+def record_run(ledger, status, coins_parsed=0, coins_refreshed=0):
+    """Записывает запуск в parser_runs; ошибка записи журнала не прерывает парсер"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        run_id = ledger.record(cursor, status, coins_parsed, coins_refreshed)
+        conn.commit()
+        log.info(f"🗒️ Запуск записан в parser_runs: #{run_id}")
+        return run_id
+    except psycopg2.Error as e:
+        conn.rollback()
+        log.warning(f"⚠️ Не удалось записать запуск в parser_runs: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def format_percent(value):
+    return f"{value * 100:+.1f}%" if value is not None else "—"
+
+
+def update_metrics():
+    """Пересчитывает coin_metrics по новым свечам; ошибка не прерывает парсер"""
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor()
+    try:
+        with metrics.stage_timer('coin_metrics'):
+            result = coin_metrics.update_coin_metrics(cursor)
+            conn.commit()
+        if result is None:
+            log.info("📈 Метрики монет уже пересчитывает другой процесс")
+            return None
+
+        coins, candles_read = result
+        log.info(f"📈 Метрики пересчитаны для {coins} монет (прочитано новых свечей: {candles_read})")
+        if coins:
+            for chain, count, avg_24h, median_24h, avg_7d, avg_drawdown, avg_volatility in \
+                    coin_metrics.chain_summary(cursor):
+                log.info(f"   - {chain}: монет {count}, 24ч ср. {format_percent(avg_24h)} "
+                         f"(медиана {format_percent(median_24h)}), 7д ср. {format_percent(avg_7d)}, "
+                         f"просадка {format_percent(avg_drawdown)}, волатильность {format_percent(avg_volatility)}")
+            conn.commit()
+        return result
+    except Exception as e:
+        conn.rollback()
+        log.warning(f"⚠️ Не удалось пересчитать coin_metrics: {e}")
         return None
     finally:
         cursor.close()
         conn.close()
 
 
-def main():
-    print("=" * 80, flush=True)
-    print("🚀 ПАРСЕР КРИПТОВАЛЮТ С ОТДЕЛЬНЫМИ ТАБЛИЦАМИ OHLC", flush=True)
-    print(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", flush=True)
-    print("=" * 80 + "\n", flush=True)
+def main(sink_names=('db',)):
+    run_started = time.perf_counter()
+    ledger = RunLedger('cron')
+    log.info("=" * 80)
+    log.info("🚀 ПАРСЕР КРИПТОВАЛЮТ С ОТДЕЛЬНЫМИ ТАБЛИЦАМИ OHLC")
+    log.info(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    log.info("=" * 80)
 
     # Проверяем подключение к БД
     conn = get_db_connection()
     if not conn:
-        print("❌ Не удалось подключиться к базе данных. Проверьте настройки.", flush=True)
+        log.error("❌ Не удалось подключиться к базе данных. Проверьте настройки.")
         sys.exit(1)
     else:
         conn.close()
-        print("✅ Подключение к базе данных успешно установлено\n", flush=True)
+        log.info("✅ Подключение к базе данных успешно установлено")
 
     # Показываем текущую статистику
-    print("📊 Текущая статистика БД:", flush=True)
+    log.info("📊 Текущая статистика БД:")
     stats = get_database_stats_separate_tables()
     if stats:
-        print(f"   - Всего монет: {stats['total_cryptos']}", flush=True)
-        print(f"   - Монет с OHLC таблицами: {stats['cryptos_with_ohlc']}", flush=True)
+        log.info(f"   - Всего монет: {stats['total_cryptos']}")
+        log.info(f"   - Монет с OHLC таблицами: {stats['cryptos_with_ohlc']}")
 
         if stats['recent_cryptos']:
-            print("\n   Последние монеты с OHLC:", flush=True)
+            log.info("   Последние монеты с OHLC:")
             for crypto in stats['recent_cryptos'][:5]:
-                print(
-                    f"   - {crypto['name']} ({crypto['symbol']}) - таблица: {crypto['ohlc_table']}, записей: {crypto['ohlc_count']}",
-                    flush=True)
-        print()
+                log.info(
+                    f"   - {crypto['name']} ({crypto['symbol']}) - таблица: {crypto['ohlc_table']}, записей: {crypto['ohlc_count']}")
 
     # Загружаем страницу
-    html = fetch_page()
+    with metrics.stage_timer('page_fetch'):
+        html = fetch_page()
 
     if not html:
-        print("❌ Не удалось загрузить страницу", flush=True)
+        log.error("❌ Не удалось загрузить страницу")
+        metrics.export_run({'status': 'page_failed', 'finished': datetime.now().isoformat()})
+        record_run(ledger, 'page_failed')
         return
 
     # Парсим данные
-    cryptos = parse_html_limited(html, limit=MAX_COINS)
+    with metrics.stage_timer('parse'):
+        cryptos = parse_html_limited(html, limit=MAX_COINS)
 
+    ohlcv_count = 0
     if cryptos:
-        print(f"\n✅ Успешно распарсено {len(cryptos)} монет", flush=True)
+        log.info(f"✅ Успешно распарсено {len(cryptos)} монет")
 
         # Получаем OHLCV для монет старше 2 дней
-        print(f"\n📊 Получение 4-часовых OHLCV данных для монет старше 2 дней...\n", flush=True)
-
-        ohlcv_count = 0
-        for crypto in cryptos:
-            if is_older_than_two_days(crypto['added']):
-                print(f"🔍 {crypto['name']} ({crypto['symbol']}) - монета старше 2 дней", flush=True)
-
-                # Ищем ID монеты
-                coin_id = search_coin_id(crypto['name'], crypto['symbol'])
+        log.info("📊 Получение 4-часовых OHLCV данных для монет старше 2 дней...")
+
+        # ID монет, найденные в прошлых запусках, не ищем заново
+        cached_ids = load_coin_id_cache()
+        if cached_ids:
+            log.info(f"⚡ Загружено известных ID монет: {cached_ids}")
+
+        # Журнал запуска: прогресс по монетам для продолжения после падения
+        journal = RunJournal()
+        resumed = journal.start()
+        if resumed:
+            log.info(f"♻️ Продолжаем прерванный запуск {journal.run_id}: монет в журнале {len(resumed)}")
+
+        # Конвейер: монеты попадают во все приемники сразу после загрузки своих свечей
+        fanout, save_stats = build_sinks(sink_names, journal)
+
+        # Монеты без обновления свечей сразу уходят на запись данных листинга
+        with metrics.stage_timer('plan'):
+            due, skipped = plan_refresh(cryptos)
+        for crypto in skipped:
+            fanout.publish(crypto)
+
+        # Монеты по приоритету, пока не подошел следующий слот cron
+        deadline = run_deadline(time.time())
+        log.info(f"⏰ Дедлайн запуска: {datetime.fromtimestamp(deadline).strftime('%Y-%m-%d %H:%M:%S')}")
+
+        fetch_started = time.perf_counter()
+        for position, crypto in enumerate(due):
+            if time.time() >= deadline:
+                postponed = due[position:]
+                log.info(f"⏰ Дедлайн: {len(postponed)} монет перенесено на следующий запуск")
+                for postponed_crypto in postponed:
+                    if not postponed_crypto.get('tracked_only'):
+                        fanout.publish(postponed_crypto)
+                break
 
-                if coin_id:
-                    time.sleep(3)  # Задержка для соблюдения лимитов API
+            progress = resumed.get(candle_key(crypto))
+            if progress and progress['committed']:
+                # Свечи уже в БД; монета нужна остальным приемникам и для обновления листинга
+                log.info(f"♻️ {crypto['symbol']}: уже записана в прерванном запуске")
+                fanout.publish(crypto)
+                continue
 
-                    # Получаем OHLCV данные
-                    ohlcv = fetch_ohlc_data(coin_id, days=30)
+            if progress and restore_from_journal(crypto, progress):
+                log.info(f"♻️ {crypto['symbol']}: {len(crypto['ohlcv'])} свечей из журнала")
+                ohlcv_count += 1
+            elif fetch_crypto_ohlcv(crypto, journal):
+                ohlcv_count += 1
+            fanout.publish(crypto)
 
-                    if ohlcv:
-                        crypto['ohlcv'] = ohlcv
-                        crypto['coin_id'] = coin_id
-                        ohlcv_count += 1
-                else:
-                    print(f"    ⚠️ Не удалось найти ID монеты\n", flush=True)
-            else:
-                print(f"ℹ️ {crypto['name']} ({crypto['symbol']}) - монета младше 2 дней, OHLC не требуется", flush=True)
+        metrics.observe('parser_stage_seconds', time.perf_counter() - fetch_started, stage='ohlc_fetch')
+        log.info(f"✅ Получено OHLCV для {ohlcv_count} монет")
 
-        print(f"\n✅ Получено OHLCV для {ohlcv_count} монет", flush=True)
+        # Дожидаемся записи оставшихся монет во все приемники
+        with metrics.stage_timer('db_drain'):
+            fanout.close()
+        journal.finish(dict(save_stats or {}, ohlcv_fetched=ohlcv_count))
 
-        # Сохраняем данные в БД с отдельными таблицами
-        save_to_database_with_separate_tables(cryptos)
+        # Метрики по новым свечам (доходность, просадка, волатильность по сетям)
+        update_metrics()
 
         # Показываем обновленную статистику
-        print("\n📊 Обновленная статистика БД:", flush=True)
+        log.info("📊 Обновленная статистика БД:")
         stats = get_database_stats_separate_tables()
         if stats:
-            print(f"   - Всего монет: {stats['total_cryptos']}", flush=True)
-            print(f"   - Монет с OHLC таблицами: {stats['cryptos_with_ohlc']}", flush=True)
+            log.info(f"   - Всего монет: {stats['total_cryptos']}")
+            log.info(f"   - Монет с OHLC таблицами: {stats['cryptos_with_ohlc']}")
 
     else:
-        print("\n❌ Не удалось найти данные о монетах", flush=True)
+        log.error("❌ Не удалось найти данные о монетах")
 
-    print("\n✅ Парсер завершил работу", flush=True)
-    print("=" * 80 + "\n", flush=True)
+    metrics.observe('parser_stage_seconds', time.perf_counter() - run_started, stage='total')
+    if cryptos:
+        metrics.set_gauge('parser_last_success_timestamp_seconds', int(time.time()))
+    metrics.export_run({
+        'status': 'ok' if cryptos else 'no_coins',
+        'finished': datetime.now().isoformat(),
+        'coins': len(cryptos)
+    })
+    record_run(ledger, 'ok' if cryptos else 'no_coins', len(cryptos), ohlcv_count)
+
+    log.info("✅ Парсер завершил работу")
+    log.info("=" * 80)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    arg_parser = argparse.ArgumentParser(description="Парсер новых криптовалют CoinGecko с сохранением в PostgreSQL")
+    arg_parser.add_argument('--daemon', action='store_true',
+                            help="Работать постоянно (вместо запуска из cron), см. parser_daemon.py")
+    arg_parser.add_argument('--worker', action='store_true',
+                            help="Воркер очереди заданий в БД (можно запускать несколько), см. parser_worker.py")
+    arg_parser.add_argument('--sinks',
+                            help=f"Приемники данных через запятую: {', '.join(SINK_NAMES)} "
+                                 f"(по умолчанию OUTPUT_SINKS: {OUTPUT_SINKS}); только для запуска из cron")
+    args = arg_parser.parse_args()
+
+    sink_names = [name.strip() for name in (args.sinks or OUTPUT_SINKS).split(',') if name.strip()]
+    unknown = [name for name in sink_names if name not in SINK_NAMES]
+    if unknown or not sink_names:
+        arg_parser.error(f"неизвестные приемники: {', '.join(unknown) or '(пусто)'}")
+
+    # Демон и воркер пишут только в БД с отдельными таблицами
+    if (args.daemon or args.worker) and sink_names != ['db']:
+        if args.sinks:
+            arg_parser.error("--sinks не поддерживается с --daemon и --worker (они пишут только в db)")
+        log.warning(f"⚠️ OUTPUT_SINKS={OUTPUT_SINKS} не используется в режиме демона/воркера, запись только в db")
+
+    if args.daemon:
+        from parser_daemon import run_daemon
+        run_daemon()
+    elif args.worker:
+        from parser_worker import run_worker
+        run_worker()
+    else:
+        main(sink_names)
\ No newline at end of file
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Режим воркера: несколько процессов или контейнеров делят монеты через очередь заданий в БД.
+
+Задания - строки coin_refresh_state, срок которых наступил. Воркер берет их
+пачками через FOR UPDATE SKIP LOCKED и арендует на JOB_LEASE_SECONDS: задания
+упавшего воркера снова становятся доступны после окончания аренды. Страницу
+листинга загружает только ведущий воркер (держит advisory lock), он же ставит
+в очередь новые монеты. Все воркеры расходуют общий лимит запросов к API
+(API_RATE_LIMIT в минуту), который считается в таблице api_rate_budget.
+
+Запуск: python3 parser_ohlcv_db.py --worker (столько процессов, сколько нужно)
+"""
+import os
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+from psycopg2.extras import RealDictCursor
+
+import parser_ohlcv_db as parser
+from log_config import get_logger
+from refresh_scheduler import run_deadline, tracked_coin
+from run_ledger import RunLedger
+
+log = get_logger('worker')
+
+WORKER_ID = os.environ.get('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+# Ключ advisory lock ведущего воркера (загрузка листинга)
+LISTING_LOCK_ID = 7710001
+
+JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', '5'))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '900'))
+# Отсрочка задания, срок которого после обработки не сдвинулся (запись не удалась или результата нет)
+JOB_RETRY_SECONDS = int(os.environ.get('JOB_RETRY_SECONDS', '1800'))
+
+# Общий лимит запросов к CoinGecko API в минуту на все воркеры
+API_RATE_LIMIT = int(os.environ.get('API_RATE_LIMIT', '25'))
+
+
+class SharedRateBudget:
+    """Общий лимит запросов в минуту: атомарный счетчик текущей минуты в api_rate_budget"""
+
+    def __init__(self, conn, limit):
+        self.conn = conn
+        self.limit = limit
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Забирает один запрос из лимита текущей минуты, при исчерпании ждет следующую"""
+        with self.lock:
+            while True:
+                cursor = self.conn.cursor()
+                try:
+                    cursor.execute("""
+                        INSERT INTO api_rate_budget (window_start, requests)
+                        VALUES (date_trunc('minute', now() AT TIME ZONE 'UTC'), 1)
+                        ON CONFLICT (window_start) DO UPDATE
+                        SET requests = api_rate_budget.requests + 1
+                        WHERE api_rate_budget.requests < %s
+                        RETURNING requests
+                    """, (self.limit,))
+                    if cursor.fetchone():
+                        return
+
+                    cursor.execute("SELECT 60 - EXTRACT(SECOND FROM now())")
+                    wait = float(cursor.fetchone()[0]) + 0.5
+                finally:
+                    cursor.close()
+
+                log.info(f"    🚦 Общий лимит API ({self.limit}/мин) исчерпан, ожидание {wait:.0f} с...")
+                time.sleep(wait)
+
+
+def try_become_leader(cursor):
+    """Пытается стать ведущим воркером (загружает листинг), не ожидая"""
+    cursor.execute("SELECT pg_try_advisory_lock(%s) AS locked", (LISTING_LOCK_ID,))
+    return cursor.fetchone()['locked']
+
+
+def seed_jobs(cursor):
+    """Ставит в очередь монеты старше 2 дней, для которых еще нет задания"""
+    cursor.execute("""
+        INSERT INTO coin_refresh_state (crypto_id, next_due_at, priority)
+        SELECT id, CURRENT_TIMESTAMP,
+               12 + CASE WHEN added_date >= CURRENT_DATE - 7 THEN 6
+                         WHEN added_date >= CURRENT_DATE - 30 THEN 3
+                         ELSE 0 END
+        FROM cryptocurrencies
+        WHERE added_date <= CURRENT_DATE - 2
+        ON CONFLICT (crypto_id) DO NOTHING
+    """)
+    return cursor.rowcount
+
+
+def claim_jobs(cursor, limit):
+    """Арендует до limit заданий с наибольшим приоритетом, возвращает монеты"""
+    cursor.execute("""
+        WITH claimed AS (
+            SELECT s.crypto_id
+            FROM coin_refresh_state s
+            JOIN cryptocurrencies c ON c.id = s.crypto_id
+            WHERE s.next_due_at <= CURRENT_TIMESTAMP
+            AND (s.claimed_until IS NULL OR s.claimed_until < CURRENT_TIMESTAMP)
+            AND c.added_date IS NOT NULL
+            ORDER BY s.priority + LEAST(EXTRACT(EPOCH FROM CURRENT_TIMESTAMP
+                     - COALESCE(s.last_success_at, CURRENT_TIMESTAMP - INTERVAL '48 hours')) / 3600, 48) / 4 DESC
+            LIMIT %s
+            FOR UPDATE OF s SKIP LOCKED
+        )
+        UPDATE coin_refresh_state s
+        SET claimed_by = %s,
+            claimed_until = CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+        FROM claimed
+        JOIN cryptocurrencies c ON c.id = claimed.crypto_id
+        WHERE s.crypto_id = claimed.crypto_id
+        RETURNING c.id, c.name, c.symbol, c.chain, c.price, c.change_24h, c.market_cap, c.fdv,
+                  c.added_date, c.added_raw, c.coin_gecko_id, c.page_slug
+    """, (limit, WORKER_ID, JOB_LEASE_SECONDS))
+    return [dict(tracked_coin(row), job_id=row['id']) for row in cursor.fetchall()]
+
+
+def release_jobs(cursor, attempted=()):
+    """Снимает аренду со всех заданий воркера.
+
+    Обработанные задания перенесены на следующий срок в транзакции записи. Если
+    запись не удалась или результат не записан (монета моложе 2 дней), срок
+    остался в прошлом - такие задания из attempted откладываются на
+    JOB_RETRY_SECONDS, иначе воркер сразу взял бы их снова.
+    """
+    cursor.execute("""
+        UPDATE coin_refresh_state
+        SET claimed_by = NULL, claimed_until = NULL,
+            next_due_at = CASE WHEN crypto_id = ANY(%s) AND next_due_at <= CURRENT_TIMESTAMP
+                               THEN CURRENT_TIMESTAMP + %s * INTERVAL '1 second'
+                               ELSE next_due_at END
+        WHERE claimed_by = %s
+    """, (list(attempted), JOB_RETRY_SECONDS, WORKER_ID))
+    return cursor.rowcount
+
+
+def publish_listing(cursor, write_queue):
+    """Ведущий воркер: загружает листинг, записывает монеты и ставит их в очередь заданий"""
+    html = parser.fetch_page()
+    cryptos = parser.parse_html_limited(html, limit=parser.MAX_COINS) if html else None
+    if not cryptos:
+        log.error("❌ Не удалось загрузить листинг")
+        return 0
+
+    for crypto in cryptos:
+        parser.enqueue_for_write(write_queue, crypto)
+
+    # Задания ставятся только для уже записанных монет
+    write_queue.join()
+    seeded = seed_jobs(cursor)
+
+    # Счетчики лимита API за прошлые часы больше не нужны
+    cursor.execute("DELETE FROM api_rate_budget WHERE window_start < now() AT TIME ZONE 'UTC' - INTERVAL '1 hour'")
+
+    log.info(f"📋 Листинг: {len(cryptos)} монет, новых заданий: {seeded}")
+    return len(cryptos)
+
+
+def run_worker():
+    """Берет задания из очереди, пока они есть и не наступил дедлайн"""
+    log.info("=" * 80)
+    log.info(f"🚀 ВОРКЕР ПАРСЕРА {WORKER_ID}")
+    log.info(f"Время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    log.info(f"Пачка заданий: {JOB_BATCH_SIZE}, аренда: {JOB_LEASE_SECONDS} с, "
+             f"общий лимит API: {API_RATE_LIMIT}/мин")
+    log.info("=" * 80)
+
+    ledger = RunLedger('worker')
+    conn = parser.get_db_connection()
+    if not conn:
+        log.error("❌ Не удалось подключиться к базе данных")
+        sys.exit(1)
+
+    # Аренда и лимит фиксируются сразу, чтобы их видели другие воркеры
+    conn.autocommit = True
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    parser.API_RATE_BUDGET = SharedRateBudget(conn, API_RATE_LIMIT)
+
+    cached_ids = parser.load_coin_id_cache()
+    log.info(f"⚡ Загружено известных ID монет: {cached_ids}")
+
+    write_queue, writers, save_stats = parser.start_db_writers()
+    deadline = run_deadline(time.time())
+    leader = False
+    listed = 0
+    processed = 0
+
+    try:
+        leader = try_become_leader(cursor)
+        if leader:
+            log.info("👑 Ведущий воркер: загружаем листинг")
+            listed = publish_listing(cursor, write_queue)
+        else:
+            log.info("ℹ️ Листинг загружает другой воркер")
+
+        while time.time() < deadline:
+            jobs = claim_jobs(cursor, JOB_BATCH_SIZE)
+            if not jobs:
+                log.info("✅ Заданий, срок которых наступил, больше нет")
+                break
+
+            attempted = []
+            for crypto in jobs:
+                if time.time() >= deadline:
+                    log.info("⏰ Дедлайн: оставшиеся задания возвращены в очередь")
+                    break
+                parser.fetch_crypto_ohlcv(crypto)
+                parser.enqueue_for_write(write_queue, crypto)
+                attempted.append(crypto['job_id'])
+                processed += 1
+
+            # Аренду снимаем после записи: обработанные задания уже перенесены на следующий срок
+            write_queue.join()
+            release_jobs(cursor, attempted)
+
+    finally:
+        parser.stop_db_writers(write_queue, writers, save_stats)
+        if not conn.closed:
+            release_jobs(cursor)
+            if leader:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", (LISTING_LOCK_ID,))
+            cursor.close()
+            conn.close()
+
+    log.info(f"✅ Воркер {WORKER_ID} обработал заданий: {processed}")
+    if processed:
+        parser.update_metrics()
+    parser.record_run(ledger, 'ok', listed, processed)
+
+
+if __name__ == "__main__":
+    run_worker()
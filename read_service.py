@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+HTTP сервис чтения: листинг, последние свечи и свечи монеты за период с кэшем в памяти.
+
+Эндпоинты (ответ - компактный JSON: columns + rows, gzip при Accept-Encoding):
+- /listing?limit=&cursor=                    монеты листинга, новые первыми;
+- /latest?symbols=A,B                         последняя свеча монет (снимок latest_candle);
+- /candles?symbol=&added=|crypto_id=&cursor=&limit=&order=asc|desc&since=&until=
+                                              свечи монеты из ее OHLC таблицы;
+- /health, /metrics                           состояние кэша и метрики Prometheus.
+Страницы - keyset пагинация: в ответе next, его передают как cursor следующего
+запроса (без OFFSET, каждая страница - поиск по индексу).
+
+Готовые ответы (уже сжатые, с ETag) хранятся в LRU кэше процесса, повторный
+запрос горячего ключа не обращается к БД и не сериализует JSON. Кэш
+сбрасывается по уведомлениям PostgreSQL (migrate_read_service.sql): триггер на
+latest_candle шлет candles_ingested с id монеты при загрузке новых свечей,
+триггер на cryptocurrencies - listing_changed. Пока подключение для LISTEN
+не установлено, кэш не используется.
+
+Запуск: python3 read_service.py --port 8090
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import queue
+import select
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psycopg2.extensions
+
+import metrics
+from log_config import get_logger
+from parser_ohlcv_db import get_db_connection
+
+log = get_logger('read')
+
+READ_SERVICE_PORT = int(os.environ.get('READ_SERVICE_PORT', '8090'))
+# Записей в кэше ответов и их срок жизни (секунды) на случай пропущенного уведомления
+READ_CACHE_SIZE = int(os.environ.get('READ_CACHE_SIZE', '1024'))
+READ_CACHE_TTL = int(os.environ.get('READ_CACHE_TTL', '300'))
+READ_DB_CONNECTIONS = int(os.environ.get('READ_DB_CONNECTIONS', '4'))
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+# Ответы меньше этого размера не сжимаются
+GZIP_MIN_BYTES = 1024
+
+CANDLES_CHANNEL = 'candles_ingested'
+LISTING_CHANNEL = 'listing_changed'
+
+LISTING_COLUMNS = ('id', 'symbol', 'name', 'chain', 'price', 'change_24h', 'market_cap', 'fdv',
+                   'added_date', 'coin_gecko_id', 'last_updated_at')
+LATEST_COLUMNS = ('crypto_id', 'symbol', 'added_date', 'timestamp', 'open', 'high', 'low', 'close')
+CANDLE_COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+
+class BadRequest(Exception):
+    """Неверные параметры запроса (ответ 400)"""
+
+
+class NotFound(Exception):
+    """Монета не найдена (ответ 404)"""
+
+
+class ResponseCache:
+    """LRU кэш готовых ответов с тегами для сброса по уведомлениям"""
+
+    def __init__(self, size=READ_CACHE_SIZE, ttl=READ_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Растет при каждом сбросе: ответ, посчитанный до сброса, не попадает в кэш
+        self.generation = 0
+        self.enabled = False
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry['stored_at'] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, generation):
+        with self.lock:
+            if not self.enabled or generation != self.generation:
+                return
+            entry['stored_at'] = time.monotonic()
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tag=None):
+        """Удаляет ответы с тегом (без тега - все), возвращает количество"""
+        with self.lock:
+            self.generation += 1
+            if tag is None:
+                removed = len(self.entries)
+                self.entries.clear()
+                return removed
+            keys = [key for key, entry in self.entries.items() if tag in entry['tags']]
+            for key in keys:
+                del self.entries[key]
+            return len(keys)
+
+    def set_enabled(self, enabled):
+        with self.lock:
+            self.enabled = enabled
+            self.generation += 1
+            if not enabled:
+                self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'enabled': self.enabled, 'entries': len(self.entries), 'size': self.size, 'ttl': self.ttl}
+
+
+class ConnectionPool:
+    """Подключения к БД для потоков сервиса (не больше READ_DB_CONNECTIONS)"""
+
+    def __init__(self, size=READ_DB_CONNECTIONS):
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        self.slots.acquire()
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            conn = get_db_connection()
+        if conn is None:
+            self.slots.release()
+            raise ConnectionError("нет подключения к БД")
+        conn.set_session(readonly=True, autocommit=True)
+        return conn
+
+    def release(self, conn, broken=False):
+        if broken or conn.closed:
+            conn.close()
+        else:
+            self.idle.put(conn)
+        self.slots.release()
+
+
+def to_json_value(value):
+    """Значения строк БД для JSON: Decimal -> float, даты -> ISO"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def encode_rows(columns, rows, next_cursor=None, **extra):
+    """Компактный JSON: имена колонок один раз, строки - массивы"""
+    payload = dict(extra, columns=list(columns), rows=[[to_json_value(value) for value in row] for row in rows])
+    payload['next'] = next_cursor
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def parse_limit(params):
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("limit должен быть числом")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def parse_int(params, name):
+    if params.get(name) in (None, ''):
+        return None
+    try:
+        return int(params[name])
+    except ValueError:
+        raise BadRequest(f"{name} должен быть числом")
+
+
+def parse_date(params, name):
+    if params.get(name) in (None, ''):
+        return None
+    try:
+        return date.fromisoformat(params[name])
+    except ValueError:
+        raise BadRequest(f"{name} должен быть датой YYYY-MM-DD")
+
+
+def query_listing(cursor, params):
+    """Монеты по убыванию (added_date, id), cursor - 'YYYY-MM-DD:id' последней строки"""
+    limit = parse_limit(params)
+    where = ""
+    args = []
+    if params.get('cursor'):
+        try:
+            added, last_id = params['cursor'].rsplit(':', 1)
+            args = [date.fromisoformat(added), int(last_id)]
+        except ValueError:
+            raise BadRequest("cursor листинга: 'YYYY-MM-DD:id'")
+        where = "WHERE (COALESCE(added_date, '0001-01-01'), id) < (%s::date, %s)"
+
+    cursor.execute(f"""
+        SELECT {', '.join(LISTING_COLUMNS)} FROM cryptocurrencies
+        {where}
+        ORDER BY COALESCE(added_date, '0001-01-01') DESC, id DESC
+        LIMIT %s
+    """, args + [limit])
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = f"{(last[8] or date(1, 1, 1)).isoformat()}:{last[0]}"
+    return {'listing'}, encode_rows(LISTING_COLUMNS, rows, next_cursor)
+
+
+def query_latest(cursor, params):
+    """Последние свечи монет из снимка latest_candle"""
+    symbols = [symbol.strip().upper() for symbol in params.get('symbols', '').split(',') if symbol.strip()]
+    cursor.execute("""
+        SELECT lc.crypto_id, c.symbol, c.added_date, lc."timestamp", lc.open, lc.high, lc.low, lc.close
+        FROM latest_candle lc
+        JOIN cryptocurrencies c ON c.id = lc.crypto_id
+        WHERE %s OR c.symbol = ANY(%s)
+        ORDER BY c.symbol, c.added_date
+    """, (not symbols, symbols))
+    return {'latest'}, encode_rows(LATEST_COLUMNS, cursor.fetchall())
+
+
+def find_coin(cursor, params):
+    """(id, symbol, added_date, ohlc_table_name) монеты по crypto_id или symbol (+ added)"""
+    crypto_id = parse_int(params, 'crypto_id')
+    if crypto_id is not None:
+        cursor.execute("""
+            SELECT id, symbol, added_date, ohlc_table_name FROM cryptocurrencies WHERE id = %s
+        """, (crypto_id,))
+    elif params.get('symbol'):
+        # Без added - самая новая монета с этим символом
+        added = parse_date(params, 'added')
+        cursor.execute("""
+            SELECT id, symbol, added_date, ohlc_table_name FROM cryptocurrencies
+            WHERE symbol = %s AND (%s::date IS NULL OR added_date = %s::date)
+            ORDER BY added_date DESC NULLS LAST, id DESC
+            LIMIT 1
+        """, (params['symbol'].upper(), added, added))
+    else:
+        raise BadRequest("нужен symbol или crypto_id")
+
+    coin = cursor.fetchone()
+    if not coin or not coin[3]:
+        raise NotFound("монета не найдена")
+    return coin
+
+
+def query_candles(cursor, params):
+    """Свечи монеты страницами по "timestamp", cursor - timestamp последней свечи страницы"""
+    crypto_id, symbol, added_date, table_name = find_coin(cursor, params)
+    limit = parse_limit(params)
+    descending = params.get('order', 'asc') == 'desc'
+    after = parse_int(params, 'cursor')
+    since = parse_int(params, 'since')
+    until = parse_int(params, 'until')
+
+    conditions = []
+    args = []
+    if after is not None:
+        conditions.append('"timestamp" < %s' if descending else '"timestamp" > %s')
+        args.append(after)
+    if since is not None:
+        conditions.append('"timestamp" >= %s')
+        args.append(since)
+    if until is not None:
+        conditions.append('"timestamp" <= %s')
+        args.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+    rows = []
+    if cursor.fetchone()[0]:
+        cursor.execute(f"""
+            SELECT "timestamp", open, high, low, close, volume FROM {table_name}
+            {where}
+            ORDER BY "timestamp" {'DESC' if descending else 'ASC'}
+            LIMIT %s
+        """, args + [limit])
+        rows = cursor.fetchall()
+
+    next_cursor = rows[-1][0] if len(rows) == limit else None
+    return {('coin', crypto_id)}, encode_rows(CANDLE_COLUMNS, rows, next_cursor, crypto_id=crypto_id,
+                                              symbol=symbol, added_date=to_json_value(added_date))
+
+
+ROUTES = {
+    '/listing': query_listing,
+    '/latest': query_latest,
+    '/candles': query_candles,
+}
+
+
+class ReadService:
+    """Кэш, подключения к БД и подписка на уведомления о новых данных"""
+
+    def __init__(self, cache=None, pool=None):
+        self.cache = cache or ResponseCache()
+        self.pool = pool or ConnectionPool()
+        self.stop_event = threading.Event()
+
+    def respond(self, path, params):
+        """Готовый ответ {'body', 'gzip', 'etag'} из кэша или из БД"""
+        key = (path, tuple(sorted(params.items())))
+        entry = self.cache.get(key)
+        if entry is not None:
+            metrics.inc('parser_read_cache_total', result='hit', route=path)
+            return entry
+
+        metrics.inc('parser_read_cache_total', result='miss', route=path)
+        generation = self.cache.generation
+        started = time.perf_counter()
+        conn = self.pool.acquire()
+        broken = False
+        try:
+            with conn.cursor() as cursor:
+                tags, body = ROUTES[path](cursor, params)
+        except (BadRequest, NotFound):
+            raise
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.pool.release(conn, broken)
+        metrics.observe('parser_read_query_seconds', time.perf_counter() - started, route=path)
+
+        entry = {
+            'tags': tags,
+            'body': body,
+            'gzip': gzip.compress(body, compresslevel=5) if len(body) >= GZIP_MIN_BYTES else None,
+            'etag': '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        }
+        self.cache.put(key, entry, generation)
+        return entry
+
+    def handle_notify(self, channel, payload):
+        """Сбрасывает ответы, которые затронули новые данные"""
+        if channel == CANDLES_CHANNEL:
+            removed = self.cache.invalidate('latest')
+            if payload.isdigit():
+                removed += self.cache.invalidate(('coin', int(payload)))
+        else:
+            removed = self.cache.invalidate('listing')
+        if removed:
+            metrics.inc('parser_read_cache_invalidations_total', removed, channel=channel)
+            log.debug("🧹 %s %s: сброшено ответов %d", channel, payload, removed)
+
+    def listen(self):
+        """Слушает уведомления PostgreSQL и сбрасывает кэш, переподключается при обрыве"""
+        while not self.stop_event.is_set():
+            conn = get_db_connection()
+            if conn is None:
+                self.stop_event.wait(5)
+                continue
+            try:
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CANDLES_CHANNEL}; LISTEN {LISTING_CHANNEL};")
+                # Ответы, посчитанные до подписки, могли устареть
+                self.cache.set_enabled(True)
+                log.info(f"👂 Подписка на {CANDLES_CHANNEL}, {LISTING_CHANNEL}: кэш включен")
+
+                while not self.stop_event.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.handle_notify(notify.channel, notify.payload)
+            except Exception as e:
+                log.warning(f"⚠️ Подписка на уведомления прервана: {e}")
+            finally:
+                self.cache.set_enabled(False)
+                conn.close()
+            self.stop_event.wait(5)
+
+    def start_listener(self):
+        thread = threading.Thread(target=self.listen, name="read-listener", daemon=True)
+        thread.start()
+        return thread
+
+
+def make_handler(service):
+    """Обработчик HTTP запросов сервиса"""
+
+    class ReadHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def send_body(self, status, body, content_type='application/json; charset=utf-8', headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_error_json(self, status, message):
+            self.send_body(status, json.dumps({'error': message}, ensure_ascii=False).encode('utf-8'))
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            path = url.path.rstrip('/') or '/'
+            params = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+
+            if path == '/metrics':
+                self.send_body(200, metrics.render_prometheus().encode('utf-8'),
+                               'text/plain; version=0.0.4; charset=utf-8')
+                return
+            if path == '/health':
+                self.send_body(200, json.dumps({'status': 'ok', 'cache': service.cache.stats()}).encode('utf-8'))
+                return
+            if path not in ROUTES:
+                self.send_error_json(404, "неизвестный путь")
+                return
+
+            try:
+                entry = service.respond(path, params)
+            except BadRequest as e:
+                self.send_error_json(400, str(e))
+                return
+            except NotFound as e:
+                self.send_error_json(404, str(e))
+                return
+            except Exception as e:
+                log.error(f"❌ Ошибка запроса {self.path}: {e}")
+                self.send_error_json(503, "БД недоступна")
+                return
+
+            headers = {'ETag': entry['etag'], 'Cache-Control': 'no-cache'}
+            if self.headers.get('If-None-Match') == entry['etag']:
+                self.send_response(304)
+                self.send_header('ETag', entry['etag'])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if entry['gzip'] is not None and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                headers['Content-Encoding'] = 'gzip'
+                self.send_body(200, entry['gzip'], headers=headers)
+            else:
+                self.send_body(200, entry['body'], headers=headers)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReadHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP сервис чтения листинга и свечей с кэшем")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=READ_SERVICE_PORT)
+    args = parser.parse_args()
+
+    service = ReadService()
+    service.start_listener()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    log.info(f"📖 Сервис чтения: http://{args.host}:{args.port} (/listing, /latest, /candles)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop_event.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Планировщик обновления свечей по монетам: срок следующего обновления и приоритет.
+
+Для каждой монеты в coin_refresh_state хранится next_due_at и базовый приоритет
+(возраст листинга, волатильность, неудачи). Запуск обновляет только монеты,
+срок которых наступил, в порядке приоритета и до дедлайна (следующего слота cron).
+Монеты, которые раз за разом отдают 404 или плоские свечи, помечаются как
+'dead' и проверяются раз в неделю.
+"""
+import math
+import os
+import statistics
+from datetime import datetime, timedelta
+
+# 4-часовые свечи; демон просыпается чуть позже закрытия свечи
+CANDLE_INTERVAL_SECONDS = 4 * 60 * 60
+CANDLE_REFRESH_DELAY = int(os.environ.get('CANDLE_REFRESH_DELAY', '120'))
+# Срок обновления ставится чуть раньше границы свечи: запуск cron в 0 */4 * * *
+# проверяет срок в первые секунды после границы и не должен пропустить монету
+DUE_TOLERANCE_SECONDS = 300
+
+# Дедлайн запуска: за RUN_DEADLINE_MARGIN секунд до следующего слота cron,
+# либо фиксированная длительность RUN_DEADLINE_SECONDS
+RUN_DEADLINE_MARGIN = int(os.environ.get('RUN_DEADLINE_MARGIN', '600'))
+RUN_DEADLINE_SECONDS = int(os.environ.get('RUN_DEADLINE_SECONDS', '0'))
+
+# После стольких неудач или плоских результатов подряд монета считается мертвой
+DEAD_AFTER_MISSES = 5
+DEAD_RECHECK_INTERVAL = timedelta(days=7)
+MAX_BACKOFF = timedelta(days=2)
+
+# Свечей для оценки волатильности и плоского графика
+VOLATILITY_WINDOW = 42
+FLAT_WINDOW = 12
+
+
+def next_candle_boundary(now):
+    """Время (unix) ближайшего обновления: граница 4-часовой свечи + задержка"""
+    boundary = (int(now) // CANDLE_INTERVAL_SECONDS) * CANDLE_INTERVAL_SECONDS
+    refresh_at = boundary + CANDLE_REFRESH_DELAY
+    if refresh_at <= now:
+        refresh_at += CANDLE_INTERVAL_SECONDS
+    return refresh_at
+
+
+def next_due_after_success(now):
+    """Срок (unix) следующего обновления после успешной загрузки: граница следующей свечи - допуск"""
+    boundary = (int(now) // CANDLE_INTERVAL_SECONDS + 1) * CANDLE_INTERVAL_SECONDS
+    due = boundary - DUE_TOLERANCE_SECONDS
+    # Загрузка перед самой границей: новой свечи еще нет, срок - сама граница
+    return due if due > now else boundary
+
+
+def run_deadline(started_at):
+    """Время (unix), после которого запуск перестает брать новые монеты"""
+    if RUN_DEADLINE_SECONDS:
+        return started_at + RUN_DEADLINE_SECONDS
+
+    next_slot = (int(started_at) // CANDLE_INTERVAL_SECONDS + 1) * CANDLE_INTERVAL_SECONDS
+    return max(next_slot - RUN_DEADLINE_MARGIN, started_at + 60)
+
+
+def coin_age_days(added_date_str):
+    """Возраст монеты в днях"""
+    try:
+        return (datetime.now() - datetime.strptime(added_date_str, '%Y-%m-%d')).days
+    except (TypeError, ValueError):
+        return 0
+
+
+def candle_volatility(ohlcv):
+    """Стандартное отклонение логарифмических доходностей последних свечей"""
+    closes = [float(candle['close']) for candle in ohlcv[-VOLATILITY_WINDOW:] if float(candle['close']) > 0]
+    if len(closes) < 3:
+        return None
+
+    returns = [math.log(closes[i] / closes[i - 1]) for i in range(1, len(closes))]
+    return statistics.pstdev(returns)
+
+
+def classify_ohlcv(ohlcv):
+    """Результат загрузки: 'ok', 'flat' (цена не меняется) или 'failed' (нет свечей)"""
+    if not ohlcv:
+        return 'failed'
+
+    recent = ohlcv[-FLAT_WINDOW:]
+    prices = {float(candle[key]) for candle in recent for key in ('open', 'high', 'low', 'close')}
+    if len(recent) >= FLAT_WINDOW and len(prices) == 1:
+        return 'flat'
+
+    return 'ok'
+
+
+def base_priority(age_days, volatility, misses):
+    """Базовый приоритет монеты: свежие и волатильные выше, неудачные ниже"""
+    priority = 0.0
+
+    # Свежие листинги двигаются сильнее всего
+    if age_days <= 7:
+        priority += 6
+    elif age_days <= 30:
+        priority += 3
+
+    if volatility:
+        priority += min(volatility, 0.5) * 20
+
+    return priority - 3 * misses
+
+
+def refresh_priority(state, age_days, now):
+    """Приоритет в текущем запуске: базовый + сколько свечей пропущено с последнего успеха"""
+    if not state:
+        # Монета еще ни разу не обновлялась
+        return base_priority(age_days, None, 0) + 12
+
+    if state['status'] == 'dead':
+        return -100
+
+    last_success = state['last_success_at']
+    stale_hours = (now - last_success).total_seconds() / 3600 if last_success else 48
+    missed_candles = min(stale_hours, 48) / 4
+
+    return (state['priority'] or 0) + missed_candles
+
+
+def is_due(state, now):
+    """Наступил ли срок обновления монеты"""
+    return not state or state['next_due_at'] is None or state['next_due_at'] <= now
+
+
+def load_refresh_states(cursor):
+    """Загружает состояние планировщика: crypto_id -> состояние.
+
+    Ключ - id строки, а не (symbol, added): монеты с одним тикером и датой
+    добавления различаются только slug страницы.
+    """
+    cursor.execute("""
+        SELECT s.crypto_id, s.next_due_at, s.priority, s.status,
+               s.consecutive_failures, s.flat_runs, s.last_success_at
+        FROM coin_refresh_state s
+    """)
+    return {row['crypto_id']: row for row in cursor.fetchall()}
+
+
+def load_due_tracked_coins(cursor, exclude_ids):
+    """Монеты из БД (не с текущей страницы), срок обновления которых наступил"""
+    cursor.execute("""
+        SELECT c.id, c.name, c.symbol, c.chain, c.price, c.change_24h, c.market_cap, c.fdv,
+               c.added_date, c.added_raw, c.coin_gecko_id, c.page_slug
+        FROM cryptocurrencies c
+        JOIN coin_refresh_state s ON s.crypto_id = c.id
+        WHERE s.next_due_at <= CURRENT_TIMESTAMP
+        AND c.coin_gecko_id IS NOT NULL
+        AND c.added_date IS NOT NULL
+        AND NOT (c.id = ANY(%s))
+    """, (list(exclude_ids),))
+    return [tracked_coin(row) for row in cursor.fetchall()]
+
+
+def tracked_coin(row):
+    """Монета из строки cryptocurrencies (RealDictCursor) в формате парсера"""
+    return {
+        'name': row['name'],
+        'symbol': row['symbol'],
+        'chain': row['chain'],
+        'price': row['price'],
+        'change_24h': row['change_24h'],
+        'market_cap': row['market_cap'],
+        'fdv': row['fdv'],
+        'added': row['added_date'].strftime('%Y-%m-%d') if row['added_date'] else None,
+        'added_raw': row['added_raw'],
+        'coin_id': row['coin_gecko_id'],
+        'page_slug': row.get('page_slug'),
+        'crypto_id': row.get('id'),
+        'tracked_only': True
+    }
+
+
+def record_refresh_outcome(cursor, crypto_id, added_date_str, outcome, ohlcv):
+    """Сохраняет результат обновления и вычисляет следующий срок и приоритет"""
+    now = datetime.now()
+
+    cursor.execute("""
+        SELECT consecutive_failures, flat_runs, volatility
+        FROM coin_refresh_state WHERE crypto_id = %s
+        FOR UPDATE
+    """, (crypto_id,))
+    row = cursor.fetchone()
+    failures, flat_runs, volatility = row if row else (0, 0, None)
+
+    if outcome == 'ok':
+        failures, flat_runs = 0, 0
+    elif outcome == 'flat':
+        flat_runs += 1
+    else:
+        failures += 1
+
+    if ohlcv:
+        volatility = candle_volatility(ohlcv)
+
+    misses = max(failures, flat_runs)
+    status = 'dead' if misses >= DEAD_AFTER_MISSES else 'active'
+
+    if status == 'dead':
+        next_due_at = now + DEAD_RECHECK_INTERVAL
+    elif outcome == 'ok':
+        next_due_at = datetime.fromtimestamp(next_due_after_success(now.timestamp()))
+    else:
+        # Экспоненциальная отсрочка: 4ч, 8ч, 16ч ... но не более MAX_BACKOFF
+        next_due_at = now + min(timedelta(seconds=CANDLE_INTERVAL_SECONDS * 2 ** (misses - 1)), MAX_BACKOFF)
+
+    priority = base_priority(coin_age_days(added_date_str), volatility, misses)
+
+    cursor.execute("""
+        INSERT INTO coin_refresh_state
+        (crypto_id, next_due_at, priority, status, consecutive_failures, flat_runs,
+         volatility, last_attempt_at, last_success_at, last_outcome)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (crypto_id) DO UPDATE SET
+            next_due_at = EXCLUDED.next_due_at,
+            priority = EXCLUDED.priority,
+            status = EXCLUDED.status,
+            consecutive_failures = EXCLUDED.consecutive_failures,
+            flat_runs = EXCLUDED.flat_runs,
+            volatility = EXCLUDED.volatility,
+            last_attempt_at = EXCLUDED.last_attempt_at,
+            last_success_at = COALESCE(EXCLUDED.last_success_at, coin_refresh_state.last_success_at),
+            last_outcome = EXCLUDED.last_outcome
+    """, (
+        crypto_id, next_due_at, priority, status, failures, flat_runs,
+        volatility, now, now if outcome == 'ok' else None, outcome
+    ))
+
+    return status
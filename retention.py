@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Ретеншн OHLC таблиц: архивирование свечей в сжатые файлы, дневные бары и удаление батчами.
+
+Заменяет cleanup_old_ohlc_tables(): каждая монета сначала выгружается в файл,
+затем ее таблица удаляется, а транзакция фиксируется после каждого батча,
+чтобы блокировки не держались на время всего прохода. Прерванный запуск
+продолжается с того же места - обработанные монеты уже удалены из cryptocurrencies.
+Каждая монета обрабатывается в своей точке сохранения: ошибка одной монеты
+откатывает только ее, монета пропускается до следующего запуска, остальные удаляются.
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+from candle_files import CandleFileWriter
+from log_config import get_logger
+from parser_ohlcv_db import get_db_connection
+
+log = get_logger('retention')
+
+# Значения по умолчанию
+DAYS_TO_KEEP = 90
+BATCH_SIZE = 20
+ARCHIVE_DIR = os.environ.get('OHLC_ARCHIVE_DIR', './archive')
+LOCK_TIMEOUT = '5s'
+# Строк за одну выборку серверного курсора при архивировании
+ARCHIVE_FETCH_ROWS = 50000
+# Сколько дней хранить журнал событий загрузки ingest_events
+INGEST_EVENTS_KEEP_DAYS = int(os.environ.get('INGEST_EVENTS_KEEP_DAYS', '14'))
+
+
+def format_bytes(size):
+    """Форматирует размер в байтах для отчета"""
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def get_expired_coins(cursor, cutoff_date, limit, skip_ids=()):
+    """Возвращает следующий батч монет, срок хранения которых истек (кроме skip_ids)"""
+    cursor.execute("""
+        SELECT id, symbol, added_date, coin_gecko_id, ohlc_table_name
+        FROM cryptocurrencies
+        WHERE added_date < %s
+          AND NOT (id = ANY(%s))
+        ORDER BY added_date, id
+        LIMIT %s
+    """, (cutoff_date, list(skip_ids), limit))
+    return cursor.fetchall()
+
+
+def table_exists(cursor, table_name):
+    """Проверяет существование OHLC таблицы"""
+    if not table_name:
+        return False
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (table_name,))
+    return cursor.fetchone()[0]
+
+
+def archive_table(conn, table_name, archive_dir):
+    """Выгружает свечи таблицы в сжатый файл батчами серверного курсора,
+    возвращает (путь, количество строк)"""
+    cursor = conn.cursor(name=f"archive_{table_name}")
+    cursor.itersize = ARCHIVE_FETCH_ROWS
+    writer = None
+    try:
+        cursor.execute(f'SELECT * FROM {table_name} ORDER BY "timestamp"')
+        while True:
+            rows = cursor.fetchmany(ARCHIVE_FETCH_ROWS)
+            if writer is None:
+                # Описание колонок серверного курсора доступно после первой выборки
+                columns = [desc[0] for desc in cursor.description]
+                writer = CandleFileWriter(os.path.join(archive_dir, table_name), columns)
+            if not rows:
+                break
+            writer.write_rows(rows)
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        cursor.close()
+
+    return writer.close(), writer.rows_written
+
+
+def downsample_to_daily(cursor, coin, table_name):
+    """Сохраняет дневные бары монеты в ohlc_daily_archive, возвращает количество баров"""
+    _, symbol, added_date, coin_gecko_id, _ = coin
+
+    cursor.execute(f"""
+        INSERT INTO ohlc_daily_archive
+        (symbol, added_date, coin_gecko_id, date, open, high, low, close, volume, candles_count)
+        SELECT
+            %s, %s, %s,
+            (to_timestamp("timestamp" / 1000.0) AT TIME ZONE 'UTC')::DATE AS day,
+            (array_agg(open ORDER BY "timestamp"))[1],
+            MAX(high),
+            MIN(low),
+            (array_agg(close ORDER BY "timestamp" DESC))[1],
+            SUM(volume),
+            COUNT(*)
+        FROM {table_name}
+        GROUP BY day
+        ON CONFLICT (symbol, added_date, date) DO NOTHING
+    """, (symbol, added_date, coin_gecko_id))
+    return cursor.rowcount
+
+
+def expire_coin(conn, cursor, coin, archive_dir, downsample):
+    """Архивирует и удаляет одну монету, возвращает статистику"""
+    crypto_id, symbol, added_date, coin_gecko_id, table_name = coin
+    result = {'archive_path': None, 'rows': 0, 'daily_bars': 0, 'bytes': 0}
+
+    if table_exists(cursor, table_name):
+        result['archive_path'], result['rows'] = archive_table(conn, table_name, archive_dir)
+
+        if downsample and result['rows']:
+            result['daily_bars'] = downsample_to_daily(cursor, coin, table_name)
+
+        cursor.execute("SELECT pg_total_relation_size(%s)", (table_name,))
+        result['bytes'] = cursor.fetchone()[0]
+
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name} CASCADE")
+
+    cursor.execute("DELETE FROM cryptocurrencies WHERE id = %s", (crypto_id,))
+
+    cursor.execute("""
+        INSERT INTO retention_log
+        (crypto_id, symbol, added_date, ohlc_table_name, archive_path,
+         rows_archived, daily_bars, bytes_reclaimed)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (crypto_id) DO UPDATE SET
+            archive_path = EXCLUDED.archive_path,
+            rows_archived = EXCLUDED.rows_archived,
+            daily_bars = EXCLUDED.daily_bars,
+            bytes_reclaimed = EXCLUDED.bytes_reclaimed,
+            processed_at = CURRENT_TIMESTAMP
+    """, (
+        crypto_id, symbol, added_date, table_name, result['archive_path'],
+        result['rows'], result['daily_bars'], result['bytes']
+    ))
+
+    return result
+
+
+def cleanup_ingest_events(cursor, days_to_keep=INGEST_EVENTS_KEEP_DAYS):
+    """Удаляет старые события из ingest_events, возвращает количество (None - таблицы нет)"""
+    cursor.execute("SELECT to_regclass('ingest_events') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return None
+    cursor.execute("""
+        DELETE FROM ingest_events
+        WHERE created_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+    """, (days_to_keep,))
+    return cursor.rowcount
+
+
+def run_retention(days_to_keep=DAYS_TO_KEEP, batch_size=BATCH_SIZE, archive_dir=ARCHIVE_DIR,
+                  downsample=False, dry_run=False):
+    """Выполняет ретеншн батчами, фиксируя транзакцию после каждого батча"""
+    cutoff_date = date.today() - timedelta(days=days_to_keep)
+    log.info(f"🧹 Ретеншн OHLC: удаляются монеты, добавленные до {cutoff_date}")
+    log.info(f"   Архив: {archive_dir}, батч: {batch_size}, дневные бары: {'да' if downsample else 'нет'}")
+
+    conn = get_db_connection()
+    if not conn:
+        log.error("❌ Не удалось подключиться к базе данных")
+        return None
+
+    cursor = conn.cursor()
+    totals = {'coins': 0, 'rows': 0, 'daily_bars': 0, 'bytes': 0}
+
+    try:
+        cursor.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+
+        if dry_run:
+            cursor.execute("""
+                SELECT COUNT(*), COALESCE(SUM(pg_total_relation_size(to_regclass(ohlc_table_name))), 0)
+                FROM cryptocurrencies
+                WHERE added_date < %s
+            """, (cutoff_date,))
+            coins, size = cursor.fetchone()
+            log.info(f"🔎 Dry run: будет удалено монет: {coins}, освободится ~{format_bytes(size)}")
+            conn.rollback()
+            return {'coins': coins, 'rows': 0, 'daily_bars': 0, 'bytes': size}
+
+        batch_number = 0
+        failed_ids = set()
+        while True:
+            batch = get_expired_coins(cursor, cutoff_date, batch_size, failed_ids)
+            if not batch:
+                break
+
+            batch_number += 1
+            batch_stats = {'coins': 0, 'rows': 0, 'daily_bars': 0, 'bytes': 0}
+
+            for coin in batch:
+                cursor.execute("SAVEPOINT retention_coin")
+                try:
+                    result = expire_coin(conn, cursor, coin, archive_dir, downsample)
+                except Exception as e:
+                    # Откатывается только эта монета: она пропускается до следующего запуска
+                    cursor.execute("ROLLBACK TO SAVEPOINT retention_coin")
+                    failed_ids.add(coin[0])
+                    log.warning(f"⚠️ Монета {coin[1]} ({coin[4]}) пропущена: {e}")
+                    continue
+                cursor.execute("RELEASE SAVEPOINT retention_coin")
+                batch_stats['coins'] += 1
+                batch_stats['rows'] += result['rows']
+                batch_stats['daily_bars'] += result['daily_bars']
+                batch_stats['bytes'] += result['bytes']
+
+            conn.commit()
+
+            for key in totals:
+                totals[key] += batch_stats[key]
+
+            log.info(f"✅ Батч {batch_number}: монет {batch_stats['coins']}, свечей {batch_stats['rows']}, "
+                     f"освобождено {format_bytes(batch_stats['bytes'])}")
+
+        events = cleanup_ingest_events(cursor)
+        conn.commit()
+        if events is not None:
+            log.info(f"🧹 Удалено событий ingest_events старше {INGEST_EVENTS_KEEP_DAYS} дней: {events}")
+
+        log.info("📊 Итог ретеншна:")
+        log.info(f"   - Удалено монет: {totals['coins']}")
+        log.info(f"   - Заархивировано свечей: {totals['rows']}")
+        log.info(f"   - Дневных баров сохранено: {totals['daily_bars']}")
+        log.info(f"   - Освобождено места: {format_bytes(totals['bytes'])}")
+        if failed_ids:
+            log.info(f"   - Пропущено монет с ошибками: {len(failed_ids)} (повторятся при следующем запуске)")
+        return totals
+
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ретеншн OHLC таблиц с архивированием")
+    parser.add_argument('--days', type=int, default=DAYS_TO_KEEP, help="Сколько дней хранить монеты")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Монет в одной транзакции")
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help="Директория для архивных файлов")
+    parser.add_argument('--downsample', action='store_true', help="Сохранять дневные бары удаленных монет")
+    parser.add_argument('--dry-run', action='store_true', help="Только показать, что будет удалено")
+    args = parser.parse_args()
+
+    totals = run_retention(args.days, args.batch_size, args.archive_dir, args.downsample, args.dry_run)
+    if totals is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
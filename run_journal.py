@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Журнал запуска парсера: прогресс по каждой монете в JSONL файле.
+
+Для каждой монеты фиксируются этапы: id_resolved (найден ID CoinGecko),
+fetched (свечи загружены, сами свечи пишутся в журнал) и committed (монета
+записана в БД). Если запуск оборвался (падение, OOM, перезапуск контейнера),
+следующий запуск продолжает его: записанные монеты пропускаются, найденные ID
+и загруженные свечи используются без повторных запросов к API.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from coin_identity import candle_key
+
+JOURNAL_PATH = os.environ.get('RUN_JOURNAL_PATH', './logs/run_journal.jsonl')
+
+# Незавершенный запуск старше этого срока не продолжается (свечи устарели)
+RESUME_MAX_AGE = int(os.environ.get('RUN_JOURNAL_MAX_AGE', str(24 * 60 * 60)))
+
+
+def read_journal(path):
+    """Читает записи журнала, пропуская оборванную последнюю строку"""
+    records = []
+    if not os.path.exists(path):
+        return records
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Строка, дописанная не до конца в момент падения
+                continue
+    return records
+
+
+def ends_with_newline(path):
+    """Заканчивается ли файл переводом строки"""
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+def unfinished_coins(records):
+    """Прогресс монет незавершенного запуска: ключ -> {'coin_id', 'candles', 'committed'}"""
+    if not records or records[-1]['event'] == 'run_finished':
+        return None
+
+    started_at = next((record['at'] for record in records if record['event'] == 'run_started'), None)
+    if started_at is None or time.time() - started_at > RESUME_MAX_AGE:
+        return None
+
+    coins = {}
+    for record in records:
+        if record['event'] != 'coin':
+            continue
+
+        coin = coins.setdefault(record['key'], {'coin_id': None, 'candles': None, 'committed': False})
+        if record['stage'] == 'id_resolved':
+            coin['coin_id'] = record['coin_id']
+        elif record['stage'] == 'fetched':
+            coin['coin_id'] = record['coin_id']
+            coin['candles'] = record['candles']
+        elif record['stage'] == 'committed':
+            coin['committed'] = True
+
+    return coins
+
+
+class RunJournal:
+    """Журнал одного запуска; запись потокобезопасна (пишут и писатели БД)"""
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        self.run_id = None
+        self.resumed = {}
+
+    def start(self):
+        """Начинает запуск или продолжает незавершенный, возвращает прогресс прошлого запуска"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        records = read_journal(self.path)
+        coins = unfinished_coins(records)
+
+        if coins is None:
+            # Прошлый запуск завершен (или устарел) - начинаем журнал заново
+            self.file = open(self.path, 'w', encoding='utf-8')
+            self.run_id = uuid.uuid4().hex[:12]
+            self.write({'event': 'run_started', 'run_id': self.run_id, 'at': time.time()})
+        else:
+            self.file = open(self.path, 'a', encoding='utf-8')
+            if self.file.tell() and not ends_with_newline(self.path):
+                # Завершаем строку, оборванную при падении
+                self.file.write('\n')
+            self.run_id = next(record['run_id'] for record in records if record['event'] == 'run_started')
+            self.resumed = coins
+            self.write({'event': 'run_resumed', 'run_id': self.run_id, 'at': time.time()})
+
+        return self.resumed
+
+    def write(self, record):
+        """Дописывает запись и сразу сбрасывает ее на диск"""
+        if not self.file:
+            return
+
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def coin_stage(self, crypto, stage, **values):
+        """Фиксирует этап обработки монеты"""
+        self.write({'event': 'coin', 'key': candle_key(crypto), 'stage': stage, **values})
+
+    def id_resolved(self, crypto, coin_id):
+        self.coin_stage(crypto, 'id_resolved', coin_id=coin_id)
+
+    def fetched(self, crypto):
+        # Храним только исходные значения свечей, остальные поля вычисляются
+        candles = [[candle['timestamp'], candle['open'], candle['high'], candle['low'], candle['close']]
+                   + ([candle['volume']] if candle.get('volume') is not None else [])
+                   for candle in crypto['ohlcv']]
+        self.coin_stage(crypto, 'fetched', coin_id=crypto['coin_id'], candles=candles)
+
+    def committed(self, crypto):
+        self.coin_stage(crypto, 'committed', outcome=crypto.get('refresh_outcome'))
+
+    def finish(self, summary=None):
+        """Отмечает запуск завершенным; следующий запуск начнет журнал заново"""
+        self.write({
+            'event': 'run_finished',
+            'run_id': self.run_id,
+            'at': time.time(),
+            'finished': datetime.now().isoformat(),
+            'summary': summary or {}
+        })
+        self.close()
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Журнал запусков в БД: одна строка parser_runs на каждый запуск парсера.
+
+Запуск фиксирует время начала и конца, длительность этапов, количество
+монет, запросов к API, 429, записанных свечей, ошибок и версию кода.
+Значения берутся из metrics как разница между началом и концом запуска,
+поэтому в демоне и воркере каждая строка описывает только свой цикл.
+Тренды и регрессии по журналу показывает run_trends.py.
+"""
+import json
+import os
+import socket
+import subprocess
+from datetime import datetime
+
+import metrics
+
+# Версия кода: задается при сборке образа, иначе - текущий коммит git
+PARSER_VERSION = os.environ.get('PARSER_VERSION', '')
+
+
+def code_version():
+    """Версия кода для журнала (PARSER_VERSION или короткий хэш коммита)"""
+    if PARSER_VERSION:
+        return PARSER_VERSION
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+class RunLedger:
+    """Строка журнала одного запуска: снимок метрик в начале и разница в конце"""
+
+    def __init__(self, mode='cron'):
+        self.mode = mode
+        self.started_at = datetime.now()
+        self.baseline = metrics.snapshot()
+
+    def collect(self, status, coins_parsed=0, coins_refreshed=0):
+        """Значения запуска для записи в parser_runs"""
+        delta = {
+            key: value - self.baseline.get(key, 0)
+            for key, value in metrics.snapshot().items()
+        }
+
+        def total(name):
+            return sum(value for (metric, _), value in delta.items() if metric == name)
+
+        stage_seconds = {
+            dict(labels)['stage']: round(value, 3)
+            for (metric, labels), value in delta.items()
+            if metric == 'parser_stage_seconds' and value
+        }
+
+        finished_at = datetime.now()
+        return {
+            'mode': self.mode,
+            'started_at': self.started_at,
+            'finished_at': finished_at,
+            'duration_seconds': round((finished_at - self.started_at).total_seconds(), 3),
+            'status': status,
+            'stage_seconds': stage_seconds,
+            'coins_parsed': coins_parsed,
+            'coins_refreshed': coins_refreshed,
+            'api_calls': int(total('parser_api_requests_total')),
+            'rate_limited': int(total('parser_rate_limited_total')),
+            'candles_inserted': int(total('parser_ohlc_rows_inserted_total')),
+            'errors': int(total('parser_save_errors_total') + total('parser_sink_errors_total')),
+            'code_version': code_version(),
+            'host': socket.gethostname()
+        }
+
+    def record(self, cursor, status, coins_parsed=0, coins_refreshed=0):
+        """Записывает строку запуска, возвращает ее id"""
+        run = self.collect(status, coins_parsed, coins_refreshed)
+        cursor.execute("""
+            INSERT INTO parser_runs
+            (mode, started_at, finished_at, duration_seconds, status, stage_seconds, coins_parsed,
+             coins_refreshed, api_calls, rate_limited, candles_inserted, errors, code_version, host)
+            VALUES (%(mode)s, %(started_at)s, %(finished_at)s, %(duration_seconds)s, %(status)s,
+                    %(stage_seconds)s::jsonb, %(coins_parsed)s, %(coins_refreshed)s, %(api_calls)s,
+                    %(rate_limited)s, %(candles_inserted)s, %(errors)s, %(code_version)s, %(host)s)
+            RETURNING id
+        """, dict(run, stage_seconds=json.dumps(run['stage_seconds'], sort_keys=True)))
+        row = cursor.fetchone()
+        return row['id'] if isinstance(row, dict) else row[0]
+
@@ -6,6 +6,7 @@ export DB_PORT=${DB_PORT:-5432}
 export DB_NAME=${DB_NAME:-crypto_db}
 export DB_USER=${DB_USER:-crypto_user}
 export DB_PASSWORD=${DB_PASSWORD:-crypto_password}
+export PARSER_VERSION=${PARSER_VERSION:-$(cat /app/PARSER_VERSION 2>/dev/null)}
 
 echo "=================================================="
 echo "Starting parser at $(date)"
@@ -13,7 +14,7 @@ echo "=================================================="
 
 # Запуск парсера
 cd /app
-python3 parser_ohlcv.py
+python3 parser_ohlcv_db.py
 
 echo "Parser finished at $(date)"
 echo ""
\ No newline at end of file
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Тренды и регрессии по журналу запусков parser_runs.
+
+Показывает последние запуски, сводку по дням (представление parser_runs_daily)
+и по версиям кода, затем сравнивает медианы последних запусков с предыдущими:
+длительность, запросы к API на монету, 429 и ошибки. С --fail-on-regression
+завершается с кодом 1, если какая-то медиана ухудшилась больше допустимого.
+
+Пример: python3 run_trends.py --days 14 --window 6
+"""
+import argparse
+import statistics
+import sys
+from datetime import datetime, timedelta
+
+from psycopg2.extras import RealDictCursor
+
+from parser_ohlcv_db import get_db_connection
+
+# Показатели для сравнения: чем больше значение, тем хуже
+REGRESSION_METRICS = [
+    ('duration_seconds', 'Длительность, с'),
+    ('api_calls_per_coin', 'Запросов к API на монету'),
+    ('rate_limited', '429 за запуск'),
+    ('errors', 'Ошибок за запуск')
+]
+
+
+def load_runs(cursor, since, mode=None):
+    """Запуски с даты since по возрастанию времени"""
+    cursor.execute("""
+        SELECT id, mode, started_at, duration_seconds, status, stage_seconds, coins_parsed,
+               coins_refreshed, api_calls, rate_limited, candles_inserted, errors, code_version
+        FROM parser_runs
+        WHERE started_at >= %s AND (%s IS NULL OR mode = %s)
+        ORDER BY started_at
+    """, (since, mode, mode))
+    runs = cursor.fetchall()
+    for run in runs:
+        run['api_calls_per_coin'] = run['api_calls'] / run['coins_refreshed'] if run['coins_refreshed'] else 0
+    return runs
+
+
+def print_recent(runs, count):
+    """Последние запуски с длительностью этапов"""
+    print(f"\n🗒️ Последние запуски ({min(count, len(runs))} из {len(runs)}):")
+    print(f"{'ID':>6} {'Начало':<17} {'Режим':<7} {'Статус':<11} {'Сек':>7} {'Монет':>6} "
+          f"{'API':>5} {'429':>4} {'Свечей':>7} {'Ошиб':>5}  Этапы")
+    for run in runs[-count:]:
+        stages = ', '.join(f"{stage} {seconds:.1f}" for stage, seconds in sorted(run['stage_seconds'].items())
+                           if stage != 'total')
+        print(f"{run['id']:>6} {run['started_at'].strftime('%Y-%m-%d %H:%M'):<17} {run['mode']:<7} "
+              f"{run['status']:<11} {run['duration_seconds']:>7.1f} {run['coins_refreshed']:>6} "
+              f"{run['api_calls']:>5} {run['rate_limited']:>4} {run['candles_inserted']:>7} "
+              f"{run['errors']:>5}  {stages}")
+
+
+def print_daily(cursor, since, mode=None):
+    """Сводка по дням из parser_runs_daily"""
+    cursor.execute("""
+        SELECT * FROM parser_runs_daily
+        WHERE day >= %s AND (%s IS NULL OR mode = %s)
+        ORDER BY day, mode
+    """, (since.date(), mode, mode))
+    days = cursor.fetchall()
+
+    print("\n📅 По дням:")
+    print(f"{'День':<11} {'Режим':<7} {'Запусков':>8} {'Сбоев':>6} {'Медиана, с':>10} {'Макс, с':>8} "
+          f"{'API':>6} {'429':>5} {'Свечей':>8} {'Свечей/с':>9} {'Ошиб':>5}")
+    for day in days:
+        print(f"{day['day'].isoformat():<11} {day['mode']:<7} {day['runs']:>8} {day['failed_runs']:>6} "
+              f"{day['median_seconds']:>10} {day['max_seconds']:>8} {day['api_calls']:>6} "
+              f"{day['rate_limited']:>5} {day['candles_inserted']:>8} {day['candles_per_second'] or 0:>9} "
+              f"{day['errors']:>5}")
+
+
+def print_versions(runs):
+    """Медианы по версиям кода в порядке появления версий"""
+    versions = {}
+    for run in runs:
+        if run['status'] == 'ok':
+            versions.setdefault(run['code_version'] or '?', []).append(run)
+
+    print("\n🏷️ По версиям кода:")
+    print(f"{'Версия':<14} {'Запусков':>8} {'Медиана, с':>10} {'API/монету':>10} {'429':>5} {'Свечей':>8}")
+    for version, version_runs in versions.items():
+        print(f"{version:<14} {len(version_runs):>8} "
+              f"{statistics.median(run['duration_seconds'] for run in version_runs):>10.1f} "
+              f"{statistics.median(run['api_calls_per_coin'] for run in version_runs):>10.2f} "
+              f"{statistics.median(run['rate_limited'] for run in version_runs):>5} "
+              f"{statistics.median(run['candles_inserted'] for run in version_runs):>8}")
+
+
+def find_regressions(runs, window, tolerance):
+    """Сравнивает медианы последних window успешных запусков с предыдущими window"""
+    ok_runs = [run for run in runs if run['status'] == 'ok']
+    if len(ok_runs) < window * 2:
+        print(f"\nℹ️ Для сравнения нужно минимум {window * 2} успешных запусков, есть {len(ok_runs)}")
+        return []
+
+    previous, current = ok_runs[-window * 2:-window], ok_runs[-window:]
+    regressions = []
+
+    print(f"\n📈 Последние {window} запусков против предыдущих {window}:")
+    for key, title in REGRESSION_METRICS:
+        before = statistics.median(run[key] for run in previous)
+        after = statistics.median(run[key] for run in current)
+        # Рост с нуля (например, первые 429) считается изменением на 100%
+        change = (after / before - 1) if before else (1.0 if after else 0.0)
+        worse = change > tolerance
+        mark = "❌" if worse else "✅"
+        print(f"   {mark} {title}: {after:.2f} против {before:.2f} ({change:+.0%})")
+        if worse:
+            regressions.append(key)
+
+    # Медленный этап - тот, что вырос сильнее всего
+    stages = set().union(*(run['stage_seconds'] for run in ok_runs[-window * 2:])) - {'total'}
+    for stage in sorted(stages):
+        before = statistics.median(run['stage_seconds'].get(stage, 0) for run in previous)
+        after = statistics.median(run['stage_seconds'].get(stage, 0) for run in current)
+        if before and after / before - 1 > tolerance:
+            print(f"   ⚠️ Этап {stage}: {after:.1f} с против {before:.1f} с ({after / before - 1:+.0%})")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Тренды и регрессии по журналу запусков parser_runs")
+    parser.add_argument('--days', type=int, default=14, help="За сколько дней показывать запуски")
+    parser.add_argument('--mode', choices=['cron', 'daemon', 'worker'], help="Только запуски этого режима")
+    parser.add_argument('--last', type=int, default=10, help="Сколько последних запусков показать")
+    parser.add_argument('--window', type=int, default=6, help="Запусков в окне сравнения")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Допустимое ухудшение медианы (доля)")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Код выхода 1 при регрессии")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        sys.exit(1)
+
+    since = datetime.now() - timedelta(days=args.days)
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        runs = load_runs(cursor, since, args.mode)
+        if not runs:
+            print(f"ℹ️ Нет запусков за {args.days} дней")
+            return
+
+        print_recent(runs, args.last)
+        print_daily(cursor, since, args.mode)
+        print_versions(runs)
+        regressions = find_regressions(runs, args.window, args.tolerance)
+    finally:
+        cursor.close()
+        conn.close()
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Приемники данных (sinks): одна загрузка монет - несколько форматов вывода.
+
+Каждая монета после загрузки свечей передается во все включенные приемники:
+JSON снимок и текстовый отчет (как у parser_ohlcv.py), БД с общей таблицей
+ohlc_data (init.sql) и БД с отдельными OHLC таблицами (parser_ohlcv_db.py).
+У каждого приемника своя очередь и поток, поэтому медленный приемник не
+задерживает загрузку. Ограничена только очередь БД с отдельными таблицами:
+она создает обратное давление, остальные очереди растут без ограничений.
+"""
+import queue
+import threading
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+import metrics
+import parser_ohlcv
+from log_config import get_logger
+
+log = get_logger('sinks')
+
+
+class Sink:
+    """Базовый приемник: получает монеты по одной и завершает работу в close()"""
+
+    name = 'sink'
+    # Ограниченная очередь - загрузка ждет, если приемник не успевает
+    bounded = False
+    # Только монеты со страницы листинга (без монет, добавленных из БД)
+    listing_only = False
+
+    def write(self, crypto):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CollectingSink(Sink):
+    """Приемник, которому нужен весь список монет запуска (файлы снимка и отчета)"""
+
+    listing_only = True
+
+    def __init__(self):
+        self.cryptos = []
+
+    def write(self, crypto):
+        self.cryptos.append(crypto)
+
+
+class JsonSnapshotSink(CollectingSink):
+    """JSON снимок last_50_cryptos.json и сжатая история logs/history"""
+
+    name = 'json'
+
+    def close(self):
+        parser_ohlcv.save_data(self.cryptos)
+
+
+class TextReportSink(CollectingSink):
+    """Текстовый отчет last_50_cryptos_report.txt"""
+
+    name = 'report'
+
+    def close(self):
+        parser_ohlcv.generate_report(self.cryptos)
+
+
+class SingleTableDbSink(Sink):
+    """БД со схемой init.sql: cryptocurrencies + общая таблица ohlc_data"""
+
+    name = 'single_db'
+
+    def __init__(self, db_config):
+        self.db_config = db_config
+        self.conn = None
+        self.saved_candles = 0
+
+    def write(self, crypto):
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(**self.db_config)
+
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("""
+                INSERT INTO cryptocurrencies
+                (name, symbol, chain, price, change_24h, market_cap, fdv, added_date, added_raw, coin_gecko_id)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (symbol, added_date) DO UPDATE SET
+                    price = EXCLUDED.price,
+                    change_24h = EXCLUDED.change_24h,
+                    market_cap = EXCLUDED.market_cap,
+                    fdv = EXCLUDED.fdv,
+                    coin_gecko_id = COALESCE(EXCLUDED.coin_gecko_id, cryptocurrencies.coin_gecko_id)
+                RETURNING id
+            """, (
+                crypto['name'], crypto['symbol'], crypto['chain'], crypto['price'],
+                crypto['change_24h'], crypto['market_cap'], crypto['fdv'],
+                crypto['added'], crypto['added_raw'], crypto.get('coin_id')
+            ))
+            crypto_id = cursor.fetchone()[0]
+
+            if crypto.get('ohlcv'):
+                # Один INSERT на все свечи: rowcount - вставленные строки без уже существующих
+                execute_values(cursor, """
+                    INSERT INTO ohlc_data (crypto_id, timestamp, datetime, date, time, open, high, low, close)
+                    VALUES %s
+                    ON CONFLICT (crypto_id, timestamp) DO NOTHING
+                """, [
+                    (crypto_id, candle['timestamp'], candle['datetime'], candle['date'], candle['time'],
+                     candle['open'], candle['high'], candle['low'], candle['close'])
+                    for candle in crypto['ohlcv']
+                ], page_size=len(crypto['ohlcv']))
+                self.saved_candles += cursor.rowcount
+
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def close(self):
+        if self.conn and not self.conn.closed:
+            self.conn.close()
+        log.info(f"💾 Общая таблица ohlc_data: новых свечей {self.saved_candles}")
+
+
+class SinkFanout:
+    """Раздает монеты всем приемникам; у каждого приемника свой поток и очередь"""
+
+    def __init__(self, sinks, bounded_queue_size=10):
+        self.sinks = sinks
+        self.queues = []
+        self.threads = []
+        self.errors = {sink.name: 0 for sink in sinks}
+        self.errors_lock = threading.Lock()
+
+        for sink in sinks:
+            sink_queue = queue.Queue(maxsize=bounded_queue_size if sink.bounded else 0)
+            thread = threading.Thread(target=self.run_sink, args=(sink, sink_queue),
+                                      name=f"sink-{sink.name}", daemon=True)
+            thread.start()
+            self.queues.append(sink_queue)
+            self.threads.append(thread)
+
+    def run_sink(self, sink, sink_queue):
+        """Поток приемника: пишет монеты, пока не придет None"""
+        while True:
+            crypto = sink_queue.get()
+            try:
+                if crypto is None:
+                    break
+                sink.write(crypto)
+            except Exception as e:
+                with self.errors_lock:
+                    self.errors[sink.name] += 1
+                metrics.inc('parser_sink_errors_total', sink=sink.name)
+                log.warning(f"⚠️ Приемник {sink.name}: ошибка записи {crypto['symbol']}: {e}")
+            finally:
+                sink_queue.task_done()
+
+        try:
+            sink.close()
+        except Exception as e:
+            log.error(f"❌ Приемник {sink.name}: ошибка завершения: {e}")
+
+    def publish(self, crypto):
+        """Передает копию монеты всем приемникам (ждет только ограниченные очереди)"""
+        for sink, sink_queue in zip(self.sinks, self.queues):
+            if sink.listing_only and crypto.get('tracked_only'):
+                continue
+            if sink_queue.full():
+                log.info(f"    ⏳ Очередь приемника {sink.name} заполнена ({sink_queue.maxsize}), ожидание...")
+            # Своя копия на приемник: запись в БД меняет added/coin_id (идентичность монеты),
+            # а остальные приемники читают монету в своих потоках
+            sink_queue.put(dict(crypto))
+
+    def close(self):
+        """Дожидается записи во все приемники и завершает их"""
+        started = datetime.now()
+        for sink_queue in self.queues:
+            sink_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+        with self.errors_lock:
+            failed = {name: count for name, count in self.errors.items() if count}
+        if failed:
+            log.warning(f"⚠️ Ошибки приемников: {failed}")
+        log.info(f"✅ Приемники завершены за {(datetime.now() - started).total_seconds():.1f} с")
@@ -0,0 +1,42 @@
+import math
+import os
+
+from candle_store import CandleReader, candle_path, store_candles
+from coin_identity import candle_key
+
+START_MS = 1_718_006_400_000
+INTERVAL_MS = 4 * 60 * 60 * 1000
+
+
+def candles(count):
+    return [{'timestamp': START_MS + index * INTERVAL_MS, 'open': 1.0, 'high': 2.0, 'low': 0.5,
+             'close': 1.0 + index, 'volume': None if index % 2 else 10.0} for index in range(count)]
+
+
+def test_append_only_new_candles_and_read_back(tmp_path):
+    directory = str(tmp_path)
+    assert store_candles(directory, 'AAA|2024-06-01', candles(3)) == 3
+    assert store_candles(directory, 'AAA|2024-06-01', candles(5)) == 2
+
+    reader = CandleReader(candle_path(directory, 'AAA|2024-06-01'))
+    try:
+        rows = list(reader.rows())
+        assert reader.key == 'AAA|2024-06-01'
+        assert [row[0] for row in rows] == [candle['timestamp'] for candle in candles(5)]
+        assert rows[0][5] == 10.0 and math.isnan(rows[1][5])
+        assert [row[0] for row in reader.rows(since_ms=START_MS + 3 * INTERVAL_MS)] == \
+            [START_MS + 3 * INTERVAL_MS, START_MS + 4 * INTERVAL_MS]
+    finally:
+        reader.close()
+
+
+def test_file_named_by_slug_not_added_date(tmp_path):
+    directory = str(tmp_path)
+    first = {'symbol': 'AAA', 'added': '2024-06-01', 'page_slug': 'aaa-token'}
+    drifted = dict(first, added='2024-06-02')
+    assert candle_key(first) == candle_key(drifted) == 'AAA|aaa-token'
+    assert candle_key({'symbol': 'AAA', 'added': '2024-06-01'}) == 'AAA|2024-06-01'
+
+    store_candles(directory, candle_key(first), candles(3))
+    assert store_candles(directory, candle_key(drifted), candles(4)) == 1
+    assert os.listdir(directory) == [os.path.basename(candle_path(directory, 'AAA|aaa-token'))]
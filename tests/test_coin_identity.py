@@ -0,0 +1,49 @@
+from datetime import date
+
+from coin_identity import match_identity, page_slug
+
+
+def row(id_, symbol, added, slug=None, coin_gecko_id=None):
+    return {'id': id_, 'symbol': symbol, 'added_date': added, 'page_slug': slug,
+            'coin_gecko_id': coin_gecko_id, 'ohlc_table_name': f'ohlc_{symbol.lower()}_{id_}'}
+
+
+def test_page_slug_from_link():
+    assert page_slug('<a href="/ru/coins/dog-wif-hat?x=1">WIF</a>') == 'dog-wif-hat'
+    assert page_slug('<span>WIF</span>') is None
+
+
+def test_match_by_slug_wins_over_symbol():
+    rows = [row(1, 'WIF', date(2024, 6, 1), 'other'), row(2, 'DOGWIF', date(2024, 5, 1), 'dog-wif-hat')]
+    crypto = {'symbol': 'WIF', 'added': '2024-06-01', 'page_slug': 'dog-wif-hat'}
+    assert match_identity(crypto, rows)['id'] == 2
+
+
+def test_match_by_coin_id_with_same_symbol():
+    rows = [row(1, 'PEPE', date(2024, 1, 1), coin_gecko_id='pepe')]
+    crypto = {'symbol': 'PEPE', 'added': '2024-06-01', 'coin_id': 'pepe'}
+    assert match_identity(crypto, rows)['id'] == 1
+
+
+def test_added_date_drift_within_tolerance():
+    rows = [row(1, 'ABC', date(2024, 6, 1)), row(2, 'ABC', date(2024, 5, 1))]
+    crypto = {'symbol': 'ABC', 'added': '2024-06-03'}
+    assert match_identity(crypto, rows, tolerance=2)['id'] == 1
+    assert match_identity({'symbol': 'ABC', 'added': '2024-06-04'}, rows, tolerance=2) is None
+
+
+def test_nearest_date_is_preferred():
+    rows = [row(1, 'ABC', date(2024, 6, 1)), row(2, 'ABC', date(2024, 6, 3))]
+    assert match_identity({'symbol': 'ABC', 'added': '2024-06-03'}, rows, tolerance=2)['id'] == 2
+
+
+def test_same_ticker_same_day_different_slug_is_a_new_coin():
+    rows = [row(1, 'ABC', date(2024, 6, 1), 'abc-one')]
+    crypto = {'symbol': 'ABC', 'added': '2024-06-01', 'page_slug': 'abc-two', 'coin_id': 'abc-two'}
+    assert match_identity(crypto, rows) is None
+
+
+def test_row_without_slug_matches_by_symbol_and_date():
+    rows = [row(1, 'ABC', date(2024, 6, 1))]
+    crypto = {'symbol': 'ABC', 'added': '2024-06-02', 'page_slug': 'abc-one'}
+    assert match_identity(crypto, rows)['id'] == 1
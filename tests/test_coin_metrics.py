@@ -0,0 +1,145 @@
+import math
+import random
+
+import pytest
+
+import coin_metrics
+from coin_metrics import CANDLE_INTERVAL_MS, compute_python
+
+START_MS = 1_718_006_400_000
+
+
+def coin(crypto_id, closes, gaps=()):
+    timestamps = []
+    timestamp = START_MS
+    for index in range(len(closes)):
+        timestamp += CANDLE_INTERVAL_MS * (2 if index in gaps else 1)
+        timestamps.append(timestamp)
+    return {'crypto_id': crypto_id, 'table': 't', 'timestamp': None, 'listing_high': max(closes) * 1.1,
+            'timestamps': timestamps, 'closes': list(closes)}
+
+
+def random_coins(count, seed=7):
+    rng = random.Random(seed)
+    coins = []
+    for crypto_id in range(count):
+        price = 1.0
+        closes = []
+        for _ in range(rng.randint(1, 60)):
+            price *= rng.uniform(0.9, 1.1)
+            closes.append(price)
+        gaps = {index for index in range(len(closes)) if rng.random() < 0.1}
+        coins.append(coin(crypto_id, closes, gaps))
+    return coins
+
+
+def test_returns_and_drawdown():
+    closes = [1.0 + 0.1 * index for index in range(43)]
+    result = compute_python([coin(1, closes)])[0]
+    assert result['return_4h'] == pytest.approx(closes[-1] / closes[-2] - 1)
+    assert result['return_24h'] == pytest.approx(closes[-1] / closes[-7] - 1)
+    assert result['return_7d'] == pytest.approx(closes[-1] / closes[0] - 1)
+    assert result['drawdown'] == pytest.approx(closes[-1] / (max(closes) * 1.1) - 1)
+
+
+def test_return_uses_candle_before_gap():
+    # Перед последней свечой пропуск в одну свечу: база - последняя свеча не позже (последняя - период)
+    closes = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0]
+    result = compute_python([coin(1, closes, gaps={7})])[0]
+    assert result['return_4h'] == pytest.approx(8.0 / 7.0 - 1)
+    assert result['return_24h'] == pytest.approx(8.0 / 3.0 - 1)
+
+
+def test_short_history_has_no_long_returns():
+    result = compute_python([coin(1, [1.0, 1.5])])[0]
+    assert result['return_4h'] == pytest.approx(0.5)
+    assert result['return_7d'] is None
+    assert result['volatility_7d'] is None
+
+
+def test_numpy_matches_python():
+    pytest.importorskip('numpy')
+    coins = random_coins(80)
+    for expected, actual in zip(compute_python(coins), coin_metrics.compute_numpy(coins)):
+        assert expected.keys() == actual.keys()
+        for name, value in expected.items():
+            if value is None:
+                assert actual[name] is None, name
+            else:
+                assert actual[name] == pytest.approx(value, rel=1e-9), name
+
+
+class FakeCursor:
+    """UNION ALL запрос load_new_candles по таблицам в памяти"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.rows = []
+
+    def mogrify(self, query, params):
+        return query.replace('%s', '{}').format(*params).encode('utf-8')
+
+    def execute(self, query, params=None):
+        self.rows = []
+        for part in query.replace(' ORDER BY 1, 2', '').split(' UNION ALL '):
+            crypto_id, after = int(part.split()[1].rstrip(',')), int(part.split('> ')[-1])
+            self.rows += [(crypto_id, timestamp, close * 1.01, close)
+                          for timestamp, close in self.tables[crypto_id] if timestamp > after]
+        self.rows.sort()
+
+    def fetchall(self):
+        return self.rows
+
+
+def state(coin_row):
+    return {'crypto_id': coin_row['crypto_id'], 'table': 't', 'timestamp': None, 'listing_high': None,
+            'timestamps': [], 'closes': []}
+
+
+def test_incremental_state_matches_full_read():
+    coins = random_coins(20, seed=3)
+    full = {item['crypto_id']: list(zip(item['timestamps'], item['closes'])) for item in coins}
+    head = {crypto_id: candles[:max(1, len(candles) - 4)] for crypto_id, candles in full.items()}
+
+    first = [state(item) for item in coins]
+    coin_metrics.load_new_candles(FakeCursor(head), first)
+    incremental = [dict(item, timestamp=item['timestamps'][-1], timestamps=list(item['timestamps']),
+                        closes=list(item['closes'])) for item in first]
+    coin_metrics.load_new_candles(FakeCursor(full), incremental)
+
+    fresh = [state(item) for item in coins]
+    coin_metrics.load_new_candles(FakeCursor(full), fresh)
+
+    for a, b in zip(incremental, fresh):
+        assert a['timestamps'] == b['timestamps']
+        assert a['closes'] == b['closes']
+        assert math.isclose(a['listing_high'], b['listing_high'])
+    assert compute_python(incremental) == compute_python(fresh)
+
+
+def test_zero_close_gives_null_metrics():
+    # Нулевая цена (API или округление DECIMAL(20,8)) не должна ронять проход метрик
+    closes = [0.0] + [1.0 + 0.1 * index for index in range(42)]
+    closes[-7] = 0.0
+    zero_base = coin(1, closes)
+    zero_high = dict(coin(2, [0.0, 0.0, 0.0]), listing_high=0.0)
+    zero_last = coin(3, [1.0, 2.0, 0.0])
+    results = compute_python([zero_base, zero_high, zero_last])
+
+    assert results[0]['return_7d'] is None
+    assert results[0]['return_24h'] is None
+    assert results[0]['return_4h'] == pytest.approx(closes[-1] / closes[-2] - 1)
+    assert results[0]['volatility_7d'] is not None
+    assert results[1]['drawdown'] is None
+    assert results[1]['return_4h'] is None
+    assert results[1]['volatility_7d'] is None
+    assert results[2]['return_4h'] == pytest.approx(-1.0)
+    assert results[2]['drawdown'] == pytest.approx(-1.0)
+
+    pytest.importorskip('numpy')
+    for expected, actual in zip(results, coin_metrics.compute_numpy([zero_base, zero_high, zero_last])):
+        for name, value in expected.items():
+            if value is None:
+                assert actual[name] is None, name
+            else:
+                assert actual[name] == pytest.approx(value, rel=1e-9), name
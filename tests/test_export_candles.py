@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+from export_candles import replaced_parts  # noqa: E402
+
+
+def touch(directory, name):
+    with open(os.path.join(directory, name), 'w') as f:
+        f.write('')
+
+
+def test_overlapping_parts_extend_the_range(tmp_path):
+    directory = str(tmp_path)
+    touch(directory, 'part-100-200.csv.gz')
+    touch(directory, 'part-201-300.parquet')
+    touch(directory, 'part-400-500.csv.gz')
+    touch(directory, 'export_state.json')
+
+    replaced, start_ms, end_ms = replaced_parts(directory, 150, 250)
+
+    assert sorted(os.path.basename(part[2]) for part in replaced) == \
+        ['part-100-200.csv.gz', 'part-201-300.parquet']
+    assert (start_ms, end_ms) == (100, 300)
+
+
+def test_disjoint_incremental_part_is_kept(tmp_path):
+    directory = str(tmp_path)
+    touch(directory, 'part-100-200.csv.gz')
+
+    assert replaced_parts(directory, 201, 300) == ([], 201, 300)
+    assert replaced_parts(os.path.join(directory, 'missing'), 1, 2) == ([], 1, 2)
@@ -0,0 +1,80 @@
+import history_store
+from history_store import HistoryStore, iter_records, iter_snapshots, load_candles, load_index, read_chunk
+
+HOUR_MS = 60 * 60 * 1000
+START_MS = 1_718_006_400_000
+
+
+def candles(count, start=0):
+    return [{'timestamp': START_MS + (start + index) * 4 * HOUR_MS, 'open': 1.0 + index, 'high': 2.0 + index,
+             'low': 0.5 + index, 'close': 1.5 + index} for index in range(count)]
+
+
+def crypto(symbol, price, ohlcv=None, added='2024-06-01', **extra):
+    return dict({'name': symbol.title(), 'symbol': symbol, 'price': price, 'added': added,
+                 'ohlcv': ohlcv or []}, **extra)
+
+
+def test_round_trip_listing_and_candles(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append([crypto('AAA', '$1', candles(3)), crypto('BBB', '$2')], 'test', '2024-06-01T00:00:00')
+    # Второй запуск: у AAA те же свечи и одна новая, BBB исчез, появился CCC
+    store.append([crypto('AAA', '$1.1', candles(4)), crypto('CCC', '$3')], 'test', '2024-06-01T04:00:00')
+
+    snapshots = list(iter_snapshots(iter_records(str(tmp_path))))
+    assert [at for at, _, _ in snapshots] == ['2024-06-01T00:00:00', '2024-06-01T04:00:00']
+    assert [coin['symbol'] for coin in snapshots[1][2]] == ['AAA', 'CCC']
+    assert snapshots[1][2][0]['price'] == '$1.1'
+
+    records = list(iter_records(str(tmp_path)))
+    candle_rows = [record for record in records if record['type'] == 'candles']
+    # Каждая свеча записана один раз
+    assert sum(len(record['candles']) for record in candle_rows) == 4
+
+    restored = load_candles(records, 'AAA|2024-06-01')
+    assert [candle['timestamp'] for candle in restored] == [candle['timestamp'] for candle in candles(4)]
+    assert restored[-1]['close'] == candles(4)[-1]['close']
+
+
+def test_index_points_to_chunks(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append([crypto('AAA', '$1', candles(2))], 'test', '2024-06-01T00:00:00')
+    store.append([crypto('AAA', '$1', candles(3))], 'test', '2024-06-01T04:00:00')
+
+    entries = load_index(str(tmp_path))
+    assert len(entries) == 2
+    second = read_chunk(str(tmp_path), entries[1])
+    assert [record['type'] for record in second] == ['snapshot', 'candles']
+    assert entries[1]['candles']['AAA|2024-06-01'] == [candles(3)[-1]['timestamp']] * 2
+
+
+def test_rotation_starts_with_full_snapshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_store, 'HISTORY_ROTATE_BYTES', 1)
+    store = HistoryStore(str(tmp_path))
+    store.append([crypto('AAA', '$1')], 'test', '2024-06-01T00:00:00')
+    store.state['segment'] = None
+    store.append([crypto('AAA', '$2')], 'test', '2024-06-01T04:00:00')
+
+    snapshots = [record for record in iter_records(str(tmp_path)) if record['type'] == 'snapshot']
+    assert snapshots[-1]['full'] is True
+
+
+def test_watermark_survives_added_date_drift(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append([crypto('AAA', '$1', candles(3), page_slug='aaa')], 'test', '2024-06-01T00:00:00')
+    # Дата добавления сдвинулась на день: уже записанные свечи не выгружаются повторно
+    store.append([crypto('AAA', '$1', candles(4), added='2024-06-02', page_slug='aaa')],
+                 'test', '2024-06-01T04:00:00')
+
+    candle_rows = [record for record in iter_records(str(tmp_path)) if record['type'] == 'candles']
+    assert [len(record['candles']) for record in candle_rows] == [3, 1]
+    assert store.state['watermarks'] == {'AAA|aaa': candles(4)[-1]['timestamp']}
+
+
+def test_legacy_watermark_is_picked_up(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.state['watermarks'] = {'AAA|2024-06-01': candles(3)[-1]['timestamp']}
+    store.append([crypto('AAA', '$1', candles(4), coin_id='aaa')], 'test', '2024-06-01T04:00:00')
+
+    candle_rows = [record for record in iter_records(str(tmp_path)) if record['type'] == 'candles']
+    assert [len(record['candles']) for record in candle_rows] == [1]
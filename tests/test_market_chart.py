@@ -0,0 +1,57 @@
+import pytest
+
+import market_chart
+from market_chart import CANDLE_INTERVAL_MS, bucket_end, bucket_market_chart, bucket_python
+
+HOUR_MS = 60 * 60 * 1000
+START_MS = 1_718_006_400_000  # граница 4-часовой свечи
+
+
+def hourly_chart(hours, start_ms=START_MS):
+    """Ответ /market_chart: почасовые цены и 24-часовые объемы"""
+    prices = [[start_ms + hour * HOUR_MS, 1.0 + hour * 0.01 + (hour % 3) * 0.005] for hour in range(1, hours + 1)]
+    volumes = [[timestamp, 1000.0 + index] for index, (timestamp, _) in enumerate(prices)]
+    return {'prices': prices, 'total_volumes': volumes}
+
+
+def test_bucket_end_is_close_time():
+    assert bucket_end(START_MS) == START_MS
+    assert bucket_end(START_MS + 1) == START_MS + CANDLE_INTERVAL_MS
+
+
+def test_candles_ohlc_and_volume():
+    data = hourly_chart(8)
+    candles = bucket_python(data['prices'], data['total_volumes'])
+    assert [candle[0] for candle in candles] == [START_MS + CANDLE_INTERVAL_MS, START_MS + 2 * CANDLE_INTERVAL_MS]
+    first = candles[0]
+    prices = [price for _, price in data['prices'][:4]]
+    assert first[1:5] == [prices[0], max(prices), min(prices), prices[-1]]
+    assert first[5] == pytest.approx(sum([1000.0, 1001.0, 1002.0, 1003.0]) / 4 * 4 / 24)
+
+
+def test_numpy_matches_python():
+    pytest.importorskip('numpy')
+    data = hourly_chart(24 * 7 + 3)
+    data['prices'][5][1] = None
+    expected = bucket_python(data['prices'], data['total_volumes'])
+    actual = market_chart.bucket_numpy(data['prices'], data['total_volumes'])
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert got == pytest.approx(want)
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_in_progress_bucket_is_dropped(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(market_chart, 'np', None)
+
+    # Последняя точка - "сейчас", посреди третьего интервала
+    now_ms = START_MS + 2 * CANDLE_INTERVAL_MS + 2 * HOUR_MS
+    data = hourly_chart(10)
+    data['prices'].append([now_ms, 2.0])
+    candles = bucket_market_chart(data, now_ms=now_ms)
+
+    assert all(candle[0] <= now_ms for candle in candles)
+    assert [candle[0] for candle in candles] == [START_MS + CANDLE_INTERVAL_MS, START_MS + 2 * CANDLE_INTERVAL_MS]
@@ -0,0 +1,50 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('psycopg2')
+
+import parser_daemon  # noqa: E402
+import parser_ohlcv_db as parser  # noqa: E402
+
+
+def listing_coin(symbol, price):
+    return {'name': symbol.title(), 'symbol': symbol, 'chain': 'Solana', 'price': price, 'change_24h': '1%',
+            'market_cap': '$1', 'fdv': '$1', 'added': '2024-06-01', 'added_raw': '3 дня',
+            'page_slug': symbol.lower()}
+
+
+def test_poll_enqueues_only_new_and_changed_coins(monkeypatch):
+    pages = [[listing_coin('AAA', '$1'), listing_coin('BBB', '$2')],
+             [listing_coin('AAA', '$1'), listing_coin('BBB', '$2.5'), listing_coin('CCC', '$3')]]
+    enqueued = []
+    monkeypatch.setattr(parser, 'fetch_page', lambda: '<html>')
+    monkeypatch.setattr(parser, 'parse_html_limited', lambda html, limit: pages.pop(0))
+    monkeypatch.setattr(parser, 'enqueue_for_write', lambda queue, crypto: enqueued.append(crypto['symbol']))
+
+    known_coins = {}
+    parser_daemon.poll_listing(None, known_coins)
+    parser_daemon.poll_listing(None, known_coins)
+
+    assert enqueued == ['AAA', 'BBB', 'BBB', 'CCC']
+
+
+def test_rate_limit_wait_is_interrupted_by_stop(monkeypatch):
+    monkeypatch.setattr(parser, 'STOP_EVENT', threading.Event())
+    threading.Timer(0.05, parser.STOP_EVENT.set).start()
+
+    started = time.perf_counter()
+    assert parser.wait_before_retry(30) is False
+    assert time.perf_counter() - started < 5
+
+
+def test_failed_refresh_drops_last_cycle_candles(monkeypatch):
+    crypto = dict(listing_coin('AAA', '$1'), added='2024-06-01', coin_id='aaa',
+                  ohlcv=[{'timestamp': 1}], refresh_outcome='ok')
+    monkeypatch.setattr(parser, 'API_DELAY', 0)
+    monkeypatch.setattr(parser, 'fetch_candles', lambda coin_id, days: [])
+
+    assert parser.fetch_crypto_ohlcv(crypto) is False
+    assert 'ohlcv' not in crypto
+    assert crypto['refresh_outcome'] == parser.classify_ohlcv([])
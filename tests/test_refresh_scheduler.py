@@ -0,0 +1,59 @@
+from datetime import datetime
+
+import refresh_scheduler
+from refresh_scheduler import CANDLE_INTERVAL_SECONDS, is_due, next_due_after_success
+
+BOUNDARY = 1_718_006_400  # граница 4-часовой свечи (кратна 4 часам)
+
+
+class FakeCursor:
+    """Курсор для record_refresh_outcome: состояния еще нет, INSERT запоминается"""
+
+    def __init__(self):
+        self.saved = None
+
+    def execute(self, query, params=None):
+        if 'INSERT INTO coin_refresh_state' in query:
+            self.saved = params
+
+    def fetchone(self):
+        return None
+
+
+def frozen_datetime(timestamp):
+    class Frozen(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(timestamp)
+    return Frozen
+
+
+def test_next_due_after_success_is_before_next_boundary():
+    due = next_due_after_success(BOUNDARY + 300)
+    assert due == BOUNDARY + CANDLE_INTERVAL_SECONDS - refresh_scheduler.DUE_TOLERANCE_SECONDS
+
+
+def test_next_due_right_before_boundary_is_the_boundary():
+    now = BOUNDARY + CANDLE_INTERVAL_SECONDS - 60
+    assert next_due_after_success(now) == BOUNDARY + CANDLE_INTERVAL_SECONDS
+
+
+def test_two_consecutive_cron_starts_refresh_the_coin_each_time(monkeypatch):
+    # Первый запуск cron в 00:00:30, монета загружена в 00:05
+    fetched_at = BOUNDARY + 300
+    monkeypatch.setattr(refresh_scheduler, 'datetime', frozen_datetime(fetched_at))
+    cursor = FakeCursor()
+    refresh_scheduler.record_refresh_outcome(cursor, 1, '2024-06-01', 'ok', [])
+    state = {'next_due_at': cursor.saved[1]}
+
+    # В том же запуске монета уже не нужна
+    assert not is_due(state, datetime.fromtimestamp(BOUNDARY + 600))
+    # Следующий запуск cron в 04:00:30 снова ее обновляет
+    assert is_due(state, datetime.fromtimestamp(BOUNDARY + CANDLE_INTERVAL_SECONDS + 30))
+
+
+def test_failed_fetch_backs_off(monkeypatch):
+    monkeypatch.setattr(refresh_scheduler, 'datetime', frozen_datetime(BOUNDARY + 300))
+    cursor = FakeCursor()
+    refresh_scheduler.record_refresh_outcome(cursor, 1, '2024-06-01', 'failed', [])
+    assert cursor.saved[1] == datetime.fromtimestamp(BOUNDARY + 300 + CANDLE_INTERVAL_SECONDS)
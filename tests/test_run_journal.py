@@ -0,0 +1,21 @@
+from coin_identity import candle_key
+from run_journal import RunJournal
+
+
+def test_resume_survives_added_date_drift(tmp_path):
+    path = str(tmp_path / 'run_journal.jsonl')
+    crypto = {'symbol': 'AAA', 'added': '2024-06-01', 'page_slug': 'aaa', 'coin_id': 'aaa-token',
+              'ohlcv': [{'timestamp': 1, 'open': 1.0, 'high': 2.0, 'low': 0.5, 'close': 1.5}]}
+
+    journal = RunJournal(path)
+    journal.start()
+    journal.id_resolved(crypto, 'aaa-token')
+    journal.fetched(crypto)
+    journal.file.close()
+
+    # Запуск оборвался; при продолжении дата добавления монеты сдвинулась на день
+    drifted = dict(crypto, added='2024-06-02')
+    resumed = RunJournal(path).start()
+    progress = resumed[candle_key(drifted)]
+    assert progress['coin_id'] == 'aaa-token'
+    assert progress['candles'] == [[1, 1.0, 2.0, 0.5, 1.5]]